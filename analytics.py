@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Historical cash up analytics backed by incrementally maintained rollups
+
+Every saved cash up adds its figures to one row per day, ISO week, month, year
+and weekday. Re-saving a day subtracts its previous contribution first, so
+dashboard queries read a handful of pre-aggregated rows however large the
+archive grows. AnomalyDetector keeps running statistics of the over/short
+figures in the same way and flags outliers while a cash up is calculated.
+"""
+import json
+import math
+import sqlite3
+import sys
+import threading
+from datetime import date as date_cls, datetime
+from typing import List, Dict, Any, Optional
+
+from cash_up_core import to_pence, to_pounds
+from config import Config
+from database import connect, sqlite_path_from_url
+
+PERIODS = ('day', 'week', 'month', 'year', 'weekday')
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Figures summed into every rollup row, all in pence
+MEASURES = ('expected_takings', 'total_in_till', 'total_receipts', 'total_additional_cash',
+            'difference', 'amount_to_remove')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS rollup_days (
+    date TEXT PRIMARY KEY,
+    {', '.join(f'{measure} INTEGER NOT NULL' for measure in MEASURES)}
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    period_key TEXT NOT NULL,
+    days INTEGER NOT NULL DEFAULT 0,
+    over_days INTEGER NOT NULL DEFAULT 0,
+    short_days INTEGER NOT NULL DEFAULT 0,
+    exact_days INTEGER NOT NULL DEFAULT 0,
+    {', '.join(f'{measure} INTEGER NOT NULL DEFAULT 0' for measure in MEASURES)},
+    PRIMARY KEY (period, period_key)
+);
+"""
+
+_UPSERT = f"""
+INSERT INTO rollups (period, period_key, days, over_days, short_days, exact_days, {', '.join(MEASURES)})
+VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' for _ in MEASURES)})
+ON CONFLICT (period, period_key) DO UPDATE SET
+    days = days + excluded.days,
+    over_days = over_days + excluded.over_days,
+    short_days = short_days + excluded.short_days,
+    exact_days = exact_days + excluded.exact_days,
+    {', '.join(f'{measure} = {measure} + excluded.{measure}' for measure in MEASURES)}
+"""
+
+def period_keys(day: date_cls) -> Dict[str, str]:
+    """The rollup row keys a given day contributes to"""
+    iso_year, iso_week, iso_weekday = day.isocalendar()
+    return {
+        'day': day.isoformat(),
+        'week': f"{iso_year:04d}-W{iso_week:02d}",
+        'month': f"{day.year:04d}-{day.month:02d}",
+        'year': f"{day.year:04d}",
+        'weekday': str(iso_weekday - 1)
+    }
+
+class RollupStore:
+    """Day/week/month/year/weekday rollups kept current one save at a time"""
+
+    def __init__(self, database_url: str = None, conn: sqlite3.Connection = None):
+        self.db_path = sqlite_path_from_url(database_url or Config.DATABASE_URL)
+        self.conn = conn or connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+        # Saves arrive from the writer thread while requests read
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+    
+    def reconnect(self):
+        """Open a fresh connection, e.g. in a forked server worker"""
+        self.conn = connect(self.db_path)
+
+    def record_day(self, day_date: str, figures: Dict[str, int]):
+        """Add (or replace) one day's figures, given in pence, in every rollup"""
+        with self._lock, self.conn:
+            self._record_day(day_date, figures)
+
+    def _record_day(self, day_date: str, figures: Dict[str, int]):
+        # Runs inside the caller's transaction
+        keys = period_keys(datetime.strptime(day_date, '%Y-%m-%d').date())
+        new = tuple(int(figures.get(measure, 0)) for measure in MEASURES)
+        row = self.conn.execute(f"SELECT {', '.join(MEASURES)} FROM rollup_days WHERE date = ?",
+                                (day_date,)).fetchone()
+        if row is not None:
+            self._apply(keys, tuple(row), -1)
+        self._apply(keys, new, 1)
+        self.conn.execute(f"INSERT OR REPLACE INTO rollup_days (date, {', '.join(MEASURES)}) "
+                          f"VALUES (?, {', '.join('?' for _ in MEASURES)})", (day_date,) + new)
+
+    def _apply(self, keys: Dict[str, str], values: tuple, sign: int):
+        difference = values[MEASURES.index('difference')]
+        flags = (sign, sign * (difference > 0), sign * (difference < 0), sign * (difference == 0))
+        self.conn.executemany(_UPSERT, [(period, key) + flags + tuple(sign * value for value in values)
+                                        for period, key in keys.items()])
+
+    def record_analysis(self, date_input: str, analysis: Dict[str, Any]):
+        """Record a CashUpCalculator.calculate_float_analysis result for a DD/MM/YYYY date"""
+        day_date = datetime.strptime(date_input, '%d/%m/%Y').strftime('%Y-%m-%d')
+        self.record_day(day_date, {measure: analysis['pence'][measure] for measure in MEASURES})
+
+    @staticmethod
+    def _report_figures(report) -> Dict[str, int]:
+        return {
+            'expected_takings': to_pence(report.expected_takings or 0),
+            'total_in_till': to_pence(report.total_in_till or 0),
+            'total_receipts': to_pence(report.total_receipts),
+            'total_additional_cash': to_pence(report.total_additional_cash),
+            'difference': to_pence(report.difference),
+            'amount_to_remove': to_pence(report.amount_to_remove or 0)
+        }
+
+    def record_parsed_report(self, report):
+        """Record a report_parser.ParsedReport"""
+        self.record_day(report.date, self._report_figures(report))
+
+    def rebuild(self, reports) -> int:
+        """Drop all rollups and rebuild them from an iterable of ParsedReports"""
+        return self.rebuild_days((report.date, self._report_figures(report)) for report in reports)
+
+    def rebuild_days(self, days) -> int:
+        """rebuild() from (YYYY-MM-DD, figures in pence) pairs, e.g. read from the record log
+        
+        The delete and the replay are one transaction: readers keep seeing the old
+        rollups until the new ones are complete, and a failed rebuild changes nothing.
+        """
+        count = 0
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM rollups")
+            self.conn.execute("DELETE FROM rollup_days")
+            for day_date, figures in days:
+                self._record_day(day_date, figures)
+                count += 1
+        return count
+
+    def query(self, period: str, start: str = None, end: str = None) -> List[Dict[str, Any]]:
+        """Rollup rows for a period type, optionally limited to a key range, in pounds"""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}', expected one of: {', '.join(PERIODS)}")
+        sql = "SELECT * FROM rollups WHERE period = ? AND days > 0"
+        params = [period]
+        if start:
+            sql += " AND period_key >= ?"
+            params.append(start)
+        if end:
+            sql += " AND period_key <= ?"
+            params.append(end)
+        sql += " ORDER BY period_key"
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def get(self, period: str, period_key: str) -> Optional[Dict[str, Any]]:
+        """A single rollup row, e.g. get('month', '2025-09')"""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM rollups WHERE period = ? AND period_key = ? AND days > 0",
+                                    (period, period_key)).fetchone()
+        return self._row_to_dict(row) if row is not None else None
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict[str, Any]:
+        result = {
+            'period': row['period'],
+            'key': row['period_key'],
+            'days': row['days'],
+            'over_days': row['over_days'],
+            'short_days': row['short_days'],
+            'exact_days': row['exact_days']
+        }
+        for measure in MEASURES:
+            result[measure] = to_pounds(row[measure])
+        result['average_takings'] = to_pounds(row['expected_takings'] // row['days']) if row['days'] else 0.0
+        result['average_difference'] = round(row['difference'] / row['days'] / 100, 2) if row['days'] else 0.0
+        if row['period'] == 'weekday':
+            result['label'] = WEEKDAYS[int(row['period_key'])]
+        return result
+
+# Figures watched for outliers, in pence
+ANOMALY_MEASURES = ('difference', 'amount_to_remove')
+
+ANOMALY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    measure TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    samples INTEGER NOT NULL DEFAULT 0,
+    ewma_mean REAL NOT NULL DEFAULT 0,
+    ewma_var REAL NOT NULL DEFAULT 0,
+    last_date TEXT,
+    recent TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (measure, scope)
+);
+"""
+
+def _money(pence: float) -> str:
+    return f"{'-' if pence < 0 else ''}£{abs(to_pounds(round(pence))):.2f}"
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+class AnomalyDetector:
+    """Flags unusual over/short results as they are calculated
+    
+    Keeps, per measure, an exponentially weighted mean and variance over every
+    day (scope 'all') and the last Config.ANOMALY_WINDOW values for each
+    weekday (scopes '0'-'6') for a median/MAD check. Each saved report updates
+    two small rows, so the cost per save stays constant as history grows.
+    """
+
+    def __init__(self, database_url: str = None, window: int = None, alpha: float = None,
+                 threshold: float = None, min_samples: int = None, min_spread: float = None,
+                 conn: sqlite3.Connection = None):
+        self.db_path = sqlite_path_from_url(database_url or Config.DATABASE_URL)
+        self.window = window or Config.ANOMALY_WINDOW
+        self.alpha = alpha or Config.ANOMALY_EWMA_ALPHA
+        self.threshold = threshold or Config.ANOMALY_THRESHOLD
+        self.min_samples = min_samples or Config.ANOMALY_MIN_SAMPLES
+        self.min_spread_pence = to_pence(min_spread or Config.ANOMALY_MIN_SPREAD)
+        self._lock = threading.Lock()
+        if conn is None:
+            self.reconnect()
+        else:
+            self.conn = conn
+        self.conn.executescript(ANOMALY_SCHEMA)
+
+    def reconnect(self):
+        """Open a fresh connection, e.g. in a forked server worker"""
+        self.conn = connect(self.db_path)
+
+    def close(self):
+        self.conn.close()
+
+    def _state(self, measure: str, scope: str) -> Dict[str, Any]:
+        row = self.conn.execute("SELECT * FROM anomaly_state WHERE measure = ? AND scope = ?",
+                                (measure, scope)).fetchone()
+        if row is None:
+            return {'samples': 0, 'ewma_mean': 0.0, 'ewma_var': 0.0, 'last_date': None, 'recent': []}
+        state = dict(row)
+        state['recent'] = json.loads(state['recent'])
+        return state
+
+    def _store(self, measure: str, scope: str, state: Dict[str, Any]):
+        self.conn.execute("""
+            INSERT OR REPLACE INTO anomaly_state (measure, scope, samples, ewma_mean, ewma_var, last_date, recent)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (measure, scope, state['samples'], state['ewma_mean'], state['ewma_var'], state['last_date'],
+              json.dumps(state['recent'])))
+
+    def observe(self, day_date: str, figures: Dict[str, int]):
+        """Fold one saved day's figures (pence) into the running statistics"""
+        with self._lock, self.conn:
+            self._observe(day_date, figures)
+
+    def _observe(self, day_date: str, figures: Dict[str, int]):
+        # Runs inside the caller's transaction
+        weekday = str(datetime.strptime(day_date, '%Y-%m-%d').weekday())
+        for measure in ANOMALY_MEASURES:
+            value = int(figures[measure])
+            overall = self._state(measure, 'all')
+            # The EWMA only moves forward in time; re-saving a day must not count it twice
+            if overall['last_date'] is None or day_date > overall['last_date']:
+                if overall['samples'] == 0:
+                    overall['ewma_mean'], overall['ewma_var'] = float(value), 0.0
+                else:
+                    delta = value - overall['ewma_mean']
+                    increment = self.alpha * delta
+                    overall['ewma_mean'] += increment
+                    overall['ewma_var'] = (1 - self.alpha) * (overall['ewma_var'] + delta * increment)
+                overall['samples'] += 1
+                overall['last_date'] = day_date
+                self._store(measure, 'all', overall)
+
+            daily = self._state(measure, weekday)
+            recent = [entry for entry in daily['recent'] if entry[0] != day_date]
+            recent.append([day_date, value])
+            recent.sort()
+            daily['recent'] = recent[-self.window:]
+            daily['samples'] = len(daily['recent'])
+            self._store(measure, weekday, daily)
+
+    def observe_analysis(self, date_input: str, analysis: Dict[str, Any]):
+        """observe() for a calculate_float_analysis result and a DD/MM/YYYY date"""
+        day_date = datetime.strptime(date_input, '%d/%m/%Y').strftime('%Y-%m-%d')
+        self.observe(day_date, analysis['pence'])
+
+    def rebuild(self, reports) -> int:
+        """Drop the statistics and replay an iterable of ParsedReports in date order"""
+        return self.rebuild_days((report.date, {
+            'difference': to_pence(report.difference),
+            'amount_to_remove': to_pence(report.amount_to_remove or 0)
+        }) for report in reports)
+
+    def rebuild_days(self, days) -> int:
+        """rebuild() from (YYYY-MM-DD, figures in pence) pairs"""
+        days = sorted(days, key=lambda day: day[0])
+        # One transaction, as in RollupStore.rebuild_days
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM anomaly_state")
+            for day_date, figures in days:
+                self._observe(day_date, figures)
+        return len(days)
+
+    def check(self, date_input: str, analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Outliers in a calculate_float_analysis result, as human-readable flags"""
+        day = datetime.strptime(date_input, '%d/%m/%Y').date()
+        day_date, weekday = day.isoformat(), day.weekday()
+        flags = []
+        with self._lock:
+            for measure in ANOMALY_MEASURES:
+                value = analysis['pence'][measure]
+                label = measure.replace('_', ' ').capitalize()
+
+                # Same weekday: median and MAD of recent values, ignoring this date if already saved
+                recent = [v for d, v in self._state(measure, str(weekday))['recent'] if d != day_date]
+                if len(recent) >= self.min_samples:
+                    median = _median(recent)
+                    spread = max(1.4826 * _median([abs(v - median) for v in recent]), self.min_spread_pence)
+                    score = (value - median) / spread
+                    if abs(score) > self.threshold:
+                        flags.append({
+                            'measure': measure,
+                            'method': 'weekday_median',
+                            'value': to_pounds(value),
+                            'typical': to_pounds(round(median)),
+                            'spread': to_pounds(round(spread)),
+                            'score': round(score, 2),
+                            'message': f"{label} of {_money(value)} is unusual for a {WEEKDAYS[weekday]} "
+                                       f"(typically {_money(median)} ± {_money(spread)})"
+                        })
+                        continue
+
+                # Recent trend across all days
+                overall = self._state(measure, 'all')
+                if overall['samples'] >= self.min_samples:
+                    spread = max(math.sqrt(overall['ewma_var']), self.min_spread_pence)
+                    score = (value - overall['ewma_mean']) / spread
+                    if abs(score) > self.threshold:
+                        typical = round(overall['ewma_mean'])
+                        flags.append({
+                            'measure': measure,
+                            'method': 'ewma',
+                            'value': to_pounds(value),
+                            'typical': to_pounds(typical),
+                            'spread': to_pounds(round(spread)),
+                            'score': round(score, 2),
+                            'message': f"{label} of {_money(value)} is far from the recent average "
+                                       f"of {_money(typical)} (± {_money(spread)})"
+                        })
+        return flags
+
+def rebuild_all(store: RollupStore, detector: AnomalyDetector, days) -> int:
+    """Rebuild the rollups and the anomaly statistics from one pass over (YYYY-MM-DD, figures in pence)
+
+    The two must share a connection (AnomalyDetector(conn=store.conn)) so both
+    tables are replaced in a single transaction and always agree.
+    """
+    if detector.conn is not store.conn:
+        raise ValueError("rebuild_all needs the detector to share the rollup store's connection")
+    days = sorted(days, key=lambda day: day[0])
+    with store._lock, detector._lock, store.conn:
+        store.conn.execute("DELETE FROM rollups")
+        store.conn.execute("DELETE FROM rollup_days")
+        store.conn.execute("DELETE FROM anomaly_state")
+        for day_date, figures in days:
+            store._record_day(day_date, figures)
+            detector._observe(day_date, figures)
+    return len(days)
+
+def main(argv=None):
+    import argparse
+    from report_parser import iter_reports
+
+    parser = argparse.ArgumentParser(description="Cash up analytics rollups")
+    parser.add_argument('--reports-dir', default=Config.REPORTS_DIR)
+    parser.add_argument('--database-url', default=Config.DATABASE_URL)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help="Rebuild every rollup and the anomaly statistics from the saved reports")
+    rebuild_parser.add_argument('--from-log', action='store_true',
+                                help="Read the binary record log instead of parsing the text reports")
+    show_parser = subparsers.add_parser('show', help="Print rollups for a period type")
+    show_parser.add_argument('period', choices=PERIODS)
+    args = parser.parse_args(argv)
+
+    store = RollupStore(args.database_url)
+    try:
+        if args.command == 'rebuild':
+            if args.from_log:
+                from record_log import RecordLog
+                days = ((record.date, record.figures) for record in RecordLog().iter_days())
+                source = "logged days"
+            else:
+                days = ((report.date, RollupStore._report_figures(report))
+                        for report in iter_reports(args.reports_dir))
+                source = "reports"
+            count = rebuild_all(store, AnomalyDetector(args.database_url, conn=store.conn), days)
+            print(f"Rebuilt rollups and anomaly statistics from {count} {source}")
+        elif args.command == 'show':
+            for row in store.query(args.period):
+                label = row.get('label', row['key'])
+                print(f"{label}: {row['days']} days, takings £{row['expected_takings']:.2f}, "
+                      f"over/short £{row['difference']:+.2f} "
+                      f"({row['over_days']} over, {row['short_days']} short, {row['exact_days']} exact)")
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
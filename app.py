@@ -4,17 +4,70 @@ Flask web application for Cash Up
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
 from datetime import datetime
 import os
-from cash_up_core import CashUpCalculator, ReportGenerator
+import metrics
+import profiling
+from analytics import PERIODS, AnomalyDetector, RollupStore
+from cash_up_core import CashUpCalculator, ReportGenerator, parse_till_payload, to_pence
 from config import Config
+from database import CashUpRepository, ConnectionPool
+from input_journal import InputJournal, has_input
+from pos_import import PosTakings
+from record_log import RecordLog
+from report_index import ReportIndex
+from report_search import SearchError, search
+from report_writer import ReportWriter
+from result_cache import ResultCache, make_key, normalise_inputs
 
 app = Flask(__name__)
 app.config.from_object(Config)
+metrics.init_app(app)
+profiling.instrument_core(CashUpCalculator, ReportGenerator)
+profiling.init_app(app)
 
 # Initialize core components
 calculator = CashUpCalculator({
     'DEFAULT_FLOAT': Config.DEFAULT_FLOAT
 })
 report_generator = ReportGenerator(Config.REPORTS_DIR)
+rollup_store = RollupStore(Config.DATABASE_URL)
+anomaly_detector = AnomalyDetector(Config.DATABASE_URL)
+pos_takings = PosTakings(Config.DATABASE_URL)
+report_index = ReportIndex(Config.REPORTS_DIR, Config.DATABASE_URL)
+report_index_scanned = False
+record_log = RecordLog(Config.RECORD_LOG_DIR, fsync=Config.REPORT_FSYNC)
+cash_up_repository = CashUpRepository(ConnectionPool(Config.DATABASE_URL))
+# Save job id -> browser journal to drop once that report is on disk
+saved_journals = {}
+
+def record_save_latency(job):
+    """Time a background save's queue wait and write, whatever its outcome"""
+    metrics.phase_latency.observe(job.started_at - job.submitted_at, phase='write_queue_wait', outcome=job.state)
+    metrics.phase_latency.observe(job.finished_at - job.started_at, phase='write', outcome=job.state)
+
+def record_saved_report(job):
+    """Fold a newly saved report into the database, record log, analytics rollups and search index"""
+    if job.analysis is not None:
+        if job.inputs is not None:
+            cash_up_repository.save_analysis(job.date_input, analysis=job.analysis, report_path=job.path,
+                                             source='web', version=job.version, **job.inputs)
+            record_log.append_analysis(job.date_input, analysis=job.analysis, **job.inputs)
+        rollup_store.record_analysis(job.date_input, job.analysis)
+        anomaly_detector.observe_analysis(job.date_input, job.analysis)
+    report_index.index_file(job.path)
+    journal_id = saved_journals.pop(job.id, None)
+    if journal_id:
+        web_journal(journal_id).clear()
+
+def web_journal(journal_id):
+    """Input journal for one browser, named by the id the page keeps in localStorage"""
+    return InputJournal(f"web-{journal_id}")
+
+report_writer = ReportWriter(report_generator, workers=Config.REPORT_WRITER_WORKERS,
+                             max_queue=Config.REPORT_WRITER_QUEUE_SIZE, fsync=Config.REPORT_FSYNC,
+                             on_saved=record_saved_report, status_dir=Config.REPORT_STATUS_DIR,
+                             status_ttl=Config.REPORT_STATUS_TTL, on_finished=record_save_latency)
+result_cache = ResultCache(Config.RESULT_CACHE_SIZE, Config.RESULT_CACHE_TTL)
+metrics.register_cache('result', result_cache)
 
 @app.route('/')
 def index():
@@ -24,59 +77,102 @@ def index():
                          denominations=calculator.denominations,
                          values=calculator.values,
                          default_float=calculator.default_float,
-                         today_date=today_date)
+                         today_date=today_date,
+                         save_job=request.args.get('save_job'))
+
+def parse_cash_up_form(form):
+    """Read the cash up inputs from a submitted form"""
+    date_input = form.get('date')
+    
+    # Convert date from YYYY-MM-DD to DD/MM/YYYY if needed
+    if '-' in date_input:
+        try:
+            date_obj = datetime.strptime(date_input, '%Y-%m-%d')
+            date_input = date_obj.strftime('%d/%m/%Y')
+        except ValueError:
+            pass  # Keep original format if conversion fails
+    
+    cash_counts = [int(form.get(f'count_{i}', 0)) for i in range(len(calculator.denominations))]
+    receipt_amounts = [float(amount) for amount in form.getlist('receipt_amounts') if amount.strip()]
+    expected_takings = float(form.get('expected_takings', 0))
+    
+    # Parse additional cash entries
+    additional_cash_entries = []
+    additional_titles = form.getlist('additional_cash_titles')
+    additional_amounts = form.getlist('additional_cash_amounts')
+    
+    for title, amount in zip(additional_titles, additional_amounts):
+        if title.strip() and amount.strip():
+            try:
+                additional_cash_entries.append({
+                    'title': title.strip(),
+                    'amount': float(amount)
+                })
+            except ValueError:
+                pass  # Skip invalid entries
+    
+    return date_input, cash_counts, receipt_amounts, additional_cash_entries, expected_takings
+
+def calculate_form(form):
+    """Parse and calculate a submitted cash up, reusing a cached result when the inputs match"""
+    with metrics.phase('parse'):
+        date_input, cash_counts, receipt_amounts, additional_cash_entries, expected_takings = parse_cash_up_form(form)
+        pos_expected = pos_takings.takings_for_input(date_input)
+        inputs = normalise_inputs(date_input, cash_counts, receipt_amounts, additional_cash_entries,
+                                  expected_takings, calculator.default_float)
+        # A later POS import changes the cross-check, so it is part of the key
+        inputs['pos_takings'] = to_pence(pos_expected) if pos_expected is not None else None
+        token = make_key(inputs)
+    result = result_cache.get(token)
+    if result is None:
+        with metrics.phase('calculate'):
+            analysis = calculator.calculate_float_analysis(cash_counts, receipt_amounts, 
+                                                         additional_cash_entries, expected_takings,
+                                                         pos_takings=pos_expected)
+            bagging = calculator.generate_bagging_instructions(analysis, cash_counts)
+        result = {
+            'token': token,
+            'date': date_input,
+            'cash_counts': cash_counts,
+            'receipt_amounts': receipt_amounts,
+            'additional_cash_entries': additional_cash_entries,
+            'expected_takings': expected_takings,
+            'analysis': analysis,
+            'bagging': bagging
+        }
+        result_cache.put(token, result)
+    return result
 
 @app.route('/calculate', methods=['POST'])
 def calculate():
     """Calculate cash up results"""
     try:
-        # Get form data
-        date_input = request.form.get('date')
-        
-        # Convert date from YYYY-MM-DD to DD/MM/YYYY if needed
-        if '-' in date_input:
-            try:
-                date_obj = datetime.strptime(date_input, '%Y-%m-%d')
-                date_input = date_obj.strftime('%d/%m/%Y')
-            except ValueError:
-                pass  # Keep original format if conversion fails
-        
-        cash_counts = [int(request.form.get(f'count_{i}', 0)) for i in range(len(calculator.denominations))]
-        receipt_amounts = [float(amount) for amount in request.form.getlist('receipt_amounts') if amount.strip()]
-        expected_takings = float(request.form.get('expected_takings', 0))
-        
-        # Parse additional cash entries
-        additional_cash_entries = []
-        additional_titles = request.form.getlist('additional_cash_titles')
-        additional_amounts = request.form.getlist('additional_cash_amounts')
-        
-        for title, amount in zip(additional_titles, additional_amounts):
-            if title.strip() and amount.strip():
-                try:
-                    additional_cash_entries.append({
-                        'title': title.strip(),
-                        'amount': float(amount)
-                    })
-                except ValueError:
-                    pass  # Skip invalid entries
-        
-        # Calculate analysis
-        analysis = calculator.calculate_float_analysis(cash_counts, receipt_amounts, 
-                                                     additional_cash_entries, expected_takings)
-        bagging = calculator.generate_bagging_instructions(analysis, cash_counts)
+        result = calculate_form(request.form)
+        try:
+            anomalies = anomaly_detector.check(result['date'], result['analysis'])
+        except Exception as e:
+            # Alerts are advisory; never let them block a cash up
+            metrics.record_error('/calculate', 'anomaly_check')
+            print(f"Anomaly check error: {e}")
+            anomalies = []
         
         return render_template('results.html',
-                             date=date_input,
+                             date=result['date'],
                              denominations=calculator.denominations,
                              values=calculator.values,
-                             cash_counts=cash_counts,
-                             receipt_amounts=receipt_amounts,
-                             additional_cash_entries=additional_cash_entries,
-                             expected_takings=expected_takings,
-                             analysis=analysis,
-                             bagging=bagging)
+                             cash_counts=result['cash_counts'],
+                             receipt_amounts=result['receipt_amounts'],
+                             additional_cash_entries=result['additional_cash_entries'],
+                             expected_takings=result['expected_takings'],
+                             analysis=result['analysis'],
+                             bagging=result['bagging'],
+                             anomalies=anomalies,
+                             result_token=result['token'],
+                             report_version=report_generator.report_version(result['date']),
+                             journal_id=request.form.get('journal_id', ''))
     
     except Exception as e:
+        metrics.record_error('/calculate')
         flash(f'Error in calculation: {str(e)}', 'error')
         return redirect(url_for('index'))
 
@@ -84,72 +180,193 @@ def calculate():
 def save_report():
     """Save report to file"""
     try:
-        date_input = request.form.get('date')
-        
-        # Convert date from YYYY-MM-DD to DD/MM/YYYY if needed
-        if '-' in date_input:
-            try:
-                from datetime import datetime
-                date_obj = datetime.strptime(date_input, '%Y-%m-%d')
-                date_input = date_obj.strftime('%d/%m/%Y')
-            except ValueError:
-                pass  # Keep original format if conversion fails
-        
-        cash_counts = [int(request.form.get(f'count_{i}', 0)) for i in range(len(calculator.denominations))]
-        receipt_amounts = [float(amount) for amount in request.form.getlist('receipt_amounts') if amount.strip()]
-        expected_takings = float(request.form.get('expected_takings', 0))
-        
-        # Parse additional cash entries
-        additional_cash_entries = []
-        additional_titles = request.form.getlist('additional_cash_titles')
-        additional_amounts = request.form.getlist('additional_cash_amounts')
-        
-        for title, amount in zip(additional_titles, additional_amounts):
-            if title.strip() and amount.strip():
-                try:
-                    additional_cash_entries.append({
-                        'title': title.strip(),
-                        'amount': float(amount)
-                    })
-                except ValueError:
-                    pass  # Skip invalid entries
+        # The results page hands back the token of the analysis it showed; fall back
+        # to recalculating from the hidden fields if that entry has been evicted
+        result = result_cache.get(request.form.get('result_token'))
+        if result is None:
+            result = calculate_form(request.form)
         
         # Generate report content
-        report_content = report_generator.generate_report_content(
-            date_input, cash_counts, receipt_amounts, 
-            additional_cash_entries, expected_takings, calculator
-        )
+        report_content = result.get('report_content')
+        if report_content is None:
+            with metrics.phase('render'):
+                report_content = report_generator.generate_report_content(
+                    result['date'], result['cash_counts'], result['receipt_amounts'], 
+                    result['additional_cash_entries'], result['expected_takings'], calculator,
+                    analysis=result['analysis'], bagging=result['bagging']
+                )
+            result['report_content'] = report_content
         
-        # Save to file
-        success, result = report_generator.save_report_to_file(date_input, report_content)
+        # Hand the write to the background writer; the index page polls for the outcome
+        # The version the results page showed; a save by anyone else since then is refused
+        report_version = request.form.get('report_version', '')
+        job = report_writer.submit(result['date'], report_content, analysis=result['analysis'], inputs={
+            'cash_counts': result['cash_counts'],
+            'receipt_amounts': result['receipt_amounts'],
+            'additional_cash_entries': result['additional_cash_entries']
+        }, expected_version=int(report_version) if report_version.isdigit() else None)
+        journal_id = request.form.get('journal_id')
+        if journal_id:
+            saved_journals[job.id] = journal_id
+        flash(f'Saving report to: {report_generator.report_path(result["date"])}', 'info')
         
-        if success:
-            flash(f'Report saved successfully to: {result}', 'success')
-        else:
-            flash(f'Error saving report: {result}', 'error')
-        
-        return redirect(url_for('index'))
+        return redirect(url_for('index', save_job=job.id))
     
     except Exception as e:
+        metrics.record_error('/save_report')
         print(f"Save report error: {str(e)}")  # Debug logging
         import traceback
         traceback.print_exc()  # Print full traceback for debugging
         flash(f'Error saving report: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+def reset_after_fork():
+    """Drop state a forked server worker must not share with its parent"""
+    rollup_store.reconnect()
+    anomaly_detector.reconnect()
+    pos_takings.reconnect()
+    report_index.reconnect()
+
+@app.route('/api/save_status/<job_id>')
+def api_save_status(job_id):
+    """Poll the outcome of a background report save"""
+    # Answered from the shared status files when another pre-forked worker queued the job
+    job = report_writer.job_status(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown save job'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
+@app.route('/api/journal/<journal_id>', methods=['GET', 'POST', 'DELETE'])
+def api_journal(journal_id):
+    """Journal the index page's input events, replay them after a crash, or discard them"""
+    try:
+        journal = web_journal(journal_id)
+        if request.method == 'POST':
+            journal.record_many((request.get_json(silent=True) or {}).get('events', []))
+        elif request.method == 'DELETE':
+            journal.clear()
+        else:
+            state = journal.replay()
+            return jsonify({
+                'success': True,
+                'restorable': has_input(state),
+                'state': state
+            })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True
+    })
+
+@app.route('/api/pos_takings/<day_date>')
+def api_pos_takings(day_date):
+    """Imported POS takings for a YYYY-MM-DD date, used to pre-fill expected takings"""
+    return jsonify({
+        'success': True,
+        'date': day_date,
+        'takings': pos_takings.takings_for(day_date)
+    })
+
+@app.route('/api/cash_up/<day_date>')
+def api_cash_up(day_date):
+    """The saved cash up for a YYYY-MM-DD date as stored in the database (amounts in pence)"""
+    day = cash_up_repository.get(day_date)
+    if day is None:
+        return jsonify({
+            'success': False,
+            'error': f'No saved cash up for {day_date}'
+        }), 404
+    return jsonify({
+        'success': True,
+        'cash_up': day
+    })
+
+@app.route('/api/analytics')
+def api_analytics():
+    """Dashboard overview: this year, its months and takings by weekday"""
+    year = request.args.get('year', datetime.now().strftime('%Y'))
+    return jsonify({
+        'success': True,
+        'year': rollup_store.get('year', year),
+        'months': rollup_store.query('month', f'{year}-01', f'{year}-12'),
+        'weekdays': rollup_store.query('weekday')
+    })
+
+@app.route('/api/analytics/<period>')
+def api_analytics_period(period):
+    """Rollups for one period type (day, week, month, year or weekday)"""
+    if period not in PERIODS:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown period '{period}', expected one of: {', '.join(PERIODS)}"
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'period': period,
+        'rollups': rollup_store.query(period, request.args.get('from'), request.args.get('to'))
+    })
+
+def calculate_payload(data):
+    """Run analysis and bagging for one JSON till payload"""
+    cash_counts, receipt_amounts, additional_cash_entries, expected_takings = parse_till_payload(data)
+    analysis = calculator.calculate_float_analysis(cash_counts, receipt_amounts, 
+                                                 additional_cash_entries, expected_takings)
+    bagging = calculator.generate_bagging_instructions(analysis, cash_counts)
+    return analysis, bagging
+
+def search_reports(query):
+    """Search the report archive, catching up with any reports saved outside the app first"""
+    global report_index_scanned
+    if not report_index_scanned:
+        report_index.rescan()
+        report_index_scanned = True
+    return search(report_index, query, limit=Config.SEARCH_RESULT_LIMIT)
+
+@app.route('/search')
+def search_page():
+    """Search saved reports by title, amount, result or date"""
+    query = request.args.get('q', '').strip()
+    results = None
+    if query:
+        try:
+            results = search_reports(query)
+        except SearchError as e:
+            flash(str(e), 'error')
+    return render_template('search.html', query=query, results=results)
+
+@app.route('/api/search')
+def api_search():
+    """API endpoint for searching saved reports"""
+    try:
+        results = search_reports(request.args.get('q', ''))
+    except SearchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        **results
+    })
+
 @app.route('/api/calculate', methods=['POST'])
 def api_calculate():
     """API endpoint for calculations"""
     try:
-        data = request.get_json()
-        cash_counts = data.get('cash_counts', [])
-        receipt_amounts = data.get('receipt_amounts', [])
-        air_hockey_earnings = data.get('air_hockey_earnings', 0)
-        expected_takings = data.get('expected_takings', 0)
-        
-        analysis = calculator.calculate_float_analysis(cash_counts, receipt_amounts, 
-                                                     air_hockey_earnings, expected_takings)
-        bagging = calculator.generate_bagging_instructions(analysis, cash_counts)
+        analysis, bagging = calculate_payload(request.get_json())
         
         return jsonify({
             'success': True,
@@ -163,5 +380,47 @@ def api_calculate():
             'error': str(e)
         }), 400
 
+@app.route('/api/calculate/batch', methods=['POST'])
+def api_calculate_batch():
+    """API endpoint for calculating many tills in one request"""
+    data = request.get_json(silent=True)
+    tills = data.get('tills') if isinstance(data, dict) else data
+    if not isinstance(tills, list):
+        return jsonify({
+            'success': False,
+            'error': 'Expected a JSON array of tills or an object with a "tills" array'
+        }), 400
+    if len(tills) > Config.MAX_BATCH_TILLS:
+        return jsonify({
+            'success': False,
+            'error': f'Too many tills in one batch ({len(tills)}); send at most {Config.MAX_BATCH_TILLS} per request'
+        }), 400
+    
+    results = []
+    for index, till in enumerate(tills):
+        try:
+            analysis, bagging = calculate_payload(till)
+            results.append({
+                'index': index,
+                'success': True,
+                'analysis': analysis,
+                'bagging': bagging
+            })
+        except Exception as e:
+            # Report the bad till inline so the rest of the batch still succeeds
+            metrics.record_error('/api/calculate/batch', 'item')
+            results.append({
+                'index': index,
+                'success': False,
+                'error': str(e)
+            })
+    
+    return jsonify({
+        'success': True,
+        'count': len(results),
+        'failed': sum(1 for result in results if not result['success']),
+        'results': results
+    })
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,250 @@
+"""
+Headless cash ups for main.py --batch
+
+Reads one cash up per JSON line or CSV row, runs each through the same
+cash_up_core engine as the interactive front ends and writes the reports to
+Reports/ (or stdout). Large back-fills can fan out over a process pool;
+progress and throughput go to stderr so stdout stays clean for reports.
+
+JSON lines use the /api/calculate payload plus a date:
+
+    {"date": "14/07/2025", "cash_counts": [0, 3, ...], "receipt_amounts": [4.5],
+     "additional_cash_entries": [{"title": "Air Hockey", "amount": 15.75}], "expected_takings": 250}
+
+CSV files have a header row with date and expected_takings columns, one column
+per denomination (count_0..count_11 or 1p..£50), receipts as "4.50;2.10" and
+additional_cash as "Air Hockey=15.75;Vending=3.00".
+"""
+import csv
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+
+from cash_up_core import DENOMINATIONS, CashUpCalculator, ReportGenerator, parse_till_payload, to_pounds
+from config import Config
+
+# Records handed to a pool worker at a time
+CHUNK_SIZE = 64
+
+_calculator = None
+_report_generator = None
+
+def _engine() -> Tuple[CashUpCalculator, ReportGenerator]:
+    # One calculator per process, so its memoized change solver stays warm
+    global _calculator, _report_generator
+    if _calculator is None:
+        _calculator = CashUpCalculator({'DEFAULT_FLOAT': Config.DEFAULT_FLOAT})
+        _report_generator = ReportGenerator(Config.REPORTS_DIR)
+    return _calculator, _report_generator
+
+def normalise_date(text: str) -> str:
+    """DD/MM/YYYY for a DD/MM/YYYY or YYYY-MM-DD date"""
+    text = str(text).strip()
+    for fmt in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt).strftime('%d/%m/%Y')
+        except ValueError:
+            continue
+    raise ValueError(f"Cannot read date '{text}', expected DD/MM/YYYY or YYYY-MM-DD")
+
+def _split(text: str) -> List[str]:
+    return [part.strip() for part in (text or '').split(';') if part.strip()]
+
+def csv_row_payload(row: Dict[str, str]) -> Dict[str, Any]:
+    """Turn a CSV row into the JSON payload shape"""
+    row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+    counts = []
+    for i, denomination in enumerate(DENOMINATIONS):
+        counts.append(row.get(f'count_{i}') or row.get(denomination.lower()) or 0)
+    additional_cash_entries = []
+    for entry in _split(row.get('additional_cash')):
+        title, separator, amount = entry.rpartition('=')
+        if not separator:
+            raise ValueError(f"Additional cash '{entry}' should look like Title=amount")
+        additional_cash_entries.append({'title': title, 'amount': amount})
+    return {
+        'date': row.get('date'),
+        'cash_counts': counts,
+        'receipt_amounts': _split(row.get('receipts') or row.get('receipt_amounts')),
+        'additional_cash_entries': additional_cash_entries,
+        'air_hockey_earnings': row.get('air_hockey_earnings') or 0,
+        'expected_takings': row.get('expected_takings') or 0
+    }
+
+def read_records(stream, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(line number, payload or the error reading it) for each record in the stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            try:
+                yield reader.line_num, csv_row_payload(row)
+            except ValueError as e:
+                yield reader.line_num, e
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+
+def process_record(record: Tuple[int, Any], save: bool) -> Dict[str, Any]:
+    """Calculate, render and optionally save one cash up; never raises"""
+    line_number, payload = record
+    try:
+        if isinstance(payload, Exception):
+            raise payload
+        calculator, report_generator = _engine()
+        date_input = normalise_date(payload.get('date', ''))
+        cash_counts, receipt_amounts, additional_cash_entries, expected_takings = parse_till_payload(payload)
+        analysis = calculator.calculate_float_analysis(cash_counts, receipt_amounts,
+                                                       additional_cash_entries, expected_takings)
+        bagging = calculator.generate_bagging_instructions(analysis, cash_counts)
+        report_content = report_generator.generate_report_content(
+            date_input, cash_counts, receipt_amounts, additional_cash_entries, expected_takings, calculator,
+            analysis=analysis, bagging=bagging)
+        result = {
+            'line': line_number,
+            'success': True,
+            'date': date_input,
+            'cash_counts': cash_counts,
+            'receipt_amounts': receipt_amounts,
+            'additional_cash_entries': additional_cash_entries,
+            'analysis': analysis
+        }
+        if save:
+            result['path'], result['version'] = report_generator.save_report(date_input, report_content,
+                                                                             fsync=Config.REPORT_FSYNC)
+        else:
+            result['report_content'] = report_content
+        return result
+    except Exception as e:
+        return {'line': line_number, 'success': False, 'error': str(e)}
+
+def process_chunk(chunk: List[Tuple[int, Any]], save: bool) -> List[Dict[str, Any]]:
+    return [process_record(record, save) for record in chunk]
+
+def _record_date(payload) -> Optional[str]:
+    if not isinstance(payload, dict):
+        return None
+    try:
+        return normalise_date(payload.get('date', ''))
+    except ValueError:
+        return None
+
+def process_records(records: Iterator, save: bool, workers: int = 1) -> Iterator[Dict[str, Any]]:
+    """Results in input order; with workers > 1, a bounded window of chunks runs in a process pool
+    
+    When saving, records for a date already in a chunk still running wait for
+    that chunk, so a date given twice is saved in input order as it would be
+    with one worker.
+    """
+    if workers <= 1:
+        for record in records:
+            yield process_record(record, save)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # (dates, future) for each chunk in flight, oldest first
+        window = deque()
+        chunk, chunk_dates = [], set()
+        for record in records:
+            date_input = _record_date(record[1]) if save else None
+            if date_input is not None and date_input not in chunk_dates:
+                while any(date_input in dates for dates, _ in window):
+                    yield from window.popleft()[1].result()
+                chunk_dates.add(date_input)
+            chunk.append(record)
+            if len(chunk) >= CHUNK_SIZE:
+                window.append((chunk_dates, pool.submit(process_chunk, chunk, save)))
+                chunk, chunk_dates = [], set()
+                # Keep reading input only as fast as the workers drain it
+                if len(window) >= workers * 4:
+                    yield from window.popleft()[1].result()
+        if chunk:
+            window.append((chunk_dates, pool.submit(process_chunk, chunk, save)))
+        while window:
+            yield from window.popleft()[1].result()
+
+class _Analytics:
+    """Feeds saved batch results to the database, record log, rollups and anomaly statistics"""
+
+    def __init__(self):
+        from analytics import AnomalyDetector, RollupStore
+        from database import CashUpRepository
+        from record_log import RecordLog
+        self.cash_up_repository = CashUpRepository()
+        self.record_log = RecordLog(Config.RECORD_LOG_DIR, fsync=Config.REPORT_FSYNC)
+        self.rollup_store = RollupStore(Config.DATABASE_URL)
+        self.anomaly_detector = AnomalyDetector(Config.DATABASE_URL)
+        # One commit per cash up would dominate a back-fill; the saved reports stay the
+        # source of truth and `analytics.py rebuild` recovers the tables after a crash
+        for conn in (self.rollup_store.conn, self.anomaly_detector.conn):
+            conn.execute("PRAGMA synchronous=OFF")
+
+    def record(self, result: Dict[str, Any]):
+        self.cash_up_repository.save_analysis(result['date'], result['cash_counts'], result['receipt_amounts'],
+                                              result['additional_cash_entries'], result['analysis'],
+                                              report_path=result['path'], source='batch', version=result['version'])
+        self.record_log.append_analysis(result['date'], result['cash_counts'], result['receipt_amounts'],
+                                        result['additional_cash_entries'], result['analysis'])
+        self.rollup_store.record_analysis(result['date'], result['analysis'])
+        self.anomaly_detector.observe_analysis(result['date'], result['analysis'])
+
+    def close(self):
+        self.cash_up_repository.close()
+        self.rollup_store.close()
+        self.anomaly_detector.close()
+
+def run_batch(stream, fmt: str = 'jsonl', to_stdout: bool = False, workers: int = 1,
+              analytics: bool = True, out=None, err=None) -> Dict[str, Any]:
+    """Process every record in stream, returning the run's counts and throughput"""
+    out = out or sys.stdout
+    err = err or sys.stderr
+    save = not to_stdout
+    recorder = _Analytics() if save and analytics else None
+    stats = {'processed': 0, 'saved': 0, 'failed': 0, 'over': 0, 'short': 0, 'net_difference': 0}
+    started = last_report = time.perf_counter()
+    try:
+        for result in process_records(read_records(stream, fmt), save, workers):
+            stats['processed'] += 1
+            if not result['success']:
+                stats['failed'] += 1
+                print(f"line {result['line']}: {result['error']}", file=err)
+            else:
+                analysis = result['analysis']
+                stats['over'] += analysis['is_over']
+                stats['short'] += analysis['is_short']
+                stats['net_difference'] += analysis['pence']['difference']
+                if save:
+                    stats['saved'] += 1
+                    if recorder is not None:
+                        try:
+                            recorder.record(result)
+                        except Exception as e:
+                            print(f"line {result['line']}: saved, but analytics were not updated: {e}", file=err)
+                else:
+                    try:
+                        out.write(result['report_content'])
+                        out.write("\n\n")
+                    except BrokenPipeError:
+                        # e.g. piped into head: stop quietly
+                        break
+            now = time.perf_counter()
+            if now - last_report >= 1.0:
+                last_report = now
+                print(f"  {stats['processed']} cash ups ({stats['processed'] / (now - started):.0f}/s), "
+                      f"{stats['failed']} failed", file=err)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    stats['seconds'] = time.perf_counter() - started
+    rate = stats['processed'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"Processed {stats['processed']} cash ups in {stats['seconds']:.2f}s ({rate:.0f}/s): "
+          f"{stats['saved']} saved, {stats['failed']} failed, {stats['over']} over, {stats['short']} short, "
+          f"net {'-' if stats['net_difference'] < 0 else '+'}£{to_pounds(abs(stats['net_difference'])):.2f}", file=err)
+    return stats
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the Cash Up core engine, report generation and Flask routes
+
+Generates synthetic tills (random counts, receipts and additional cash entries)
+and a multi-year Reports tree, times the hot paths - including reading the
+archive back through the parser, index, search and analytics rebuild - and
+writes machine-readable JSON so runs from different versions can be compared:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Project modules read their settings when first imported, so the scratch
+# area and its database must be in place before any of them is loaded
+WORKDIR = tempfile.mkdtemp(prefix='cashup-bench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'bench.db')
+
+from cash_up_core import CashUpCalculator, ReportGenerator
+
+TITLES = ["Air Hockey", "Vending Machine", "Claw Machine", "Jukebox", "Donations"]
+
+def random_till(rng: random.Random, date_input: str = None):
+    """One synthetic till shaped like the calculator's inputs"""
+    cash_counts = [rng.randint(0, 200), rng.randint(0, 100), rng.randint(0, 200), rng.randint(0, 120),
+                   rng.randint(0, 80), rng.randint(0, 60), rng.randint(0, 150), rng.randint(0, 40),
+                   rng.randint(0, 20), rng.randint(0, 25), rng.randint(0, 10), rng.randint(0, 3)]
+    return {
+        'date': date_input or "01/01/2025",
+        'cash_counts': cash_counts,
+        'receipt_amounts': [rng.randint(50, 5000) / 100 for _ in range(rng.randint(0, 8))],
+        'additional_cash_entries': [{'title': rng.choice(TITLES), 'amount': rng.randint(0, 4000) / 100}
+                                    for _ in range(rng.randint(0, 3))],
+        'expected_takings': rng.randint(0, 60000) / 100
+    }
+
+def generate_corpus(rng: random.Random, size: int):
+    start = date(2020, 1, 1)
+    return [random_till(rng, (start + timedelta(days=i)).strftime('%d/%m/%Y')) for i in range(size)]
+
+def generate_reports_tree(reports_dir: str, tills, calculator: CashUpCalculator) -> int:
+    """Write one report per till into a Reports/YYYY/MM tree"""
+    generator = ReportGenerator(reports_dir)
+    for till in tills:
+        content = generator.generate_report_content(till['date'], till['cash_counts'], till['receipt_amounts'],
+                                                    till['additional_cash_entries'], till['expected_takings'],
+                                                    calculator)
+        generator.save_report_to_file(till['date'], content)
+    return len(tills)
+
+def time_calls(func, items, repeat: int = 1):
+    """Call func on every item, repeat times, and summarise the per-call latency"""
+    samples = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            func(item)
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    total = sum(samples)
+    return {
+        'calls': len(samples),
+        'total_s': total,
+        'mean_us': statistics.mean(samples) * 1e6,
+        'median_us': statistics.median(samples) * 1e6,
+        'p95_us': samples[int(len(samples) * 0.95) - 1] * 1e6 if len(samples) >= 20 else samples[-1] * 1e6,
+        'min_us': samples[0] * 1e6,
+        'ops_per_s': len(samples) / total if total else None
+    }
+
+def bench_core(tills, calculator: CashUpCalculator, repeat: int):
+    results = {}
+    results['calculate_float_analysis'] = time_calls(
+        lambda t: calculator.calculate_float_analysis(t['cash_counts'], t['receipt_amounts'],
+                                                      t['additional_cash_entries'], t['expected_takings']),
+        tills, repeat)
+
+    analyses = [calculator.calculate_float_analysis(t['cash_counts'], t['receipt_amounts'],
+                                                    t['additional_cash_entries'], t['expected_takings'])
+                for t in tills]
+    removals = [(max(0.0, a['amount_to_remove'] - a['total_receipts']), t['cash_counts'])
+                for a, t in zip(analyses, tills)]
+    results['suggest_change_removal'] = time_calls(
+        lambda item: calculator.suggest_change_removal(*item), removals, repeat)
+
+    generator = ReportGenerator()
+    results['generate_report_content'] = time_calls(
+        lambda t: generator.generate_report_content(t['date'], t['cash_counts'], t['receipt_amounts'],
+                                                    t['additional_cash_entries'], t['expected_takings'],
+                                                    calculator),
+        tills, repeat)
+    return results
+
+def bench_batch(tills, calculator: CashUpCalculator, repeat: int):
+    try:
+        from cash_up_batch import BatchCashUpCalculator
+    except ImportError:
+        return {}
+    batch = BatchCashUpCalculator(calculator)
+    return {'batch_calculate_tills': time_calls(batch.calculate_tills, [tills], repeat)}
+
+def bench_save(tills, calculator: CashUpCalculator, workdir: str):
+    generator = ReportGenerator(os.path.join(workdir, 'save_bench'))
+    contents = [(t['date'], generator.generate_report_content(t['date'], t['cash_counts'], t['receipt_amounts'],
+                                                               t['additional_cash_entries'],
+                                                               t['expected_takings'], calculator))
+                for t in tills]
+    return {'save_report_to_file': time_calls(lambda item: generator.save_report_to_file(*item), contents)}
+
+SEARCH_QUERIES = ["air hockey", "over", "short friday", "2021-03", "receipt:>20", "takings:100..300",
+                  "jukebox 2020", "difference:<-5"]
+
+def bench_archive(reports_dir: str, workdir: str, repeat: int):
+    """Read the synthetic archive back: parse, full index rescan, search and analytics rebuild"""
+    from analytics import AnomalyDetector, RollupStore, rebuild_all
+    from report_index import ReportIndex
+    from report_parser import iter_report_files, iter_reports, parse_report_file
+    from report_search import search
+
+    paths = [path for path, _ in iter_report_files(reports_dir)]
+    results = {'archive_parse_report': time_calls(parse_report_file, paths)}
+
+    def fresh_index(run):
+        return ReportIndex(reports_dir, 'sqlite:///' + os.path.join(workdir, f'archive-index-{run}.db'))
+
+    indexes = [fresh_index(run) for run in range(repeat)]
+    results['archive_index_rescan'] = time_calls(lambda index: index.rescan(), indexes)
+    index = indexes[-1]
+    results['archive_search'] = time_calls(lambda query: search(index, query), SEARCH_QUERIES, repeat)
+    for index in indexes:
+        index.close()
+
+    def rebuild(run):
+        database_url = 'sqlite:///' + os.path.join(workdir, f'archive-analytics-{run}.db')
+        store = RollupStore(database_url)
+        try:
+            rebuild_all(store, AnomalyDetector(database_url, conn=store.conn),
+                        ((report.date, RollupStore._report_figures(report)) for report in iter_reports(reports_dir)))
+        finally:
+            store.close()
+
+    results['archive_analytics_rebuild'] = time_calls(rebuild, range(repeat))
+    return results
+
+def bench_routes(tills, workdir: str, repeat: int):
+    # DATABASE_URL already points into the scratch area (set before any project import)
+    try:
+        import app as web
+    except ImportError:
+        return {}
+    web.report_generator.reports_dir = os.path.join(workdir, 'route_reports')
+    web.record_log.directory = os.path.join(workdir, 'route_records')
+    web.Config.JOURNAL_DIR = os.path.join(workdir, 'route_journal')
+    web.report_writer.status_dir = os.path.join(workdir, 'route_status')
+    client = web.app.test_client()
+
+    def form_for(till, salt):
+        form = {
+            'date': datetime.strptime(till['date'], '%d/%m/%Y').strftime('%Y-%m-%d'),
+            # Vary expected takings per pass so /calculate isn't served from the result cache
+            'expected_takings': f"{till['expected_takings'] + salt / 100:.2f}",
+            'receipt_amounts': [f"{amount:.2f}" for amount in till['receipt_amounts']],
+            'additional_cash_titles': [entry['title'] for entry in till['additional_cash_entries']],
+            'additional_cash_amounts': [f"{entry['amount']:.2f}" for entry in till['additional_cash_entries']]
+        }
+        for i, count in enumerate(till['cash_counts']):
+            form[f'count_{i}'] = str(count)
+        return form
+
+    forms = [form_for(till, salt) for salt in range(repeat) for till in tills]
+    results = {
+        'route_calculate': time_calls(lambda form: client.post('/calculate', data=form), forms),
+        'route_save_report': time_calls(lambda form: client.post('/save_report', data=form), forms)
+    }
+    web.report_writer.flush()
+    return results
+
+def compare(current, baseline):
+    """Print the change in median latency against a previous results file"""
+    print(f"\n{'benchmark':<28}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for name, stats in current['benchmarks'].items():
+        before = baseline.get('benchmarks', {}).get(name)
+        if not before:
+            print(f"{name:<28}{'-':>14}{stats['median_us']:>14.1f}{'new':>10}")
+            continue
+        change = (stats['median_us'] - before['median_us']) / before['median_us'] * 100
+        print(f"{name:<28}{before['median_us']:>14.1f}{stats['median_us']:>14.1f}{change:>+9.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Cash Up application")
+    parser.add_argument('--tills', type=int, default=500, help="synthetic tills per benchmark")
+    parser.add_argument('--years', type=int, default=3, help="years of daily reports in the synthetic archive")
+    parser.add_argument('--repeat', type=int, default=3, help="passes over the corpus")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--skip-routes', action='store_true', help="don't benchmark the Flask routes")
+    parser.add_argument('--output', default=None, help="where to write the JSON results")
+    parser.add_argument('--compare', default=None, help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    calculator = CashUpCalculator({'DEFAULT_FLOAT': 200.00})
+    tills = generate_corpus(rng, args.tills)
+    workdir = WORKDIR
+    try:
+        benchmarks = {}
+        benchmarks.update(bench_core(tills, calculator, args.repeat))
+        benchmarks.update(bench_batch(tills, calculator, args.repeat))
+        benchmarks.update(bench_save(tills, calculator, workdir))
+
+        archive_tills = generate_corpus(rng, args.years * 365)
+        start = time.perf_counter()
+        generate_reports_tree(os.path.join(workdir, 'Reports'), archive_tills, calculator)
+        archive_seconds = time.perf_counter() - start
+        benchmarks.update(bench_archive(os.path.join(workdir, 'Reports'), workdir, args.repeat))
+
+        if not args.skip_routes:
+            benchmarks.update(bench_routes(tills[:100], workdir, args.repeat))
+
+        results = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': vars(args),
+            'archive': {'reports': len(archive_tills), 'generate_s': archive_seconds},
+            'benchmarks': benchmarks
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, stats in benchmarks.items():
+        print(f"{name:<28}{stats['calls']:>8} calls  median {stats['median_us']:>10.1f} us  "
+              f"p95 {stats['p95_us']:>10.1f} us")
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
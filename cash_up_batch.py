@@ -0,0 +1,110 @@
+"""
+Vectorized cash up calculations over many tills at once
+
+Takes an (N tills x 12 denominations) count matrix plus per-till receipt and
+expected takings vectors and computes the same figures as
+CashUpCalculator.calculate_float_analysis with NumPy array operations.
+"""
+from typing import List, Dict, Any, Sequence
+
+import numpy as np
+
+from cash_up_core import CashUpCalculator
+
+class BatchCashUpCalculator:
+    """Computes float analysis for a whole batch of tills in one pass"""
+
+    def __init__(self, calculator: CashUpCalculator = None):
+        self.calculator = calculator or CashUpCalculator()
+        self.denominations = self.calculator.denominations
+        # Work in whole pence so totals and the exact check need no float fudging
+        self.values_pence = np.asarray(self.calculator.values_pence, dtype=np.int64)
+        self.default_float_pence = self.calculator.default_float_pence
+
+    @staticmethod
+    def to_pence(amounts) -> np.ndarray:
+        """Convert a vector of pound amounts to int64 pence, rounding half up like to_pence
+
+        The scaled amount is first rounded to 6 places so 1.005 * 100 (100.49999...)
+        counts as the 100.5 that to_pence's Decimal arithmetic sees; halves then
+        round away from zero.
+        """
+        scaled = np.round(np.asarray(amounts, dtype=np.float64) * 100, 6)
+        return (np.sign(scaled) * np.floor(np.abs(scaled) + 0.5)).astype(np.int64)
+
+    def _sum_pence(self, amounts_per_till: Sequence[Sequence[float]]) -> np.ndarray:
+        """Per-till totals in pence, converting each amount before summing like the scalar path"""
+        lengths = [len(amounts) for amounts in amounts_per_till]
+        totals = np.zeros(len(lengths), dtype=np.int64)
+        if sum(lengths):
+            till_index = np.repeat(np.arange(len(lengths)), lengths)
+            np.add.at(totals, till_index,
+                      self.to_pence([amount for amounts in amounts_per_till for amount in amounts]))
+        return totals
+
+    def calculate(self, counts, receipt_totals, expected_takings,
+                  additional_cash_totals=None) -> Dict[str, np.ndarray]:
+        """Calculate totals, differences, amounts to remove and over/short/exact flags
+
+        counts is an (N, 12) matrix of denomination counts; the other arguments are
+        length-N vectors of pound amounts (or scalars broadcast across every till).
+        """
+        if additional_cash_totals is not None:
+            additional_cash_totals = self.to_pence(additional_cash_totals)
+        return self._calculate_pence(counts, self.to_pence(receipt_totals), self.to_pence(expected_takings),
+                                     additional_cash_totals)
+
+    def _calculate_pence(self, counts, receipt_totals, expected_takings,
+                         additional_cash_totals=None) -> Dict[str, np.ndarray]:
+        """calculate() with every amount already in pence"""
+        counts = np.asarray(counts, dtype=np.int64)
+        if counts.ndim != 2 or counts.shape[1] != len(self.values_pence):
+            raise ValueError(f"counts must have shape (N, {len(self.values_pence)}), got {counts.shape}")
+        if (counts < 0).any():
+            raise ValueError("Cash counts cannot be negative")
+        n_tills = counts.shape[0]
+
+        total_cash = counts @ self.values_pence
+        total_receipts = np.broadcast_to(receipt_totals, (n_tills,))
+        expected = np.broadcast_to(expected_takings, (n_tills,))
+        if additional_cash_totals is None:
+            total_additional_cash = np.zeros(n_tills, dtype=np.int64)
+        else:
+            total_additional_cash = np.broadcast_to(additional_cash_totals, (n_tills,))
+
+        total_in_till = total_cash + total_receipts
+        expected_total = expected + self.default_float_pence
+        difference = total_in_till - expected_total
+        amount_to_remove = total_in_till - self.default_float_pence
+        cash_to_remove = np.where(amount_to_remove > 0, amount_to_remove - total_receipts, 0)
+
+        return {
+            'total_cash': total_cash / 100,
+            'total_receipts': total_receipts / 100,
+            'total_additional_cash': total_additional_cash / 100,
+            'total_in_till': total_in_till / 100,
+            'expected_takings': expected / 100,
+            'expected_total': expected_total / 100,
+            'difference': difference / 100,
+            'amount_to_remove': amount_to_remove / 100,
+            'cash_to_remove': cash_to_remove / 100,
+            'is_over': difference > 0,
+            'is_short': difference < 0,
+            'is_exact': difference == 0
+        }
+
+    def calculate_tills(self, tills: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Build the batch arrays from till dicts shaped like calculate_float_analysis inputs"""
+        counts = np.array([till['cash_counts'] for till in tills], dtype=np.int64).reshape(len(tills), -1)
+        receipt_totals = self._sum_pence([till.get('receipt_amounts') or [] for till in tills])
+        additional_totals = self._sum_pence([[entry['amount'] for entry in till.get('additional_cash_entries') or []]
+                                             for till in tills])
+        expected = self.to_pence([till.get('expected_takings', 0) for till in tills])
+        return self._calculate_pence(counts, receipt_totals, expected, additional_totals)
+
+    @staticmethod
+    def rows(results: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        """Split batch results back into one plain dict per till"""
+        keys = list(results)
+        columns = [results[key].tolist() for key in keys]
+        return [dict(zip(keys, values)) for values in zip(*columns)]
@@ -1,69 +1,239 @@
 """
 Core business logic for the Cash Up Application
 """
-from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
 from typing import List, Tuple, Dict, Any
 import os
+import tempfile
+
+from date_locks import locked_report, report_version
+
+DENOMINATIONS = ["1p", "2p", "5p", "10p", "20p", "50p", "£1", "£2", "£5", "£10", "£20", "£50"]
+DENOMINATION_PENCE = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+def to_pence(amount) -> int:
+    """Convert a pound amount (float, str or Decimal) to whole pence, rounding half up"""
+    if isinstance(amount, int):
+        return amount * 100
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def to_pounds(pence: int) -> float:
+    """Convert whole pence back to pounds for display"""
+    return pence / 100
+
+def atomic_write(filepath: str, content: str, fsync: bool = False):
+    """Write content to filepath so readers see either the old file or the new one, never a torn write"""
+    directory = os.path.dirname(filepath) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(filepath)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+@lru_cache(maxsize=1024)
+def optimal_change_removal(values_pence: Tuple[int, ...], target_pence: int,
+                           counts: Tuple[int, ...]) -> Tuple[Tuple[int, ...], int]:
+    """Choose how many of each denomination to remove so the total is as close to
+    target_pence as possible without going over, using the fewest pieces.
+    
+    Bounded knapsack solved top-down from the largest denomination, memoized on
+    (denomination, amount still to remove). Returns the per-denomination removal
+    counts and the pence left unremoved. Whole results are memoized on
+    (amount, counts) because the UIs re-run this on every recalculation.
+    """
+    if target_pence <= 0:
+        return tuple(0 for _ in counts), target_pence
+    
+    # available[i] is the value of everything in denominations 0..i
+    available = []
+    running = 0
+    for value, count in zip(values_pence, counts):
+        running += value * count
+        available.append(running)
+    
+    @lru_cache(maxsize=None)
+    def best(i: int, amount: int) -> Tuple[int, int, int]:
+        """(pence left, pieces used, count of denomination i) for the best removal of amount"""
+        if amount == 0:
+            return 0, 0, 0
+        if i < 0:
+            return amount, 0, 0
+        if amount >= available[i]:
+            return amount - available[i], sum(counts[:i + 1]), counts[i]
+        value = values_pence[i]
+        smaller = values_pence[i - 1] if i > 0 else value
+        result = None
+        for take in range(min(counts[i], amount // value), -1, -1):
+            rest = amount - take * value
+            # Once exact, fewer of this denomination can only need more pieces below
+            if result is not None and result[0] == 0 and take + -(-rest // smaller) >= result[1]:
+                break
+            left, pieces, _ = best(i - 1, rest)
+            if result is None or (left, pieces + take) < result[:2]:
+                result = (left, pieces + take, take)
+        return result
+    
+    left, _, _ = best(len(counts) - 1, target_pence)
+    
+    removal = [0] * len(counts)
+    amount = target_pence
+    for i in range(len(counts) - 1, -1, -1):
+        if amount == 0:
+            break
+        if amount >= available[i]:
+            removal[:i + 1] = counts[:i + 1]
+            break
+        take = best(i, amount)[2]
+        removal[i] = take
+        amount -= take * values_pence[i]
+    
+    return tuple(removal), left
+
+def parse_till_payload(data: Dict[str, Any]) -> Tuple[List[int], List[float], List[Dict[str, Any]], float]:
+    """Validate one till's inputs as sent to the JSON API (or fed to batch mode)
+    
+    Returns cash_counts, receipt_amounts, additional_cash_entries and expected_takings.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Till payload must be a JSON object')
+    
+    cash_counts = [int(count) for count in data.get('cash_counts', [])]
+    if len(cash_counts) > len(DENOMINATIONS):
+        raise ValueError(f'Expected at most {len(DENOMINATIONS)} cash counts')
+    if any(count < 0 for count in cash_counts):
+        raise ValueError('Cash counts cannot be negative')
+    cash_counts += [0] * (len(DENOMINATIONS) - len(cash_counts))
+    
+    receipt_amounts = [float(amount) for amount in data.get('receipt_amounts', [])]
+    expected_takings = float(data.get('expected_takings', 0))
+    
+    additional_cash_entries = [{'title': str(entry['title']).strip(), 'amount': float(entry['amount'])}
+                               for entry in data.get('additional_cash_entries', [])]
+    # Older clients send a single air hockey figure instead of a list of entries
+    air_hockey_earnings = float(data.get('air_hockey_earnings', 0))
+    if air_hockey_earnings:
+        additional_cash_entries.append({'title': 'Air Hockey', 'amount': air_hockey_earnings})
+    
+    return cash_counts, receipt_amounts, additional_cash_entries, expected_takings
 
 class CashUpCalculator:
-    """Handles all cash up calculations and business logic"""
+    """Handles all cash up calculations and business logic
+    
+    All arithmetic is done in integer pence; pound floats are only produced
+    in the returned dicts for rendering.
+    """
     
     def __init__(self, config=None):
         self.config = config or {}
-        self.denominations = ["1p", "2p", "5p", "10p", "20p", "50p", "£1", "£2", "£5", "£10", "£20", "£50"]
-        self.values = [0.01, 0.02, 0.05, 0.10, 0.20, 0.50, 1.00, 2.00, 5.00, 10.00, 20.00, 50.00]
+        self.denominations = list(DENOMINATIONS)
+        self.values_pence = list(DENOMINATION_PENCE)
+        self.values = [to_pounds(pence) for pence in self.values_pence]
         self.default_float = self.config.get('DEFAULT_FLOAT', 200.00)
+        self.default_float_pence = to_pence(self.default_float)
+    
+    def calculate_denomination_total_pence(self, counts: List[int]) -> int:
+        """Calculate total value in pence for given denomination counts"""
+        return sum(count * value for count, value in zip(counts, self.values_pence))
     
     def calculate_denomination_total(self, counts: List[int]) -> float:
         """Calculate total value for given counts and denomination values"""
-        return sum(count * value for count, value in zip(counts, self.values))
+        return to_pounds(self.calculate_denomination_total_pence(counts))
     
-    def suggest_change_removal(self, excess_amount: float, counts: List[int]) -> Tuple[List[Tuple[str, int, float]], float]:
-        """Suggest which denominations to remove to get closest to target amount"""
-        suggestions = []
-        remaining = excess_amount
+    def suggest_change_removal_pence(self, excess_pence: int, counts: List[int]) -> Tuple[List[Tuple[str, int, int]], int]:
+        """Suggest which denominations to remove, working entirely in pence
         
-        # Work backwards from highest denomination
-        for i in range(len(self.denominations)-1, -1, -1):
-            if counts[i] > 0 and self.values[i] <= remaining:
-                remove_count = min(counts[i], int(remaining / self.values[i]))
-                if remove_count > 0:
-                    suggestions.append((self.denominations[i], remove_count, remove_count * self.values[i]))
-                    remaining -= remove_count * self.values[i]
+        Finds an exact removal from the notes and coins actually in the till when
+        one exists, otherwise the closest amount under the target, with the fewest
+        pieces either way.
+        """
+        removal, remaining = optimal_change_removal(tuple(self.values_pence), excess_pence,
+                                                    tuple(int(count) for count in counts))
+        
+        # List highest denomination first, as staff bag notes before coins
+        suggestions = [(self.denominations[i], removal[i], removal[i] * self.values_pence[i])
+                       for i in range(len(self.denominations)-1, -1, -1) if removal[i] > 0]
         
         return suggestions, remaining
     
+    def suggest_change_removal(self, excess_amount: float, counts: List[int]) -> Tuple[List[Tuple[str, int, float]], float]:
+        """Suggest which denominations to remove to get closest to target amount"""
+        suggestions, remaining = self.suggest_change_removal_pence(to_pence(excess_amount), counts)
+        return [(denom, count, to_pounds(value)) for denom, count, value in suggestions], to_pounds(remaining)
+    
     def calculate_float_analysis(self, cash_counts: List[int], receipt_amounts: List[float], 
-                                additional_cash_entries: List[Dict[str, Any]], expected_takings: float) -> Dict[str, Any]:
-        """Calculate complete float analysis"""
-        total_cash = self.calculate_denomination_total(cash_counts)
-        total_receipts = sum(receipt_amounts) if receipt_amounts else 0
-        total_additional_cash = sum(entry['amount'] for entry in additional_cash_entries) if additional_cash_entries else 0
+                                additional_cash_entries: List[Dict[str, Any]], expected_takings: float,
+                                pos_takings: float = None) -> Dict[str, Any]:
+        """Calculate complete float analysis
+        
+        pos_takings, the day's takings from an imported POS export, adds a cross-check
+        of the expected takings that were entered.
+        """
+        total_cash = self.calculate_denomination_total_pence(cash_counts)
+        total_receipts = sum(to_pence(amount) for amount in receipt_amounts) if receipt_amounts else 0
+        total_additional_cash = sum(to_pence(entry['amount']) for entry in additional_cash_entries) if additional_cash_entries else 0
+        expected_takings_pence = to_pence(expected_takings)
         
         # Additional cash is already in the till, so we need to subtract it from the total
         # to get the actual takings that should be in the till
         total_in_till = total_cash + total_receipts
-        expected_total = self.default_float + expected_takings
+        expected_total = self.default_float_pence + expected_takings_pence
         difference = total_in_till - expected_total
-        amount_to_remove = total_in_till - self.default_float
+        amount_to_remove = total_in_till - self.default_float_pence
         
-        return {
-            'total_cash': total_cash,
-            'total_receipts': total_receipts,
+        analysis = {
+            'total_cash': to_pounds(total_cash),
+            'total_receipts': to_pounds(total_receipts),
             'additional_cash_entries': additional_cash_entries,
-            'total_additional_cash': total_additional_cash,
-            'total_in_till': total_in_till,
-            'expected_takings': expected_takings,
-            'expected_total': expected_total,
-            'difference': difference,
-            'amount_to_remove': amount_to_remove,
+            'total_additional_cash': to_pounds(total_additional_cash),
+            'total_in_till': to_pounds(total_in_till),
+            'expected_takings': to_pounds(expected_takings_pence),
+            'expected_total': to_pounds(expected_total),
+            'difference': to_pounds(difference),
+            'amount_to_remove': to_pounds(amount_to_remove),
             'is_over': difference > 0,
             'is_short': difference < 0,
-            'is_exact': abs(difference) < 0.01
+            'is_exact': difference == 0,
+            'pence': {
+                'total_cash': total_cash,
+                'total_receipts': total_receipts,
+                'total_additional_cash': total_additional_cash,
+                'total_in_till': total_in_till,
+                'expected_takings': expected_takings_pence,
+                'expected_total': expected_total,
+                'difference': difference,
+                'amount_to_remove': amount_to_remove
+            }
         }
+        if pos_takings is not None:
+            pos_takings_pence = to_pence(pos_takings)
+            analysis.update({
+                'pos_takings': to_pounds(pos_takings_pence),
+                'pos_difference': to_pounds(expected_takings_pence - pos_takings_pence),
+                'pos_matches': expected_takings_pence == pos_takings_pence
+            })
+            analysis['pence']['pos_takings'] = pos_takings_pence
+        return analysis
     
     def generate_bagging_instructions(self, analysis: Dict[str, Any], cash_counts: List[int]) -> Dict[str, Any]:
         """Generate bagging instructions based on analysis"""
+        pence = analysis['pence']
         instructions = {
             'total_to_remove': analysis['amount_to_remove'],
             'receipts_to_remove': analysis['total_receipts'],
@@ -74,59 +244,131 @@ class CashUpCalculator:
             'needs_additional_cash': False
         }
         
-        if analysis['amount_to_remove'] > 0:
+        if pence['amount_to_remove'] > 0:
             # Only remove receipts and cash - additional cash stays in till
-            cash_to_remove = analysis['amount_to_remove'] - analysis['total_receipts']
-            instructions['cash_to_remove'] = cash_to_remove
+            cash_to_remove = pence['amount_to_remove'] - pence['total_receipts']
+            instructions['cash_to_remove'] = to_pounds(cash_to_remove)
             
             if cash_to_remove > 0:
-                suggestions, remaining = self.suggest_change_removal(cash_to_remove, cash_counts)
-                instructions['cash_suggestions'] = suggestions
-                instructions['remaining_after_suggestions'] = remaining
+                suggestions, remaining = self.suggest_change_removal_pence(cash_to_remove, cash_counts)
+                instructions['cash_suggestions'] = [(denom, count, to_pounds(value)) for denom, count, value in suggestions]
+                instructions['remaining_after_suggestions'] = to_pounds(remaining)
             elif cash_to_remove < 0:
                 instructions['needs_additional_cash'] = True
-                instructions['additional_cash_needed'] = abs(cash_to_remove)
+                instructions['additional_cash_needed'] = to_pounds(abs(cash_to_remove))
         
         return instructions
 
+class RunningTotals:
+    """Live cash, receipt and additional cash totals in pence
+
+    Each edit applies only its own delta, so keeping the totals current costs
+    the same whether the till has three receipts or three hundred. The figures
+    always equal what calculate_float_analysis would sum from scratch.
+    """
+
+    def __init__(self, values_pence: List[int]):
+        self.values_pence = list(values_pence)
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * len(self.values_pence)
+        self.receipts_pence = []
+        self.additional_cash_pence = []
+        self.cash_pence = 0
+        self.receipts_total_pence = 0
+        self.additional_cash_total_pence = 0
+
+    def set_count(self, index: int, count: int) -> int:
+        """Set one denomination's count, returning the change in cash total"""
+        delta = (count - self.counts[index]) * self.values_pence[index]
+        self.counts[index] = count
+        self.cash_pence += delta
+        return delta
+
+    def add_receipt(self, amount: float):
+        pence = to_pence(amount)
+        self.receipts_pence.append(pence)
+        self.receipts_total_pence += pence
+
+    def remove_receipt(self, index: int):
+        self.receipts_total_pence -= self.receipts_pence.pop(index)
+
+    def add_additional_cash(self, amount: float):
+        pence = to_pence(amount)
+        self.additional_cash_pence.append(pence)
+        self.additional_cash_total_pence += pence
+
+    def remove_additional_cash(self, index: int):
+        self.additional_cash_total_pence -= self.additional_cash_pence.pop(index)
+
+    @property
+    def total_in_till_pence(self) -> int:
+        return self.cash_pence + self.receipts_total_pence
+
+    def difference_pence(self, expected_takings_pence: int, default_float_pence: int) -> int:
+        """Over (positive) or short (negative) against the float plus expected takings"""
+        return self.total_in_till_pence - default_float_pence - expected_takings_pence
+
 class ReportGenerator:
     """Handles report generation and file operations"""
     
     def __init__(self, reports_dir="Reports"):
         self.reports_dir = reports_dir
     
-    def save_report_to_file(self, date_input: str, report_content: str) -> Tuple[bool, str]:
+    def report_path(self, date_input: str) -> str:
+        """Path of the report file for a DD/MM/YYYY date"""
+        # Parse the date to create folder structure
+        day, month, year = date_input.split('/')
+        
+        # Create the Reports folder structure
+        year_dir = os.path.join(self.reports_dir, year)
+        month_dir = os.path.join(year_dir, month.zfill(2))  # Ensure 2-digit month
+        
+        # Create filename with full date
+        filename = f"Cash_Up_{day.zfill(2)}-{month.zfill(2)}-{year}.txt"
+        return os.path.join(month_dir, filename)
+    
+    def report_version(self, date_input: str) -> int:
+        """How many times the date's report has been saved (0 if never); pass it back as expected_version"""
+        return report_version(self.report_path(date_input))
+    
+    def save_report(self, date_input: str, report_content: str, fsync: bool = False,
+                    expected_version: int = None) -> Tuple[str, int]:
+        """Save the report under the date's lock, returning its path and new version
+        
+        Raises date_locks.VersionConflict if expected_version is given and another
+        save of the date has happened since.
+        """
+        filepath = self.report_path(date_input)
+        with locked_report(filepath, date_input, expected_version, fsync=fsync) as version:
+            # Save the report via a temp file and rename so a crash can't truncate it
+            atomic_write(filepath, report_content, fsync=fsync)
+        return filepath, version
+    
+    def save_report_to_file(self, date_input: str, report_content: str, fsync: bool = False,
+                            expected_version: int = None) -> Tuple[bool, str]:
         """Save the cash up report to a text file with organized folder structure"""
         try:
-            # Parse the date to create folder structure
-            day, month, year = date_input.split('/')
-            
-            # Create the Reports folder structure
-            year_dir = os.path.join(self.reports_dir, year)
-            month_dir = os.path.join(year_dir, month.zfill(2))  # Ensure 2-digit month
-            
-            # Create directories if they don't exist
-            os.makedirs(month_dir, exist_ok=True)
-            
-            # Create filename with full date
-            filename = f"Cash_Up_{day.zfill(2)}-{month.zfill(2)}-{year}.txt"
-            filepath = os.path.join(month_dir, filename)
-            
-            # Save the report
-            with open(filepath, 'w') as f:
-                f.write(report_content)
-            
+            filepath, _ = self.save_report(date_input, report_content, fsync, expected_version)
             return True, filepath
         except Exception as e:
             return False, str(e)
     
     def generate_report_content(self, date_input: str, cash_counts: List[int], 
                               receipt_amounts: List[float], additional_cash_entries: List[Dict[str, Any]],
-                              expected_takings: float, calculator: CashUpCalculator) -> str:
-        """Generate formatted report content"""
-        analysis = calculator.calculate_float_analysis(cash_counts, receipt_amounts, 
-                                                     additional_cash_entries, expected_takings)
-        bagging = calculator.generate_bagging_instructions(analysis, cash_counts)
+                              expected_takings: float, calculator: CashUpCalculator,
+                              analysis: Dict[str, Any] = None, bagging: Dict[str, Any] = None) -> str:
+        """Generate formatted report content
+        
+        Pass analysis and bagging when they have already been calculated for these
+        inputs to skip recalculating them.
+        """
+        if analysis is None:
+            analysis = calculator.calculate_float_analysis(cash_counts, receipt_amounts, 
+                                                         additional_cash_entries, expected_takings)
+        if bagging is None:
+            bagging = calculator.generate_bagging_instructions(analysis, cash_counts)
         
         report_lines = []
         report_lines.append("="*60)
@@ -135,10 +377,9 @@ class ReportGenerator:
         
         # Cash breakdown
         report_lines.append("\nCASH BREAKDOWN:")
-        for i, (denom, count, value) in enumerate(zip(calculator.denominations, cash_counts, calculator.values)):
+        for i, (denom, count, value) in enumerate(zip(calculator.denominations, cash_counts, calculator.values_pence)):
             if count > 0:
-                total_value = count * value
-                line = f"  {denom}: {count} × £{value:.2f} = £{total_value:.2f}"
+                line = f"  {denom}: {count} × £{to_pounds(value):.2f} = £{to_pounds(count * value):.2f}"
                 report_lines.append(line)
         report_lines.append(f"  Total Cash: £{analysis['total_cash']:.2f}")
         
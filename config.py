@@ -12,9 +12,62 @@ class Config:
     
     # Report settings
     REPORTS_DIR = "Reports"
+    RECORD_LOG_DIR = "Records"  # binary per-year logs of saved figures (record_log.py)
     
-    # Database settings (for future use)
+    # POS export import (pos_import.py); totals and checkpoint are committed every N rows
+    POS_COMMIT_ROWS = 200000
+    
+    # Input journal settings (in-progress cash ups survive a crash; input_journal.py)
+    JOURNAL_DIR = "Journal"
+    JOURNAL_FSYNC = os.environ.get('CASHUP_JOURNAL_FSYNC', '').lower() in ('1', 'true', 'yes')
+    JOURNAL_COMPACT_BYTES = 64 * 1024
+    
+    # Production web server settings (launcher.py --serve / server.py)
+    SERVE_HOST = os.environ.get('CASHUP_HOST') or '0.0.0.0'
+    SERVE_PORT = int(os.environ.get('CASHUP_PORT') or 5001)
+    SERVE_WORKERS = int(os.environ.get('CASHUP_WORKERS') or 2)
+    
+    # Report writer settings (saves run on background threads)
+    REPORT_WRITER_WORKERS = 1
+    REPORT_WRITER_QUEUE_SIZE = 32
+    REPORT_FSYNC = os.environ.get('CASHUP_REPORT_FSYNC', '').lower() in ('1', 'true', 'yes')
+    REPORT_STATUS_DIR = "SaveStatus"  # save job status shared by the server workers
+    REPORT_STATUS_TTL = 86400         # seconds a finished job's status can still be polled
+    
+    # Result cache settings (calculations reused between /calculate and /save_report)
+    RESULT_CACHE_SIZE = 256
+    RESULT_CACHE_TTL = 3600  # seconds
+    
+    # Tills accepted by one /api/calculate/batch request, so a big batch can't hold up a worker
+    MAX_BATCH_TILLS = int(os.environ.get('CASHUP_MAX_BATCH_TILLS') or 500)
+    
+    # Profiling hooks (off unless CASHUP_PROFILE is set; cProfile samples 1 call in N)
+    PROFILING = os.environ.get('CASHUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+    PROFILE_SAMPLE_EVERY = int(os.environ.get('CASHUP_PROFILE_SAMPLE_EVERY', '50'))
+    PROFILE_DIR = "Profiles"
+    
+    # Desktop app: full recalculation runs once typing pauses for this long
+    DESKTOP_RECALC_DELAY_MS = 150
+    DESKTOP_HISTORY_DAYS = 31
+    
+    # Archive migration (report_index.py migrate): files committed per transaction
+    MIGRATE_BATCH_FILES = 2000
+    
+    # Report search (web /search and report_index.py search)
+    SEARCH_RESULT_LIMIT = 100
+    
+    # Anomaly detection on over/short results (see analytics.AnomalyDetector)
+    ANOMALY_WINDOW = 12          # recent values kept per weekday
+    ANOMALY_EWMA_ALPHA = 0.1
+    ANOMALY_THRESHOLD = 3.5      # robust z-score
+    ANOMALY_MIN_SAMPLES = 5
+    ANOMALY_MIN_SPREAD = 1.00    # pounds; floor on the spread so steady tills don't flag pennies
+    
+    # Database settings (report index, analytics, POS takings and saved cash ups; database.py)
     DATABASE_URL = os.environ.get('DATABASE_URL') or 'sqlite:///cash_up.db'
+    DATABASE_BUSY_TIMEOUT = 5.0      # seconds a writer waits for another writer
+    DATABASE_STATEMENT_CACHE = 128   # prepared statements kept per connection
+    DATABASE_POOL_SIZE = int(os.environ.get('CASHUP_DB_POOL_SIZE') or 8)
     
     # Application settings
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
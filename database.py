@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Pooled SQLite storage for saved cash ups
+
+Config.DATABASE_URL names one SQLite file shared by the web workers, the
+desktop app and the CLI. ConnectionPool lends out a bounded set of
+connections (reopened in a forked server worker) with WAL journaling, so
+readers never wait for a writer, and a per-connection statement cache, so
+repeated queries are prepared once. CashUpRepository keeps each saved cash up as one row next
+to its text report; a save is a single short transaction.
+"""
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from cash_up_core import to_pence, to_pounds
+from config import Config
+
+CASH_UP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cash_ups (
+    date TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    saved_at REAL NOT NULL,
+    source TEXT,
+    report_path TEXT,
+    counts TEXT NOT NULL,
+    receipts TEXT NOT NULL,
+    additional_cash TEXT NOT NULL,
+    expected_takings INTEGER NOT NULL,
+    total_cash INTEGER NOT NULL,
+    total_receipts INTEGER NOT NULL,
+    total_additional_cash INTEGER NOT NULL,
+    total_in_till INTEGER NOT NULL,
+    difference INTEGER NOT NULL,
+    amount_to_remove INTEGER NOT NULL,
+    pos_takings INTEGER
+);
+"""
+
+FIGURES = ('expected_takings', 'total_cash', 'total_receipts', 'total_additional_cash',
+           'total_in_till', 'difference', 'amount_to_remove')
+
+_SAVE = f"""
+    INSERT INTO cash_ups (date, version, saved_at, source, report_path, counts, receipts, additional_cash,
+                          {', '.join(FIGURES)}, pos_takings)
+    VALUES (?, COALESCE(?, 1), ?, ?, ?, ?, ?, ?, {', '.join('?' for _ in FIGURES)}, ?)
+    ON CONFLICT (date) DO UPDATE SET
+        version = COALESCE(?, version + 1),
+        {', '.join(f'{column} = excluded.{column}' for column in
+                   ('saved_at', 'source', 'report_path', 'counts', 'receipts', 'additional_cash') + FIGURES + ('pos_takings',))}
+    RETURNING version
+"""
+
+def sqlite_path_from_url(database_url: str) -> str:
+    """Turn a sqlite:///path URL into a filesystem path for sqlite3.connect"""
+    if database_url.startswith('sqlite:///'):
+        return database_url[len('sqlite:///'):]
+    if database_url.startswith('sqlite://'):
+        return database_url[len('sqlite://'):] or ':memory:'
+    raise ValueError(f"Unsupported database URL: {database_url}")
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open a connection set up the way every store in the app expects"""
+    conn = sqlite3.connect(db_path, timeout=Config.DATABASE_BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=Config.DATABASE_STATEMENT_CACHE)
+    conn.row_factory = sqlite3.Row
+    if db_path != ':memory:':
+        # Readers see the last commit while a writer works; commits skip the fsync of
+        # rollback journaling and are made durable at checkpoints
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class ConnectionPool:
+    """At most Config.DATABASE_POOL_SIZE SQLite connections, checked out per use
+
+    Threads borrow a connection for one query or transaction and hand it back,
+    so a threaded server that starts a thread per request reuses the same few
+    connections instead of opening one per thread.
+    """
+
+    def __init__(self, database_url: str = None, size: int = None):
+        self.db_path = sqlite_path_from_url(database_url or Config.DATABASE_URL)
+        self.size = size or Config.DATABASE_POOL_SIZE
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Connections inherited across a fork belong to the parent; leave them be
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the with block"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            idle = self._idle
+            try:
+                conn = idle.get_nowait()
+            except queue.Empty:
+                conn = None
+                if self._opened < self.size:
+                    self._opened += 1
+                    try:
+                        conn = connect(self.db_path)
+                    except BaseException:
+                        self._opened -= 1
+                        raise
+        if conn is None:
+            try:
+                conn = idle.get(timeout=Config.DATABASE_BUSY_TIMEOUT)
+            except queue.Empty:
+                raise sqlite3.OperationalError(f"No database connection free after {Config.DATABASE_BUSY_TIMEOUT}s")
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction on a borrowed connection, taking the write lock up front"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        """Close the idle connections this process opened"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+                return
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
+
+class CashUpRepository:
+    """Saved cash ups in the database, one versioned row per date"""
+
+    def __init__(self, pool: ConnectionPool = None):
+        self.pool = pool or ConnectionPool()
+        with self.pool.connection() as conn:
+            conn.executescript(CASH_UP_SCHEMA)
+
+    def close(self):
+        self.pool.close()
+
+    def save(self, day_date: str, cash_counts: List[int], receipt_amounts: List[int],
+             additional_cash_entries: List[Dict[str, Any]], figures: Dict[str, int],
+             report_path: str = None, source: str = None, version: int = None) -> int:
+        """Insert or replace one day (YYYY-MM-DD; amounts in pence), returning its new version
+        
+        version, when given, is the report file's version from date_locks; otherwise
+        the row's own version is bumped.
+        """
+        row = (day_date, version, time.time(), source, report_path,
+               json.dumps([int(count) for count in cash_counts]),
+               json.dumps([int(amount) for amount in receipt_amounts]),
+               json.dumps([{'title': entry['title'], 'amount': int(entry['amount'])}
+                           for entry in additional_cash_entries]),
+               *(int(figures[figure]) for figure in FIGURES), figures.get('pos_takings'), version)
+        with self.pool.transaction() as conn:
+            return conn.execute(_SAVE, row).fetchall()[0][0]
+
+    def save_analysis(self, date_input: str, cash_counts: List[int], receipt_amounts: List[float],
+                      additional_cash_entries: List[Dict[str, Any]], analysis: Dict[str, Any],
+                      report_path: str = None, source: str = None, version: int = None) -> int:
+        """save() for a DD/MM/YYYY date, amounts in pounds and a calculate_float_analysis result"""
+        day_date = datetime.strptime(date_input, '%d/%m/%Y').strftime('%Y-%m-%d')
+        return self.save(day_date, cash_counts, [to_pence(amount) for amount in receipt_amounts],
+                         [{'title': entry['title'], 'amount': to_pence(entry['amount'])}
+                          for entry in additional_cash_entries],
+                         analysis['pence'], report_path, source, version)
+
+    def get(self, day_date: str) -> Optional[Dict[str, Any]]:
+        """One saved day (YYYY-MM-DD) with its counts, receipts and additional cash, amounts in pence"""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT * FROM cash_ups WHERE date = ?", (day_date,)).fetchone()
+        if row is None:
+            return None
+        day = dict(row)
+        for column in ('counts', 'receipts', 'additional_cash'):
+            day[column] = json.loads(day[column])
+        return day
+
+    def version(self, day_date: str) -> int:
+        """Current version of a saved day, 0 if it has never been saved"""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT version FROM cash_ups WHERE date = ?", (day_date,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def days_between(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """Summary figures for every saved day in [start_date, end_date]"""
+        with self.pool.connection() as conn:
+            return [dict(row) for row in conn.execute(
+                f"SELECT date, version, saved_at, source, {', '.join(FIGURES)} FROM cash_ups "
+                f"WHERE date BETWEEN ? AND ? ORDER BY date", (start_date, end_date))]
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Saved cash ups in the database")
+    parser.add_argument('--database-url', default=Config.DATABASE_URL)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show_parser = subparsers.add_parser('show', help="Show the saved cash ups between two dates")
+    show_parser.add_argument('start', help="YYYY-MM-DD")
+    show_parser.add_argument('end', nargs='?', help="YYYY-MM-DD (default: start)")
+    args = parser.parse_args(argv)
+
+    repository = CashUpRepository(ConnectionPool(args.database_url))
+    try:
+        days = repository.days_between(args.start, args.end or args.start)
+        for day in days:
+            print(f"{day['date']} v{day['version']} ({day['source'] or 'unknown'}): "
+                  f"over/short £{to_pounds(day['difference']):+.2f}, expected £{to_pounds(day['expected_takings']):.2f}, "
+                  f"in till £{to_pounds(day['total_in_till']):.2f}")
+        print(f"{len(days)} saved cash ups")
+    finally:
+        repository.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Per-date save locks and report versions
+
+Every report file has a hidden companion lock file next to it
+(Reports/YYYY/MM/.Cash_Up_DD-MM-YYYY.txt.lock). Saving a date takes an
+exclusive advisory lock on that file only, so the web workers, the desktop
+app and the CLI queue up behind each other for the same day while different
+days never contend. The lock file also holds the report's version, bumped on
+every save: a front end that remembers the version it started from can ask
+for the save to be refused if someone else has saved the day since.
+"""
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class VersionConflict(Exception):
+    """Raised when a date has been saved since the version a save was based on"""
+
+    def __init__(self, date_input: str, version: int, expected_version: int):
+        super().__init__(f"The cash up for {date_input} was already saved at version {version} "
+                         f"(this one was based on version {expected_version})")
+        self.date_input = date_input
+        self.version = version
+        self.expected_version = expected_version
+
+def lock_path(report_path: str) -> str:
+    directory, filename = os.path.split(report_path)
+    return os.path.join(directory, f".{filename}.lock")
+
+def _version(text: bytes, report_path: str) -> int:
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    # No version recorded yet: a report saved before versioning counts as version 1
+    return 1 if os.path.exists(report_path) else 0
+
+def report_version(report_path: str) -> int:
+    """Current version of a report, 0 if it has never been saved (read without locking)"""
+    try:
+        with open(lock_path(report_path), 'rb') as f:
+            return _version(f.read(32), report_path)
+    except FileNotFoundError:
+        return _version(b'', report_path)
+
+@contextmanager
+def _exclusive(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return
+    while True:
+        try:
+            # Locks the first byte; LK_LOCK itself gives up after ten seconds
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            break
+        except OSError:
+            continue
+    try:
+        yield
+    finally:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def locked_report(report_path: str, date_input: str, expected_version: int = None, fsync: bool = False):
+    """Hold the date's lock while the caller writes report_path, yielding the version being written
+
+    Raises VersionConflict if expected_version is given and the report has moved
+    past it. The new version is recorded only if the body completes.
+    """
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    fd = os.open(lock_path(report_path), os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        with _exclusive(fd):
+            version = _version(os.read(fd, 32), report_path)
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(date_input, version, expected_version)
+            yield version + 1
+            data = f"{version + 1}\n".encode('ascii')
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, data)
+            os.ftruncate(fd, len(data))
+            if fsync:
+                os.fsync(fd)
+    finally:
+        os.close(fd)
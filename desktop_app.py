@@ -3,10 +3,21 @@ Desktop GUI application for Cash Up using tkinter
 """
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-from cash_up_core import CashUpCalculator, ReportGenerator
+import profiling
+from analytics import AnomalyDetector, RollupStore
+from cash_up_core import CashUpCalculator, ReportGenerator, RunningTotals, to_pence, to_pounds
 from config import Config
+from database import CashUpRepository
+from input_journal import InputJournal, has_input
+from pos_import import PosTakings
+from record_log import RecordLog
+from report_index import ReportIndex
+from report_writer import ReportWriter, WriterBusyError
+from task_runner import TaskRunner
+
+profiling.instrument_core(CashUpCalculator, ReportGenerator)
 
 class CashUpDesktopApp:
     def __init__(self, root):
@@ -34,6 +45,28 @@ class CashUpDesktopApp:
             'DEFAULT_FLOAT': Config.DEFAULT_FLOAT
         })
         self.report_generator = ReportGenerator(Config.REPORTS_DIR)
+        self.rollup_store = RollupStore(Config.DATABASE_URL)
+        self.anomaly_detector = AnomalyDetector(Config.DATABASE_URL)
+        self.pos_takings = PosTakings(Config.DATABASE_URL)
+        self.pos_expected = None
+        self.record_log = RecordLog(Config.RECORD_LOG_DIR, fsync=Config.REPORT_FSYNC)
+        self.cash_up_repository = CashUpRepository()
+        self.report_writer = ReportWriter(self.report_generator, workers=Config.REPORT_WRITER_WORKERS,
+                                          max_queue=Config.REPORT_WRITER_QUEUE_SIZE, fsync=Config.REPORT_FSYNC,
+                                          on_saved=self.record_saved_report)
+        
+        # Saves and history loading run on a worker thread, reported back via root.after
+        self.tasks = TaskRunner(self.root)
+        self.current_task = None
+        
+        # Every input is journalled first so a crash mid-count loses nothing
+        self.journal = InputJournal('desktop')
+        self.journal_paused = False
+        
+        # Totals are kept current field by field; the full analysis is debounced
+        self.totals = RunningTotals(self.calculator.values_pence)
+        self.recalculate_job = None
+        self.results_shown = False
         
         # Initialize variables
         self.cash_counts = [tk.IntVar() for _ in range(len(self.calculator.denominations))]
@@ -46,7 +79,16 @@ class CashUpDesktopApp:
         self.date_var.set(datetime.now().strftime("%d/%m/%Y"))
         
         self.create_widgets()
+        for i, var in enumerate(self.cash_counts):
+            var.trace_add('write', lambda *args, idx=i: self.on_count_changed(idx))
+        self.expected_takings_var.trace_add('write', lambda *args: self.on_expected_takings_changed())
+        self.date_var.trace_add('write', lambda *args: self.on_date_changed())
         self.update_totals()
+        self.offer_journal_restore()
+        self.load_pos_takings()
+        
+        if profiling.enabled():
+            self.root.bind('<Control-P>', lambda e: self.dump_profile())
     
     def create_widgets(self):
         # Configure ttk styles for dark theme
@@ -93,7 +135,6 @@ class CashUpDesktopApp:
             ttk.Label(cash_frame, text=f"{denom}:", style='Dark.TLabel').grid(row=row, column=col, sticky=tk.W, padx=(0, 5))
             entry = ttk.Entry(cash_frame, textvariable=self.cash_counts[i], width=8, style='Dark.TEntry')
             entry.grid(row=row, column=col+1, sticky=tk.W, padx=(0, 20))
-            entry.bind('<KeyRelease>', lambda e: self.update_totals())
             entry.bind('<KeyPress>', lambda e, idx=i: self.handle_cash_input_keys(e, idx))
             self.cash_entries.append(entry)
         
@@ -203,7 +244,11 @@ class CashUpDesktopApp:
         ttk.Label(expected_frame, text="Expected Takings:", style='Dark.TLabel').grid(row=0, column=0, sticky=tk.W, pady=2)
         expected_entry = ttk.Entry(expected_frame, textvariable=self.expected_takings_var, width=15, style='Dark.TEntry')
         expected_entry.grid(row=0, column=1, sticky=tk.W, pady=2)
-        expected_entry.bind('<KeyRelease>', lambda e: self.update_totals())
+        self.pos_label = ttk.Label(expected_frame, text="", style='Dark.TLabel')
+        self.pos_label.grid(row=0, column=2, sticky=tk.W, padx=(10, 0), pady=2)
+        
+        self.live_result_label = ttk.Label(expected_frame, text="", font=('Monaco', 10, 'bold'), style='Dark.TLabel')
+        self.live_result_label.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
         
         # Results section
         results_frame = ttk.LabelFrame(main_frame, text="Results", padding="10", style='Dark.TLabelFrame')
@@ -229,8 +274,23 @@ class CashUpDesktopApp:
                   command=self.calculate, style='Dark.TButton').pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(button_frame, text="Save Report", 
                   command=self.save_report, style='Dark.TButton').pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="History", 
+                  command=self.show_history, style='Dark.TButton').pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(button_frame, text="Clear All", 
                   command=self.clear_all, style='Dark.TButton').pack(side=tk.LEFT)
+        
+        # Background task progress
+        status_frame = ttk.Frame(main_frame, style='Dark.TFrame')
+        status_frame.grid(row=8, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        status_frame.columnconfigure(1, weight=1)
+        
+        self.progress = ttk.Progressbar(status_frame, length=200, maximum=100, mode='determinate')
+        self.progress.grid(row=0, column=0, padx=(0, 10))
+        self.status_label = ttk.Label(status_frame, text="", font=('Monaco', 9), style='Dark.TLabel')
+        self.status_label.grid(row=0, column=1, sticky=tk.W)
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", command=self.cancel_task,
+                                        style='Dark.TButton', state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=2)
     
     def add_receipt(self):
         try:
@@ -239,10 +299,13 @@ class CashUpDesktopApp:
                 messagebox.showerror("Error", "Please enter a positive amount.")
                 return
             
+            self.journal_event('receipt', index=len(self.receipt_amounts), amount=amount)
             self.receipt_amounts.append(amount)
+            self.totals.add_receipt(amount)
             self.receipts_listbox.insert(tk.END, f"Receipt #{len(self.receipt_amounts)}: £{amount:.2f}")
             self.receipt_entry.delete(0, tk.END)
             self.update_totals()
+            self.schedule_recalculate()
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid amount.")
     
@@ -250,13 +313,15 @@ class CashUpDesktopApp:
         selection = self.receipts_listbox.curselection()
         if selection:
             index = selection[0]
+            self.journal_event('receipt_remove', index=index)
             self.receipt_amounts.pop(index)
-            self.receipts_listbox.delete(index)
-            # Update display numbers
-            self.receipts_listbox.delete(0, tk.END)
-            for i, amount in enumerate(self.receipt_amounts):
-                self.receipts_listbox.insert(tk.END, f"Receipt #{i+1}: £{amount:.2f}")
+            self.totals.remove_receipt(index)
+            # Renumber only the receipts after the removed one
+            self.receipts_listbox.delete(index, tk.END)
+            for i in range(index, len(self.receipt_amounts)):
+                self.receipts_listbox.insert(tk.END, f"Receipt #{i+1}: £{self.receipt_amounts[i]:.2f}")
             self.update_totals()
+            self.schedule_recalculate()
     
     def add_additional_cash(self):
         try:
@@ -269,11 +334,14 @@ class CashUpDesktopApp:
                 messagebox.showerror("Error", "Please enter a positive amount.")
                 return
             
+            self.journal_event('additional', index=len(self.additional_cash_entries), title=title, amount=amount)
             self.additional_cash_entries.append({'title': title, 'amount': amount})
+            self.totals.add_additional_cash(amount)
             self.additional_cash_listbox.insert(tk.END, f"{title}: £{amount:.2f}")
             self.additional_cash_title_entry.delete(0, tk.END)
             self.additional_cash_amount_entry.delete(0, tk.END)
             self.update_totals()
+            self.schedule_recalculate()
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid amount.")
     
@@ -281,18 +349,16 @@ class CashUpDesktopApp:
         selection = self.additional_cash_listbox.curselection()
         if selection:
             index = selection[0]
+            self.journal_event('additional_remove', index=index)
             self.additional_cash_entries.pop(index)
+            self.totals.remove_additional_cash(index)
             self.additional_cash_listbox.delete(index)
             self.update_totals()
+            self.schedule_recalculate()
     
     def handle_cash_input_keys(self, event, input_index):
         """Handle key presses for cash input fields"""
-        current_value = self.cash_counts[input_index].get()
-        try:
-            current_value = int(current_value) if current_value else 0
-        except ValueError:
-            current_value = 0
-        
+        current_value = self.totals.counts[input_index]
         new_value = current_value
         
         if event.keysym == 'space':
@@ -306,36 +372,140 @@ class CashUpDesktopApp:
         else:
             return  # Let other keys work normally
         
+        # The variable trace updates the totals; 'break' stops the key also being typed
         self.cash_counts[input_index].set(new_value)
+        return 'break'
+    
+    def on_count_changed(self, index):
+        try:
+            count = self.cash_counts[index].get()
+        except tk.TclError:
+            # Empty or part-typed field counts as zero until it parses
+            count = 0
+        if self.totals.set_count(index, max(0, count)):
+            self.journal_event('count', index=index, value=max(0, count))
+        self.update_totals()
+        self.schedule_recalculate()
+    
+    def on_date_changed(self):
+        self.journal_event('date', value=self.date_var.get())
+        self.load_pos_takings()
+    
+    def load_pos_takings(self):
+        """Show the imported POS takings for the date, pre-filling expected takings if still empty"""
+        try:
+            self.pos_expected = self.pos_takings.takings_for_input(self.date_var.get())
+        except Exception as e:
+            print(f"Warning: could not read POS takings: {e}")
+            self.pos_expected = None
+        if self.pos_expected is None:
+            self.pos_label.config(text="")
+            return
+        self.pos_label.config(text=f"POS export: £{self.pos_expected:.2f}")
+        if self.expected_takings_pence() == 0:
+            self.expected_takings_var.set(self.pos_expected)
+    
+    def on_expected_takings_changed(self):
+        try:
+            self.journal_event('expected', value=self.expected_takings_var.get())
+        except tk.TclError:
+            pass  # Part-typed; journalled once it parses
         self.update_totals()
+        self.schedule_recalculate()
+    
+    def journal_event(self, op, **fields):
+        if self.journal_paused:
+            return
+        try:
+            self.journal.record(op, **fields)
+        except (OSError, ValueError) as e:
+            # The journal is a safety net; never let it get in the way of counting
+            print(f"Warning: could not journal {op}: {e}")
+    
+    def offer_journal_restore(self):
+        """Offer to bring back a cash up that was in progress when the app last closed"""
+        state = self.journal.replay()
+        if not has_input(state):
+            return
+        when = datetime.fromtimestamp(state['updated_at']).strftime('%d/%m/%Y %H:%M') if state['updated_at'] else 'earlier'
+        if not messagebox.askyesno("Restore", f"Restore the unsaved cash up from {when}?"):
+            self.journal.clear()
+            return
+        self.journal_paused = True
+        try:
+            if state['date']:
+                self.date_var.set(state['date'])
+            for var, count in zip(self.cash_counts, state['counts']):
+                var.set(count or 0)
+            for amount in state['receipts']:
+                self.receipt_amounts.append(amount)
+                self.totals.add_receipt(amount)
+                self.receipts_listbox.insert(tk.END, f"Receipt #{len(self.receipt_amounts)}: £{amount:.2f}")
+            for entry in state['additional_cash_entries']:
+                self.additional_cash_entries.append(dict(entry))
+                self.totals.add_additional_cash(entry['amount'])
+                self.additional_cash_listbox.insert(tk.END, f"{entry['title']}: £{entry['amount']:.2f}")
+            self.expected_takings_var.set(state['expected_takings'] or 0)
+        finally:
+            self.journal_paused = False
+        self.update_totals()
+    
+    def expected_takings_pence(self):
+        try:
+            return to_pence(self.expected_takings_var.get())
+        except tk.TclError:
+            return 0
     
     def update_totals(self):
-        # Calculate cash total
-        total_cash = self.calculator.calculate_denomination_total([var.get() for var in self.cash_counts])
-        self.cash_total_label.config(text=f"Total Cash: £{total_cash:.2f}")
-        
-        # Calculate receipts total
-        total_receipts = sum(self.receipt_amounts) if self.receipt_amounts else 0
-        self.receipts_total_label.config(text=f"Total Receipts: £{total_receipts:.2f}")
-        
-        # Calculate additional cash total
-        total_additional_cash = sum(entry['amount'] for entry in self.additional_cash_entries) if self.additional_cash_entries else 0
-        self.additional_cash_total_label.config(text=f"Total Additional Cash: £{total_additional_cash:.2f}")
+        """Refresh the total labels from the running totals; no re-summing"""
+        self.cash_total_label.config(text=f"Total Cash: £{to_pounds(self.totals.cash_pence):.2f}")
+        self.receipts_total_label.config(text=f"Total Receipts: £{to_pounds(self.totals.receipts_total_pence):.2f}")
+        self.additional_cash_total_label.config(
+            text=f"Total Additional Cash: £{to_pounds(self.totals.additional_cash_total_pence):.2f}")
+        
+        difference = self.totals.difference_pence(self.expected_takings_pence(), self.calculator.default_float_pence)
+        if difference > 0:
+            live_result = f"OVER by £{to_pounds(difference):.2f}"
+        elif difference < 0:
+            live_result = f"SHORT by £{to_pounds(-difference):.2f}"
+        else:
+            live_result = "EXACT BALANCE"
+        self.live_result_label.config(
+            text=f"In till: £{to_pounds(self.totals.total_in_till_pence):.2f}  Result: {live_result}")
+    
+    def schedule_recalculate(self):
+        """Re-run the full analysis once input pauses, rather than on every key press"""
+        if self.recalculate_job is not None:
+            self.root.after_cancel(self.recalculate_job)
+        self.recalculate_job = self.root.after(Config.DESKTOP_RECALC_DELAY_MS, self.recalculate)
+    
+    def recalculate(self):
+        self.recalculate_job = None
+        # Only keep the results panel live once the user has asked for results
+        if not self.results_shown:
+            return
+        try:
+            self.expected_takings_var.get()
+        except tk.TclError:
+            return  # Expected takings is part-typed; wait for the next edit
+        self.calculate()
     
     def calculate(self):
         try:
             # Get values
-            cash_counts = [var.get() for var in self.cash_counts]
+            cash_counts = list(self.totals.counts)
             expected_takings = self.expected_takings_var.get()
             
             # Calculate analysis
             analysis = self.calculator.calculate_float_analysis(
-                cash_counts, self.receipt_amounts, self.additional_cash_entries, expected_takings
+                cash_counts, self.receipt_amounts, self.additional_cash_entries, expected_takings,
+                pos_takings=self.pos_expected
             )
             bagging = self.calculator.generate_bagging_instructions(analysis, cash_counts)
             
             # Display results
             self.display_results(analysis, bagging)
+            self.results_shown = True
             
         except Exception as e:
             messagebox.showerror("Error", f"Error in calculation: {str(e)}")
@@ -346,6 +516,16 @@ class CashUpDesktopApp:
         result = f"CASH UP RESULTS - {self.date_var.get()}\n"
         result += "=" * 50 + "\n\n"
         
+        try:
+            anomalies = self.anomaly_detector.check(self.date_var.get(), analysis)
+        except Exception:
+            anomalies = []  # Alerts are advisory; a bad date is reported when saving
+        if anomalies:
+            result += "⚠ UNUSUAL RESULT - please double check the count:\n"
+            for anomaly in anomalies:
+                result += f"  - {anomaly['message']}\n"
+            result += "\n"
+        
         # Summary
         result += "SUMMARY:\n"
         result += f"Total Cash: £{analysis['total_cash']:.2f}\n"
@@ -358,6 +538,13 @@ class CashUpDesktopApp:
         result += "FLOAT ANALYSIS:\n"
         result += f"Starting Float: £{self.calculator.default_float:.2f}\n"
         result += f"Expected Takings: £{analysis['expected_takings']:.2f}\n"
+        if 'pos_takings' in analysis:
+            if analysis['pos_matches']:
+                result += f"POS Takings: £{analysis['pos_takings']:.2f} (matches)\n"
+            else:
+                result += (f"POS Takings: £{analysis['pos_takings']:.2f} "
+                           f"(expected takings differ by {'-' if analysis['pos_difference'] < 0 else '+'}"
+                           f"£{abs(analysis['pos_difference']):.2f}) ⚠\n")
         
         if analysis['is_exact']:
             result += "Result: EXACT BALANCE ✅\n\n"
@@ -388,33 +575,147 @@ class CashUpDesktopApp:
         
         self.results_text.insert(1.0, result)
     
+    def record_saved_report(self, job):
+        # Runs on the writer thread once the report is on disk
+        self.cash_up_repository.save_analysis(job.date_input, analysis=job.analysis, report_path=job.path,
+                                              source='desktop', version=job.version, **job.inputs)
+        self.record_log.append_analysis(job.date_input, analysis=job.analysis, **job.inputs)
+        self.rollup_store.record_analysis(job.date_input, job.analysis)
+        self.anomaly_detector.observe_analysis(job.date_input, job.analysis)
+    
+    def run_task(self, name, func, on_done, on_error):
+        """Run func(task) on the worker thread with the progress bar and Cancel button live"""
+        if self.current_task is not None:
+            messagebox.showinfo("Busy", f"Please wait for {self.current_task.name} to finish, or cancel it.")
+            return
+        self.current_task = self.tasks.submit(
+            name, func,
+            on_done=lambda result: self.end_task(on_done, result),
+            on_error=lambda error: self.end_task(on_error, error),
+            on_progress=self.show_progress,
+            on_cancelled=lambda: self.end_task(None, None, f"{name.capitalize()} cancelled"))
+        self.cancel_button.config(state=tk.NORMAL)
+        self.show_progress(None, f"{name.capitalize()}...")
+    
+    def show_progress(self, fraction, message):
+        if fraction is None:
+            if str(self.progress.cget('mode')) != 'indeterminate':
+                self.progress.config(mode='indeterminate')
+                self.progress.start(15)
+        else:
+            self.progress.stop()
+            self.progress.config(mode='determinate', value=fraction * 100)
+        self.status_label.config(text=message)
+    
+    def end_task(self, callback, payload, message=""):
+        self.current_task = None
+        self.progress.stop()
+        self.progress.config(mode='determinate', value=0)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_label.config(text=message)
+        if callback is not None:
+            callback(payload)
+    
+    def cancel_task(self):
+        if self.current_task is not None:
+            self.current_task.cancel()
+            self.status_label.config(text=f"Cancelling {self.current_task.name}...")
+    
     def save_report(self):
         try:
-            # Get values
-            cash_counts = [var.get() for var in self.cash_counts]
+            # Snapshot the inputs here; the worker must not touch Tk variables
+            date_input = self.date_var.get()
+            cash_counts = list(self.totals.counts)
+            receipt_amounts = list(self.receipt_amounts)
+            additional_cash_entries = [dict(entry) for entry in self.additional_cash_entries]
             expected_takings = self.expected_takings_var.get()
-            
-            # Generate report content
-            report_content = self.report_generator.generate_report_content(
-                self.date_var.get(), cash_counts, self.receipt_amounts,
-                self.additional_cash_entries, expected_takings, self.calculator
-            )
-            
-            # Save to file
-            success, result = self.report_generator.save_report_to_file(
-                self.date_var.get(), report_content
-            )
-            
-            if success:
-                messagebox.showinfo("Success", f"Report saved successfully to:\n{result}")
-            else:
-                messagebox.showerror("Error", f"Error saving report:\n{result}")
-                
+            report_version = self.report_generator.report_version(date_input)
         except Exception as e:
             messagebox.showerror("Error", f"Error saving report: {str(e)}")
+            return
+        if report_version and not messagebox.askyesno(
+                "Overwrite Report",
+                f"A cash up report for {date_input} has already been saved (version {report_version}).\n"
+                f"Do you want to replace it?"):
+            return
+        
+        def save(task):
+            analysis = self.calculator.calculate_float_analysis(
+                cash_counts, receipt_amounts, additional_cash_entries, expected_takings
+            )
+            task.report(0.3, "Generating report...")
+            report_content = self.report_generator.generate_report_content(
+                date_input, cash_counts, receipt_amounts,
+                additional_cash_entries, expected_takings, self.calculator, analysis=analysis
+            )
+            task.report(0.6, "Writing report...")
+            # Past this point the write is queued and can no longer be cancelled
+            job = self.report_writer.submit(date_input, report_content, analysis=analysis, inputs={
+                'cash_counts': cash_counts,
+                'receipt_amounts': receipt_amounts,
+                'additional_cash_entries': additional_cash_entries
+            }, expected_version=report_version)
+            return job.future.result()
+        
+        self.run_task("saving report", save, self.report_saved, self.report_save_failed)
+    
+    def report_saved(self, outcome):
+        success, result = outcome
+        if success:
+            self.journal.clear()
+            messagebox.showinfo("Success", f"Report saved successfully to:\n{result}")
+        else:
+            messagebox.showerror("Error", f"Error saving report:\n{result}")
+    
+    def report_save_failed(self, error):
+        if isinstance(error, WriterBusyError):
+            messagebox.showerror("Error", str(error))
+        else:
+            messagebox.showerror("Error", f"Error saving report: {str(error)}")
+    
+    def show_history(self):
+        end = datetime.now().date()
+        start = end - timedelta(days=Config.DESKTOP_HISTORY_DAYS - 1)
+        
+        def load(task):
+            index = ReportIndex(Config.REPORTS_DIR, Config.DATABASE_URL)
+            try:
+                def indexed(stats):
+                    if stats['scanned'] % 25 == 0:
+                        task.report(None, f"Indexing reports... {stats['scanned']} checked")
+                    else:
+                        task.check()
+                index.rescan(progress=indexed)
+                task.report(None, "Loading history...")
+                return index.days_between(start.isoformat(), end.isoformat())
+            finally:
+                index.close()
+        
+        self.run_task("loading history", load, self.display_history,
+                      lambda error: messagebox.showerror("Error", f"Error loading history: {str(error)}"))
+    
+    def display_history(self, days):
+        self.results_shown = False
+        self.results_text.delete(1.0, tk.END)
+        
+        result = f"HISTORY - {len(days)} cash ups in the last {Config.DESKTOP_HISTORY_DAYS} days\n"
+        result += "=" * 50 + "\n\n"
+        for day in days:
+            day_date = datetime.strptime(day['date'], '%Y-%m-%d').strftime('%d/%m/%Y')
+            result += (f"{day_date}  {day['result'] or '':<14} £{day['difference'] or 0:+8.2f}  "
+                       f"expected £{day['expected_takings'] or 0:.2f}, in till £{day['total_in_till'] or 0:.2f}\n")
+        if not days:
+            result += "No saved reports in this period.\n"
+        
+        self.results_text.insert(1.0, result)
+    
+    def dump_profile(self):
+        path = profiling.dump()
+        messagebox.showinfo("Profile", f"Profile written to:\n{path}")
     
     def clear_all(self):
         # Clear all inputs
+        self.journal_paused = True
         for var in self.cash_counts:
             var.set(0)
         
@@ -428,7 +729,14 @@ class CashUpDesktopApp:
         self.additional_cash_amount_entry.delete(0, tk.END)
         
         self.expected_takings_var.set(0)
-        
+        self.journal_paused = False
+        self.journal.clear()
+        
+        self.totals.clear()
+        self.results_shown = False
+        if self.recalculate_job is not None:
+            self.root.after_cancel(self.recalculate_job)
+            self.recalculate_job = None
         self.results_text.delete(1.0, tk.END)
         self.update_totals()
 
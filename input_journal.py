@@ -0,0 +1,211 @@
+"""
+Write-ahead journal of cash up input
+
+Each front end appends one small JSON line per input event - a count set, a
+receipt or additional cash entry added or removed, the date or expected
+takings changed - to Journal/<name>.jsonl before acting on it. If the browser
+tab, Tk window or terminal session dies mid-count, replaying the journal on
+restart rebuilds the half-finished cash up. Once the report is saved the
+journal is removed; long journals are compacted into a single snapshot line.
+
+Event lines:
+
+    {"op": "date", "value": "14/07/2025"}
+    {"op": "count", "index": 3, "value": 12}
+    {"op": "receipt", "index": 0, "amount": 4.5}         set (index == length appends)
+    {"op": "receipt_remove", "index": 0}
+    {"op": "additional", "index": 0, "title": "Air Hockey", "amount": 15.75}
+    {"op": "additional_remove", "index": 0}
+    {"op": "expected", "value": 250.0}
+    {"op": "snapshot", "state": {...}}                   written by compaction
+"""
+import json
+import os
+import re
+import time
+from typing import List, Dict, Any
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per journal
+    fcntl = None
+
+from cash_up_core import DENOMINATIONS, atomic_write
+from config import Config
+
+# Fields each front-end event must carry, with their types
+_FIELDS = {
+    'date': {'value': str},
+    'count': {'index': int, 'value': int},
+    'receipt': {'index': int, 'amount': float},
+    'receipt_remove': {'index': int},
+    'additional': {'index': int, 'title': str, 'amount': float},
+    'additional_remove': {'index': int},
+    'expected': {'value': float}
+}
+
+_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def empty_state() -> Dict[str, Any]:
+    """Inputs before anything has been entered; counts not yet entered are None"""
+    return {
+        'date': None,
+        'counts': [None] * len(DENOMINATIONS),
+        'receipts': [],
+        'additional_cash_entries': [],
+        'expected_takings': None,
+        'updated_at': None
+    }
+
+def has_input(state: Dict[str, Any]) -> bool:
+    """Whether a replayed state holds anything worth offering to restore"""
+    return (any(state['counts']) or any(state['receipts']) or bool(state['expected_takings'])
+            or any(entry['title'] or entry['amount'] for entry in state['additional_cash_entries']))
+
+def _index(event: Dict[str, Any], items: list, inserting: bool = False) -> int:
+    index = int(event['index'])
+    if not 0 <= index < len(items) + inserting:
+        raise ValueError(f"{event['op']} index {index} out of range")
+    return index
+
+def apply_event(state: Dict[str, Any], event: Dict[str, Any]):
+    """Fold one journal event into state, raising ValueError for a malformed event"""
+    op = event.get('op')
+    try:
+        if op == 'date':
+            state['date'] = str(event['value'])
+        elif op == 'count':
+            index = int(event['index'])
+            if not 0 <= index < len(state['counts']):
+                raise ValueError(f"count index {index} out of range")
+            state['counts'][index] = max(0, int(event['value']))
+        elif op == 'receipt':
+            receipts = state['receipts']
+            index = _index(event, receipts, inserting=True)
+            amount = round(float(event['amount']), 2)
+            if index == len(receipts):
+                receipts.append(amount)
+            else:
+                receipts[index] = amount
+        elif op == 'receipt_remove':
+            state['receipts'].pop(_index(event, state['receipts']))
+        elif op == 'additional':
+            entries = state['additional_cash_entries']
+            index = _index(event, entries, inserting=True)
+            entry = {'title': str(event['title']), 'amount': round(float(event['amount']), 2)}
+            if index == len(entries):
+                entries.append(entry)
+            else:
+                entries[index] = entry
+        elif op == 'additional_remove':
+            state['additional_cash_entries'].pop(_index(event, state['additional_cash_entries']))
+        elif op == 'expected':
+            state['expected_takings'] = round(float(event['value']), 2)
+        elif op == 'snapshot':
+            snapshot = event['state']
+            state.update({key: snapshot[key] for key in empty_state() if key in snapshot})
+        else:
+            raise ValueError(f"Unknown journal op '{op}'")
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed {op} event: {e}")
+    state['updated_at'] = event.get('at', state['updated_at'])
+
+def validate_event(event: Dict[str, Any], at: float) -> Dict[str, Any]:
+    """Check an incoming event's op and field types, returning the line to journal"""
+    if not isinstance(event, dict) or event.get('op') not in _FIELDS:
+        raise ValueError(f"Unknown journal op '{event.get('op') if isinstance(event, dict) else event}'")
+    line = {'op': event['op'], 'at': at}
+    for field, kind in _FIELDS[event['op']].items():
+        try:
+            line[field] = kind(event[field])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"{event['op']} event needs a valid {field}")
+    return line
+
+class InputJournal:
+    """Append-only journal of one front end's in-progress cash up"""
+
+    def __init__(self, name: str, directory: str = None, fsync: bool = None, compact_bytes: int = None):
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid journal name '{name}'")
+        self.name = name
+        self.directory = directory or Config.JOURNAL_DIR
+        self.fsync = Config.JOURNAL_FSYNC if fsync is None else fsync
+        self.compact_bytes = compact_bytes or Config.JOURNAL_COMPACT_BYTES
+        self.path = os.path.join(self.directory, f"{name}.jsonl")
+
+    def record(self, op: str, **fields):
+        """Append one event"""
+        self.record_many([dict(fields, op=op)])
+
+    def record_many(self, events: List[Dict[str, Any]]):
+        """Append a batch of events (validated first, so a bad batch writes nothing)"""
+        if not isinstance(events, list):
+            raise ValueError("Journal events must be a list")
+        now = time.time()
+        events = [validate_event(event, now) for event in events]
+        data = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events).encode('utf-8')
+        os.makedirs(self.directory, exist_ok=True)
+        fd = self._open_locked()
+        try:
+            os.write(fd, data)
+            if self.fsync:
+                os.fsync(fd)
+            size = os.fstat(fd).st_size
+            if size > self.compact_bytes:
+                self._compact_locked(fd)
+        finally:
+            os.close(fd)
+
+    def _open_locked(self) -> int:
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            if fcntl is None:
+                return fd
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Compaction in another process may have swapped the file while we waited
+            try:
+                if os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    def replay(self) -> Dict[str, Any]:
+        """Rebuild the in-progress inputs, skipping a torn final line or an event that no longer applies"""
+        state = empty_state()
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return state
+        for line in data.split(b'\n'):
+            if not line:
+                continue
+            try:
+                apply_event(state, json.loads(line))
+            except (ValueError, IndexError):
+                continue
+        return state
+
+    def compact(self):
+        """Rewrite the journal as a single snapshot of its current state"""
+        if not os.path.exists(self.path):
+            return
+        fd = self._open_locked()
+        try:
+            self._compact_locked(fd)
+        finally:
+            os.close(fd)
+
+    def _compact_locked(self, fd: int):
+        state = self.replay()
+        snapshot = {'op': 'snapshot', 'state': state, 'at': state['updated_at']}
+        atomic_write(self.path, json.dumps(snapshot, separators=(',', ':')) + '\n', fsync=self.fsync)
+
+    def clear(self):
+        """Drop the journal once its cash up has been saved or abandoned"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
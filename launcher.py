@@ -2,11 +2,41 @@
 """
 Cash Up Application Launcher
 Choose between web interface, desktop GUI, or command line
+
+Startup only probes for Flask and tkinter with importlib.util.find_spec, which
+finds a module without executing it; the front ends' heavy imports happen once
+one has been chosen. Run with --time-startup to see where startup time goes.
 """
+import time
+
+_STARTED = time.perf_counter()
+
 import sys
 import os
-import subprocess
-from pathlib import Path
+from functools import lru_cache
+from importlib.util import find_spec
+
+# (label, seconds since startup) checkpoints for --time-startup
+STARTUP_MARKS = []
+
+def mark_startup(label):
+    STARTUP_MARKS.append((label, time.perf_counter() - _STARTED))
+
+def startup_report():
+    lines = ["Startup timings:"]
+    previous = 0.0
+    for label, elapsed in STARTUP_MARKS:
+        lines.append(f"  {label:<28} {elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:.1f} ms)")
+        previous = elapsed
+    return "\n".join(lines)
+
+@lru_cache(maxsize=None)
+def module_available(name):
+    """Whether a module can be imported, without importing it"""
+    try:
+        return find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
 
 def show_menu():
     print("=" * 50)
@@ -17,18 +47,8 @@ def show_menu():
     print()
     
     # Check what's available
-    web_available = True
-    desktop_available = True
-    
-    try:
-        import flask
-    except ImportError:
-        web_available = False
-    
-    try:
-        import tkinter
-    except ImportError:
-        desktop_available = False
+    web_available = module_available('flask')
+    desktop_available = module_available('tkinter')
     
     if web_available:
         print("1. Web Interface (Flask)")
@@ -60,35 +80,37 @@ def show_menu():
     print("4. Exit")
     print()
 
-def launch_web():
-    """Launch the Flask web application"""
-    try:
-        import flask
-    except ImportError:
+def launch_web(workers=None):
+    """Launch the Flask web application on the production server"""
+    if not module_available('flask'):
         print("Flask is not available. Please install it first:")
         print("pip install flask")
         return
     
+    from config import Config
+    from server import serve
+    
     print("Starting web interface...")
-    print("The application will be available at: http://localhost:5001")
+    print(f"The application will be available at: http://localhost:{Config.SERVE_PORT}")
     print("Press Ctrl+C to stop the server")
     print()
     try:
-        subprocess.run([sys.executable, "app.py"], check=True)
+        serve(workers=workers)
     except KeyboardInterrupt:
-        print("\nWeb server stopped.")
+        pass
     except Exception as e:
         print(f"Error starting web interface: {e}")
+    print("\nWeb server stopped.")
 
 def launch_desktop():
     """Launch the desktop GUI application"""
-    try:
-        import tkinter
-    except ImportError:
+    if not module_available('tkinter'):
         print("Tkinter is not available. Desktop GUI cannot be launched.")
         print("Please install tkinter for your system.")
         return
     
+    import subprocess
+    
     print("Starting desktop application...")
     try:
         subprocess.run([sys.executable, "desktop_app.py"], check=True)
@@ -97,6 +119,8 @@ def launch_desktop():
 
 def launch_cli():
     """Launch the command line interface"""
+    import subprocess
+    
     print("Starting command line interface...")
     try:
         subprocess.run([sys.executable, "main.py"], check=True)
@@ -107,14 +131,10 @@ def check_dependencies():
     """Check if required dependencies are installed"""
     missing_deps = []
     
-    try:
-        import flask
-    except ImportError:
+    if not module_available('flask'):
         missing_deps.append("flask")
     
-    try:
-        import tkinter
-    except ImportError:
+    if not module_available('tkinter'):
         missing_deps.append("tkinter (desktop GUI will not be available)")
     
     if missing_deps:
@@ -130,6 +150,19 @@ def check_dependencies():
     return True
 
 def main():
+    mark_startup("launcher imported")
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Cash Up Application Launcher")
+    parser.add_argument('--serve', action='store_true',
+                        help="start the web interface on the production server without the menu")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="web server worker processes (default: Config.SERVE_WORKERS)")
+    parser.add_argument('--time-startup', action='store_true',
+                        help="print how long each startup step took once the menu is shown")
+    args = parser.parse_args()
+    mark_startup("arguments parsed")
+    
     # Check if we're in the right directory
     if not os.path.exists("main.py"):
         print("Error: Please run this script from the cash_up directory")
@@ -138,9 +171,18 @@ def main():
     # Check dependencies
     if not check_dependencies():
         sys.exit(1)
+    mark_startup("dependencies probed")
+    
+    if args.serve:
+        launch_web(args.workers)
+        return
     
     while True:
         show_menu()
+        if args.time_startup and STARTUP_MARKS[-1][0] != "menu shown":
+            mark_startup("menu shown")
+            print(startup_report())
+            print()
         choice = input("Enter your choice (1-4): ").strip()
         
         if choice == "1":
@@ -5,6 +5,19 @@ Handles counting coins, notes, receipts and calculates float differences
 """
 
 import os
+import profiling
+from analytics import AnomalyDetector, RollupStore
+from cash_up_core import CashUpCalculator, ReportGenerator, atomic_write, to_pence, to_pounds
+from database import CashUpRepository
+from date_locks import VersionConflict, locked_report, report_version
+from input_journal import InputJournal, empty_state, has_input
+from pos_import import PosTakings
+from record_log import RecordLog
+
+profiling.instrument_core(CashUpCalculator, ReportGenerator)
+
+calculator = CashUpCalculator()
+journal = InputJournal('terminal')
 
 def get_coin_count(denomination):
     """Get the count of a specific coin/note denomination"""
@@ -18,8 +31,8 @@ def get_coin_count(denomination):
         except ValueError:
             print("Please enter a valid number.")
 
-def get_receipt_amounts(receipt_count):
-    """Get the amounts for each receipt"""
+def get_receipt_amounts(receipt_count, on_amount=None):
+    """Get the amounts for each receipt, passing each to on_amount(index, amount) as it is entered"""
     receipt_amounts = []
     for i in range(receipt_count):
         while True:
@@ -29,6 +42,8 @@ def get_receipt_amounts(receipt_count):
                     print("Please enter a positive amount.")
                     continue
                 receipt_amounts.append(amount)
+                if on_amount is not None:
+                    on_amount(i, amount)
                 break
             except ValueError:
                 print("Please enter a valid amount.")
@@ -36,22 +51,31 @@ def get_receipt_amounts(receipt_count):
 
 def calculate_denomination_total(counts, values):
     """Calculate total value for given counts and denomination values"""
-    return sum(count * value for count, value in zip(counts, values))
+    return to_pounds(sum(count * to_pence(value) for count, value in zip(counts, values)))
 
-def suggest_change_removal(excess_amount, counts, values, denominations):
-    """Suggest which denominations to remove to get closest to target amount"""
-    suggestions = []
-    remaining = excess_amount
-    
-    # Work backwards from highest denomination
-    for i in range(len(denominations)-1, -1, -1):
-        if counts[i] > 0 and values[i] <= remaining:
-            remove_count = min(counts[i], int(remaining / values[i]))
-            if remove_count > 0:
-                suggestions.append((denominations[i], remove_count, remove_count * values[i]))
-                remaining -= remove_count * values[i]
+def till_totals_pence(counts, values, receipt_amounts, air_hockey_earnings, expected_takings, float_amount):
+    """The till's figures in whole pence, so OVER/SHORT/EXACT compares integers
     
-    return suggestions, remaining
+    Air hockey earnings count towards the actual total, as in the terminal's report layout.
+    """
+    total_cash = sum(count * to_pence(value) for count, value in zip(counts, values))
+    total_receipts = sum(to_pence(amount) for amount in receipt_amounts)
+    air_hockey = to_pence(air_hockey_earnings)
+    total_in_till = total_cash + total_receipts + air_hockey
+    expected_total = to_pence(float_amount) + to_pence(expected_takings)
+    amount_to_remove = total_in_till - to_pence(float_amount)
+    return {
+        'total_cash': total_cash,
+        'total_receipts': total_receipts,
+        'air_hockey': air_hockey,
+        'total_in_till': total_in_till,
+        'expected_takings': to_pence(expected_takings),
+        'expected_total': expected_total,
+        'difference': total_in_till - expected_total,
+        'amount_to_remove': amount_to_remove,
+        # Cash beyond the receipts and air hockey money that also leave the till
+        'cash_to_remove': amount_to_remove - total_receipts - air_hockey
+    }
 
 def review_and_modify_counts(denominations, counts, values):
     """Allow user to review and modify denomination counts"""
@@ -153,7 +177,10 @@ def review_and_modify_receipts(receipt_amounts):
     return receipt_amounts
 
 def save_report_to_file(date_input, report_content):
-    """Save the cash up report to a text file with organized folder structure"""
+    """Save the cash up report to a text file with organized folder structure
+    
+    Returns (path, version) once saved, or None.
+    """
     # Parse the date to create folder structure
     day, month, year = date_input.split('/')
     
@@ -170,47 +197,144 @@ def save_report_to_file(date_input, report_content):
     filepath = os.path.join(month_dir, filename)
     
     # Check if file already exists
-    if os.path.exists(filepath):
+    version = report_version(filepath)
+    if version:
         while True:
-            overwrite = input(f"\nA cash up report for {date_input} already exists.\nDo you want to overwrite it? (y/n): ").strip().lower()
+            overwrite = input(f"\nA cash up report for {date_input} already exists (version {version}).\nDo you want to overwrite it? (y/n): ").strip().lower()
             if overwrite in ['y', 'yes']:
                 break
             elif overwrite in ['n', 'no']:
                 print("Report not saved.")
-                return False
+                return None
             else:
                 print("Please enter 'y' for yes or 'n' for no.")
     
-    # Save the report
+    # Save the report, unless another till or front end saved this date while we asked
     try:
-        with open(filepath, 'w') as f:
-            f.write(report_content)
+        with locked_report(filepath, date_input, expected_version=version) as new_version:
+            atomic_write(filepath, report_content)
         print(f"\nReport saved successfully to: {filepath}")
-        return True
+        return filepath, new_version
+    except VersionConflict as e:
+        print(f"\nReport not saved: {e}")
+        return None
     except Exception as e:
         print(f"\nError saving report: {e}")
-        return False
+        return None
+
+def journal_event(op, **fields):
+    """Journal one input so an interrupted session can be resumed"""
+    try:
+        journal.record(op, **fields)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not journal input: {e}")
+
+def journal_receipts(old_amounts, new_amounts):
+    """Journal a replaced receipt list as removals followed by the new amounts"""
+    for i in reversed(range(len(old_amounts))):
+        journal_event('receipt_remove', index=i)
+    for i, amount in enumerate(new_amounts):
+        journal_event('receipt', index=i, amount=amount)
+
+def lookup_pos_takings(date_input):
+    """Takings imported from a POS export for the date, if any"""
+    try:
+        store = PosTakings()
+        try:
+            return store.takings_for_input(date_input)
+        finally:
+            store.close()
+    except Exception as e:
+        print(f"Warning: could not read POS takings: {e}")
+        return None
+
+def offer_resume():
+    """Replay an unfinished session's journal and ask whether to carry on with it"""
+    state = journal.replay()
+    if not has_input(state):
+        return empty_state()
+    entered = sum(count is not None for count in state['counts'])
+    print("An unfinished cash up was found:")
+    print(f"  Date: {state['date'] or 'not entered'}")
+    print(f"  Denominations counted: {entered} of {len(state['counts'])}")
+    print(f"  Receipts: {len(state['receipts'])}")
+    if state['expected_takings'] is not None:
+        print(f"  Expected takings: £{state['expected_takings']:.2f}")
+    if input("Resume it? (y/n): ").strip().lower().startswith('y'):
+        print()
+        return state
+    journal.clear()
+    print()
+    return empty_state()
+
+def record_cash_up(date_input, counts, receipt_amounts, additional_cash_entries, figures, report_path, version):
+    """Store a saved cash up in the database alongside its report"""
+    try:
+        day, month, year = date_input.split('/')
+        repository = CashUpRepository()
+        try:
+            repository.save(f"{year}-{month}-{day}", counts, [to_pence(amount) for amount in receipt_amounts],
+                            [{'title': entry['title'], 'amount': to_pence(entry['amount'])}
+                             for entry in additional_cash_entries], figures, report_path, source='terminal',
+                            version=version)
+        finally:
+            repository.close()
+    except Exception as e:
+        print(f"Warning: could not save to the database: {e}")
+
+def record_log_entry(date_input, counts, receipt_amounts, additional_cash_entries, figures):
+    """Append a saved cash up to the binary record log"""
+    try:
+        day, month, year = date_input.split('/')
+        RecordLog().append(f"{year}-{month}-{day}", counts, receipt_amounts, additional_cash_entries, figures)
+    except Exception as e:
+        print(f"Warning: could not update record log: {e}")
+
+def record_rollups(date_input, figures):
+    """Add a saved cash up to the analytics rollups and anomaly statistics"""
+    try:
+        day, month, year = date_input.split('/')
+        store = RollupStore()
+        try:
+            store.record_day(f"{year}-{month}-{day}", figures)
+        finally:
+            store.close()
+        detector = AnomalyDetector()
+        try:
+            detector.observe(f"{year}-{month}-{day}", figures)
+        finally:
+            detector.close()
+    except Exception as e:
+        print(f"Warning: could not update analytics: {e}")
 
 def main():
     print("=== CASH UP APPLICATION ===\n")
     
+    resumed = offer_resume()
+    
     # Get today's date
     print("--- DATE ENTRY ---")
-    while True:
-        date_input = input("Enter today's date (DD/MM/YYYY): ").strip()
-        if len(date_input) == 10 and date_input[2] == '/' and date_input[5] == '/':
-            try:
-                day, month, year = date_input.split('/')
-                day, month, year = int(day), int(month), int(year)
-                if 1 <= day <= 31 and 1 <= month <= 12 and 2000 <= year <= 2100:
-                    print(f"Cash up for: {date_input}")
-                    break
-                else:
-                    print("Please enter a valid date (DD/MM/YYYY).")
-            except ValueError:
-                print("Please enter a valid date format (DD/MM/YYYY).")
-        else:
-            print("Please enter date in DD/MM/YYYY format.")
+    if resumed['date']:
+        date_input = resumed['date']
+        print(f"Cash up for: {date_input}")
+    else:
+        while True:
+            date_input = input("Enter today's date (DD/MM/YYYY): ").strip()
+            if len(date_input) == 10 and date_input[2] == '/' and date_input[5] == '/':
+                try:
+                    day, month, year = date_input.split('/')
+                    day, month, year = int(day), int(month), int(year)
+                    if 1 <= day <= 31 and 1 <= month <= 12 and 2000 <= year <= 2100:
+                        print(f"Cash up for: {date_input}")
+                        break
+                    else:
+                        print("Please enter a valid date (DD/MM/YYYY).")
+                except ValueError:
+                    print("Please enter a valid date format (DD/MM/YYYY).")
+            else:
+                print("Please enter date in DD/MM/YYYY format.")
+    
+    journal_event('date', value=date_input)
     
     print()  # Add spacing
     
@@ -221,56 +345,83 @@ def main():
     # Get counts for each denomination
     print("Count your cash:")
     counts = []
-    for denom in denominations:
-        count = get_coin_count(denom)
+    for i, denom in enumerate(denominations):
+        if resumed['counts'][i] is not None:
+            count = resumed['counts'][i]
+            print(f"How many {denom} do you have? {count} (resumed)")
+        else:
+            count = get_coin_count(denom)
+            journal_event('count', index=i, value=count)
         counts.append(count)
     
     # Get receipt information
     print("\n--- RECEIPTS ---")
-    while True:
-        try:
-            receipt_count = int(input("How many receipts do you have? "))
-            if receipt_count < 0:
-                print("Please enter a positive number.")
-                continue
-            break
-        except ValueError:
-            print("Please enter a valid number.")
-    
-    receipt_amounts = []
-    if receipt_count > 0:
-        receipt_amounts = get_receipt_amounts(receipt_count)
+    if resumed['receipts']:
+        receipt_amounts = list(resumed['receipts'])
+        print(f"Resumed {len(receipt_amounts)} receipts (add more under 'Modify receipts')")
+    else:
+        while True:
+            try:
+                receipt_count = int(input("How many receipts do you have? "))
+                if receipt_count < 0:
+                    print("Please enter a positive number.")
+                    continue
+                break
+            except ValueError:
+                print("Please enter a valid number.")
+        
+        receipt_amounts = []
+        if receipt_count > 0:
+            receipt_amounts = get_receipt_amounts(
+                receipt_count, lambda i, amount: journal_event('receipt', index=i, amount=amount))
     
     # Get air hockey machine earnings
     print("\n--- AIR HOCKEY MACHINE ---")
-    while True:
-        try:
-            air_hockey_earnings = float(input("How much was made from the air hockey machine? £"))
-            if air_hockey_earnings < 0:
-                print("Please enter a positive amount.")
-                continue
-            break
-        except ValueError:
-            print("Please enter a valid amount.")
+    if resumed['additional_cash_entries']:
+        air_hockey_earnings = resumed['additional_cash_entries'][0]['amount']
+        print(f"How much was made from the air hockey machine? £{air_hockey_earnings:.2f} (resumed)")
+    else:
+        while True:
+            try:
+                air_hockey_earnings = float(input("How much was made from the air hockey machine? £"))
+                if air_hockey_earnings < 0:
+                    print("Please enter a positive amount.")
+                    continue
+                break
+            except ValueError:
+                print("Please enter a valid amount.")
+        journal_event('additional', index=0, title='Air Hockey', amount=air_hockey_earnings)
     
     # Get expected takings
     print("\n--- EXPECTED TAKINGS ---")
-    while True:
-        try:
-            expected_takings = float(input("How much should have been made today? £"))
-            if expected_takings < 0:
-                print("Please enter a positive amount.")
-                continue
-            break
-        except ValueError:
-            print("Please enter a valid amount.")
+    if resumed['expected_takings'] is not None:
+        expected_takings = resumed['expected_takings']
+        print(f"How much should have been made today? £{expected_takings:.2f} (resumed)")
+    else:
+        pos_expected = lookup_pos_takings(date_input)
+        prompt = "How much should have been made today? £"
+        if pos_expected is not None:
+            prompt = f"How much should have been made today? (Enter for POS export £{pos_expected:.2f}) £"
+        while True:
+            try:
+                answer = input(prompt).strip()
+                expected_takings = pos_expected if not answer and pos_expected is not None else float(answer)
+                if expected_takings < 0:
+                    print("Please enter a positive amount.")
+                    continue
+                break
+            except ValueError:
+                print("Please enter a valid amount.")
+    
+        journal_event('expected', value=expected_takings)
     
     # Main calculation and review loop
     while True:
         # Calculate totals
-        total_cash = calculate_denomination_total(counts, values)
-        total_receipts = sum(receipt_amounts) if receipt_amounts else 0
-        total_with_air_hockey = total_cash + total_receipts + air_hockey_earnings
+        float_amount = 200.00
+        totals = till_totals_pence(counts, values, receipt_amounts, air_hockey_earnings, expected_takings, float_amount)
+        total_cash = to_pounds(totals['total_cash'])
+        total_receipts = to_pounds(totals['total_receipts'])
         
         # Display current totals
         print(f"\n--- CASH BREAKDOWN ---")
@@ -293,10 +444,9 @@ def main():
         
         # Calculate float analysis
         print("\n=== FLOAT ANALYSIS ===")
-        float_amount = 200.00
-        total_in_till = total_with_air_hockey
-        expected_total = float_amount + expected_takings
-        difference = total_in_till - expected_total
+        total_in_till = to_pounds(totals['total_in_till'])
+        expected_total = to_pounds(totals['expected_total'])
+        difference = to_pounds(totals['difference'])
         
         print(f"Starting float: £{float_amount:.2f}")
         print(f"Expected takings: £{expected_takings:.2f}")
@@ -304,44 +454,42 @@ def main():
         print(f"Actual total in till: £{total_in_till:.2f}")
         print(f"  (Cash: £{total_cash:.2f} + Receipts: £{total_receipts:.2f} + Air Hockey: £{air_hockey_earnings:.2f})")
         
-        if difference > 0:
+        if totals['difference'] > 0:
             print(f"✅ OVER by: £{difference:.2f}")
-        elif difference < 0:
+        elif totals['difference'] < 0:
             print(f"❌ SHORT by: £{abs(difference):.2f}")
         else:
             print("✅ EXACT - Perfect balance!")
         
         # Calculate what to bag up
         print(f"\n=== BAGGING INSTRUCTIONS ===")
-        amount_to_remove = total_in_till - float_amount
+        amount_to_remove = to_pounds(totals['amount_to_remove'])
         
-        if amount_to_remove > 0:
+        if totals['amount_to_remove'] > 0:
             print(f"Remove £{amount_to_remove:.2f} to restore £{float_amount:.2f} float")
             print(f"This includes:")
             print(f"  - All receipts: £{total_receipts:.2f}")
             print(f"  - Air hockey earnings: £{air_hockey_earnings:.2f}")
             
-            cash_to_remove = amount_to_remove - total_receipts - air_hockey_earnings
+            cash_to_remove = totals['cash_to_remove']
             if cash_to_remove > 0:
-                print(f"  - Additional cash: £{cash_to_remove:.2f}")
+                print(f"  - Additional cash: £{to_pounds(cash_to_remove):.2f}")
                 
                 # Suggest best denominations to remove
                 print(f"\n--- SUGGESTED CASH REMOVAL ---")
-                suggestions, remaining = suggest_change_removal(cash_to_remove, counts, values, denominations)
+                suggestions, remaining = calculator.suggest_change_removal_pence(cash_to_remove, counts)
                 
                 if suggestions:
-                    total_suggested = 0
                     for denom, count, value in suggestions:
-                        print(f"Remove {count} × {denom} = £{value:.2f}")
-                        total_suggested += value
+                        print(f"Remove {count} × {denom} = £{to_pounds(value):.2f}")
                     
-                    if remaining > 0.01:  # Account for rounding
-                        print(f"Remaining to remove: £{remaining:.2f}")
+                    if remaining > 0:
+                        print(f"Remaining to remove: £{to_pounds(remaining):.2f}")
                         print("(You may need to make change with smaller denominations)")
                 else:
                     print("Not enough large denominations available for optimal removal.")
             elif cash_to_remove < 0:
-                print(f"  - Need to add cash: £{abs(cash_to_remove):.2f}")
+                print(f"  - Need to add cash: £{to_pounds(abs(cash_to_remove)):.2f}")
         else:
             print(f"Add £{abs(amount_to_remove):.2f} to reach £{float_amount:.2f} float")
         
@@ -359,8 +507,12 @@ def main():
         
         if choice == '1':
             counts = review_and_modify_counts(denominations, counts, values)
+            for i, count in enumerate(counts):
+                journal_event('count', index=i, value=count)
         elif choice == '2':
+            previous_receipts = list(receipt_amounts)
             receipt_amounts = review_and_modify_receipts(receipt_amounts)
+            journal_receipts(previous_receipts, receipt_amounts)
         elif choice == '3':
             while True:
                 try:
@@ -369,6 +521,7 @@ def main():
                         print("Please enter a positive amount.")
                         continue
                     print(f"Updated air hockey earnings to £{air_hockey_earnings:.2f}")
+                    journal_event('additional', index=0, title='Air Hockey', amount=air_hockey_earnings)
                     break
                 except ValueError:
                     print("Please enter a valid amount.")
@@ -380,6 +533,7 @@ def main():
                         print("Please enter a positive amount.")
                         continue
                     print(f"Updated expected takings to £{expected_takings:.2f}")
+                    journal_event('expected', value=expected_takings)
                     break
                 except ValueError:
                     print("Please enter a valid amount.")
@@ -390,12 +544,13 @@ def main():
             print("="*60)
             
             # Final calculations
-            final_total_cash = calculate_denomination_total(counts, values)
-            final_total_receipts = sum(receipt_amounts) if receipt_amounts else 0
-            final_total_in_till = final_total_cash + final_total_receipts + air_hockey_earnings
-            final_expected_total = float_amount + expected_takings
-            final_difference = final_total_in_till - final_expected_total
-            final_amount_to_remove = final_total_in_till - float_amount
+            final = till_totals_pence(counts, values, receipt_amounts, air_hockey_earnings, expected_takings, float_amount)
+            final_total_cash = to_pounds(final['total_cash'])
+            final_total_receipts = to_pounds(final['total_receipts'])
+            final_total_in_till = to_pounds(final['total_in_till'])
+            final_expected_total = to_pounds(final['expected_total'])
+            final_difference = to_pounds(final['difference'])
+            final_amount_to_remove = to_pounds(final['amount_to_remove'])
             
             # Build report content for both display and file saving
             report_lines = []
@@ -457,22 +612,22 @@ def main():
                 report_lines.append(line)
                 print(line)
             
-            if final_difference > 0:
+            if final['difference'] > 0:
                 result_line = f"  Result: OVER by £{final_difference:.2f}"
-            elif final_difference < 0:
+            elif final['difference'] < 0:
                 result_line = f"  Result: SHORT by £{abs(final_difference):.2f}"
             else:
                 result_line = f"  Result: EXACT BALANCE"
             
             report_lines.append(result_line)
-            print(result_line + (" ✅" if final_difference >= 0 else " ❌"))
+            print(result_line + (" ✅" if final['difference'] >= 0 else " ❌"))
             
             # Bagging instructions
             bagging_header = "\nBAGGING INSTRUCTIONS:"
             report_lines.append(bagging_header)
             print(bagging_header)
             
-            if final_amount_to_remove > 0:
+            if final['amount_to_remove'] > 0:
                 remove_line = f"  Remove £{final_amount_to_remove:.2f} total:"
                 receipts_line = f"    - All receipts: £{final_total_receipts:.2f}"
                 air_hockey_line = f"    - Air hockey earnings: £{air_hockey_earnings:.2f}"
@@ -481,13 +636,13 @@ def main():
                 print(receipts_line)
                 print(air_hockey_line)
                 
-                cash_to_remove = final_amount_to_remove - final_total_receipts - air_hockey_earnings
+                cash_to_remove = final['cash_to_remove']
                 if cash_to_remove > 0:
-                    cash_line = f"    - Additional cash: £{cash_to_remove:.2f}"
+                    cash_line = f"    - Additional cash: £{to_pounds(cash_to_remove):.2f}"
                     report_lines.append(cash_line)
                     print(cash_line)
                 elif cash_to_remove < 0:
-                    add_cash_line = f"    - Add cash: £{abs(cash_to_remove):.2f}"
+                    add_cash_line = f"    - Add cash: £{to_pounds(abs(cash_to_remove)):.2f}"
                     report_lines.append(add_cash_line)
                     print(add_cash_line)
             else:
@@ -509,7 +664,23 @@ def main():
             
             # Save report to file
             report_content = "\n".join(report_lines)
-            save_report_to_file(date_input, report_content)
+            saved = save_report_to_file(date_input, report_content)
+            if saved:
+                report_path, version = saved
+                figures = {
+                    'expected_takings': final['expected_takings'],
+                    'total_cash': final['total_cash'],
+                    'total_in_till': final['total_in_till'],
+                    'total_receipts': final['total_receipts'],
+                    'total_additional_cash': final['air_hockey'],
+                    'difference': final['difference'],
+                    'amount_to_remove': final['amount_to_remove']
+                }
+                additional_cash_entries = [{'title': 'Air Hockey', 'amount': air_hockey_earnings}] if air_hockey_earnings else []
+                record_cash_up(date_input, counts, receipt_amounts, additional_cash_entries, figures, report_path, version)
+                record_log_entry(date_input, counts, receipt_amounts, additional_cash_entries, figures)
+                record_rollups(date_input, figures)
+                journal.clear()
             
             break
         else:
@@ -517,5 +688,40 @@ def main():
         
         print("\n" + "="*50)  # Separator line for clarity
 
+def batch_main(argv=None):
+    """Headless mode: cash ups from a JSON-lines or CSV stream instead of prompts"""
+    import argparse
+    import sys
+    from batch import run_batch
+    
+    parser = argparse.ArgumentParser(description="Cash up application (interactive unless --batch is given)")
+    parser.add_argument('--batch', metavar='FILE', nargs='?', const='-',
+                        help="Read cash ups from FILE, or stdin when FILE is - or omitted")
+    parser.add_argument('--format', choices=('jsonl', 'csv'),
+                        help="Input format (default: from the file extension, else jsonl)")
+    parser.add_argument('--stdout', action='store_true', help="Print reports instead of saving them to Reports/")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for large back-fills")
+    parser.add_argument('--no-analytics', action='store_true',
+                        help="Skip the record log, rollups and anomaly statistics for saved reports")
+    args = parser.parse_args(argv)
+    if args.batch is None:
+        return None
+    
+    fmt = args.format or ('csv' if args.batch.lower().endswith('.csv') else 'jsonl')
+    if args.batch == '-':
+        stats = run_batch(sys.stdin, fmt, args.stdout, args.workers, not args.no_analytics)
+    else:
+        with open(args.batch, newline='' if fmt == 'csv' else None, encoding='utf-8-sig') as stream:
+            stats = run_batch(stream, fmt, args.stdout, args.workers, not args.no_analytics)
+    return 1 if stats['failed'] else 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    exit_code = batch_main()
+    if exit_code is not None:
+        raise SystemExit(exit_code)
+    profiling.install_signal_handler()
+    try:
+        main()
+    finally:
+        if profiling.enabled():
+            print(f"Profile written to {profiling.dump()}")
\ No newline at end of file
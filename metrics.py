@@ -0,0 +1,200 @@
+"""
+Low-overhead request metrics exposed in Prometheus text format
+
+Route latency histograms, error counters and calculation/render/write phase
+timings are kept in plain in-process counters behind a lock; /metrics renders
+them on demand. No background threads and no external client library.
+
+The counters live in one process: under server.py's pre-forked workers each
+worker reports only its own requests, labelled by cashup_worker_pid.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Tuple, List
+
+# Seconds; tuned for a small shop server where most requests take a few ms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, plus one overflow slot, then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += counts[-1]
+            bucket_labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class Gauge:
+    """Value read from a callback when metrics are rendered"""
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(self.callback())}"]
+
+class MetricsRegistry:
+    """Holds every metric for the app and renders the /metrics payload"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, help_text, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+request_latency = registry.histogram('cashup_request_duration_seconds',
+                                     'HTTP request latency by route', ('route', 'method', 'status'))
+request_errors = registry.counter('cashup_request_errors_total',
+                                  'Requests that failed or were handled as errors, by route', ('route', 'kind'))
+# outcome is ok or error, or a background save's final state (done, conflict, failed)
+phase_latency = registry.histogram('cashup_phase_duration_seconds',
+                                   'Time spent in each cash up phase, by outcome', ('phase', 'outcome'))
+worker_pid = registry.gauge('cashup_worker_pid', 'Process id of the server worker these metrics belong to',
+                            os.getpid)
+
+@contextmanager
+def phase(name: str):
+    """Time one phase (parse, calculate, render, write, ...) of handling a cash up"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        phase_latency.observe(time.perf_counter() - start, phase=name, outcome=outcome)
+
+def record_error(route: str, kind: str = 'handled'):
+    """Count an error a route caught and reported to the user itself"""
+    request_errors.inc(route=route, kind=kind)
+
+def register_cache(name: str, cache):
+    """Expose a ResultCache's hits, misses and hit rate"""
+    registry.gauge(f'cashup_{name}_cache_hits', f'{name} cache hits', lambda: cache.hits)
+    registry.gauge(f'cashup_{name}_cache_misses', f'{name} cache misses', lambda: cache.misses)
+    registry.gauge(f'cashup_{name}_cache_hit_ratio', f'{name} cache hit ratio',
+                   lambda: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0)
+    registry.gauge(f'cashup_{name}_cache_entries', f'{name} cache entries', lambda: len(cache))
+
+def init_app(app):
+    """Install request timing hooks and the /metrics route on a Flask app"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            request_latency.observe(time.perf_counter() - start, route=route,
+                                    method=request.method, status=str(response.status_code))
+            if response.status_code >= 400:
+                request_errors.inc(route=route, kind=f'http_{response.status_code}')
+        return response
+
+    @app.teardown_request
+    def _record_exception(exc):
+        if exc is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            request_errors.inc(route=route, kind='exception')
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
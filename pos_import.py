@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Daily expected takings from point-of-sale CSV exports
+
+Exports are streamed row by row and summed into one total per day, so memory
+stays constant however many transactions a file holds (only the per-day
+totals are kept). Each file is checkpointed by byte offset: importing the
+same, since-appended export again skips straight to the new rows. A file
+whose start no longer matches what was imported is treated as a fresh export
+and its earlier contribution is replaced.
+
+The daily totals pre-fill expected takings in every front end and are
+cross-checked against the typed figure by calculate_float_analysis().
+"""
+import csv
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+from cash_up_core import to_pence, to_pounds
+from config import Config
+from database import connect, sqlite_path_from_url
+
+# Header names tried, in order, when the columns are not given explicitly
+DATE_COLUMNS = ('date', 'transaction date', 'sale date', 'datetime', 'timestamp', 'created at', 'time')
+AMOUNT_COLUMNS = ('amount', 'total', 'sale total', 'gross', 'net', 'value')
+
+# Bytes hashed to recognise an export that has only been appended to
+FINGERPRINT_BYTES = 64 * 1024
+# Exports are read and parsed this many bytes at a time
+BLOCK_BYTES = 1024 * 1024
+
+POS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pos_takings (
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    takings_pence INTEGER NOT NULL DEFAULT 0,
+    transactions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pos_takings_date ON pos_takings (date);
+
+CREATE TABLE IF NOT EXISTS pos_imports (
+    source TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    skipped INTEGER NOT NULL,
+    imported_at REAL NOT NULL
+);
+"""
+
+_ADD_DAY = """
+INSERT INTO pos_takings (source, date, takings_pence, transactions) VALUES (?, ?, ?, ?)
+ON CONFLICT (source, date) DO UPDATE SET
+    takings_pence = takings_pence + excluded.takings_pence,
+    transactions = transactions + excluded.transactions
+"""
+
+@lru_cache(maxsize=4096)
+def _day_from_prefix(prefix: str) -> Optional[str]:
+    # Timestamps differ row to row but their date part repeats, so cache on that
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(prefix, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+def parse_day(text: str, date_format: str = None) -> Optional[str]:
+    """ISO date of a POS date or timestamp field, or None if it cannot be read"""
+    text = text.strip()
+    if date_format:
+        try:
+            return datetime.strptime(text, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+    return _day_from_prefix(text[:10])
+
+def parse_pence(text: str) -> int:
+    """Pence in an amount field such as '12.50', '£1,234.5', '-3.00' or '(3.00)'"""
+    if text[-3:-2] == '.' and text[:-3].isdigit() and text[-2:].isdigit():
+        return int(text[:-3]) * 100 + int(text[-2:])  # the usual plain 0.00
+    text = text.strip().replace('£', '').replace(',', '')
+    negative = text.startswith('-') or text.startswith('(')
+    text = text.strip('-()+ ')
+    pounds, _, pence = text.partition('.')
+    if not pounds and not pence:
+        # A blank amount is a missing value, not a zero-value sale
+        raise ValueError("Empty amount")
+    if len(pence) > 2:
+        value = to_pence(text)
+    else:
+        value = int(pounds or 0) * 100 + int(pence.ljust(2, '0'))
+    return -value if negative else value
+
+def find_column(header: List[str], wanted: Optional[str], candidates: Tuple[str, ...]) -> int:
+    names = [name.strip().lower() for name in header]
+    for name in ((wanted.lower(),) if wanted else candidates):
+        if name in names:
+            return names.index(name)
+    raise ValueError(f"No {' or '.join(repr(name) for name in ((wanted,) if wanted else candidates))} "
+                     f"column in header: {', '.join(header)}")
+
+class _Blocks:
+    """Whole-line chunks of a binary file, never ending inside a quoted field"""
+
+    def __init__(self, f, final: bool):
+        self.f = f
+        self.final = final
+        self.unterminated = False
+
+    def __iter__(self):
+        carry = b''
+        while True:
+            data = self.f.read(BLOCK_BYTES)
+            if not data:
+                break
+            data = carry + data
+            cut = data.rfind(b'\n') + 1
+            # An odd number of quotes means the last line continues a quoted field
+            while cut and data.count(b'"', 0, cut) % 2:
+                cut = data.rfind(b'\n', 0, cut - 1) + 1
+            carry = data[cut:]
+            if cut:
+                yield data[:cut]
+        if carry:
+            if self.final:
+                yield carry
+            else:
+                # Possibly still being written; leave it for the next import
+                self.unterminated = True
+
+class PosTakings:
+    """Per-day takings imported from POS exports, with per-file checkpoints"""
+
+    def __init__(self, database_url: str = None):
+        self.db_path = sqlite_path_from_url(database_url or Config.DATABASE_URL)
+        self.conn = connect(self.db_path)
+        self.conn.executescript(POS_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def reconnect(self):
+        """Open a fresh connection, e.g. in a forked server worker"""
+        self.conn = connect(self.db_path)
+
+    def takings_for(self, day_date: str) -> Optional[float]:
+        """Imported takings for a YYYY-MM-DD date in pounds, or None if no export covers it"""
+        with self._lock:
+            row = self.conn.execute("SELECT SUM(takings_pence) FROM pos_takings WHERE date = ?",
+                                    (day_date,)).fetchone()
+        return to_pounds(row[0]) if row[0] is not None else None
+
+    def takings_for_input(self, date_input: str) -> Optional[float]:
+        """takings_for() a DD/MM/YYYY date as typed in the front ends; None if it does not parse"""
+        try:
+            day_date = datetime.strptime(date_input.strip(), '%d/%m/%Y').strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+        return self.takings_for(day_date)
+
+    def days_between(self, start: str, end: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.conn.execute("SELECT date, SUM(takings_pence) AS takings_pence, SUM(transactions) AS transactions "
+                                     "FROM pos_takings WHERE date BETWEEN ? AND ? GROUP BY date ORDER BY date",
+                                     (start, end)).fetchall()
+        return [{'date': row['date'], 'takings': to_pounds(row['takings_pence']), 'transactions': row['transactions']}
+                for row in rows]
+
+    def import_csv(self, path: str, source: str = None, date_column: str = None, amount_column: str = None,
+                   date_format: str = None, only: Tuple[str, str] = None, encoding: str = 'utf-8-sig',
+                   final: bool = False, progress=None) -> Dict[str, Any]:
+        """Stream the rows of an export added since its last import into the daily totals
+
+        only=(column, value) keeps just the rows where that column equals value, e.g. the
+        cash tender. progress(stats) is called each time the totals and checkpoint are
+        committed, roughly every Config.POS_COMMIT_ROWS rows.
+        """
+        path = os.path.abspath(path)
+        source = source or path
+        started = time.perf_counter()
+        stats = {'source': source, 'rows': 0, 'skipped': 0, 'days': 0, 'bytes': 0, 'restarted': False}
+
+        with open(path, 'rb') as f:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode(encoding, errors='replace')]), [])
+            date_index = find_column(header, date_column, DATE_COLUMNS)
+            amount_index = find_column(header, amount_column, AMOUNT_COLUMNS)
+            only_index = find_column(header, only[0], ()) if only else None
+            needed = max(date_index, amount_index, only_index or 0)
+
+            offset = len(header_line)
+            with self._lock:
+                checkpoint = self.conn.execute("SELECT * FROM pos_imports WHERE source = ?", (source,)).fetchone()
+            size = os.fstat(f.fileno()).st_size
+            if checkpoint is not None:
+                if checkpoint['offset'] <= size and self._fingerprint(f, checkpoint['offset']) == checkpoint['fingerprint']:
+                    offset = checkpoint['offset']
+                else:
+                    # Not the file we imported before, just appended to: start this source again
+                    stats['restarted'] = True
+                    with self._lock, self.conn:
+                        self.conn.execute("DELETE FROM pos_takings WHERE source = ?", (source,))
+                        self.conn.execute("DELETE FROM pos_imports WHERE source = ?", (source,))
+                    checkpoint = None
+            rows = checkpoint['rows'] if checkpoint is not None else 0
+            skipped = checkpoint['skipped'] if checkpoint is not None else 0
+            start_offset = offset
+
+            f.seek(offset)
+            blocks = _Blocks(f, final)
+            # Data lines carry no byte order mark, and plain utf-8 decodes much faster
+            row_encoding = 'utf-8' if encoding.lower().replace('_', '-') == 'utf-8-sig' else encoding
+            only_value = only[1].strip().lower() if only else None
+            days = {}
+            days_seen = set()
+            pending = 0
+            for block in blocks:
+                for row in csv.reader(io.StringIO(block.decode(row_encoding, errors='replace'), newline='')):
+                    pending += 1
+                    if len(row) <= needed or (only_index is not None and row[only_index].strip().lower() != only_value):
+                        stats['skipped'] += 1
+                        continue
+                    day = parse_day(row[date_index], date_format)
+                    try:
+                        pence = parse_pence(row[amount_index]) if day is not None else None
+                    except (ValueError, ArithmeticError):
+                        pence = None
+                    if pence is None:
+                        stats['skipped'] += 1
+                        continue
+                    totals = days.get(day)
+                    if totals is None:
+                        days[day] = [pence, 1]
+                    else:
+                        totals[0] += pence
+                        totals[1] += 1
+                    stats['rows'] += 1
+                offset += len(block)
+                if pending >= Config.POS_COMMIT_ROWS:
+                    days_seen.update(days)
+                    self._commit(source, path, offset, f, days, rows + stats['rows'], skipped + stats['skipped'])
+                    days, pending = {}, 0
+                    if progress is not None:
+                        progress(dict(stats, bytes=offset - start_offset, days=len(days_seen)))
+            days_seen.update(days)
+            self._commit(source, path, offset, f, days, rows + stats['rows'], skipped + stats['skipped'])
+            stats['unterminated'] = blocks.unterminated
+            stats['bytes'] = offset - start_offset
+
+        stats['days'] = len(days_seen)
+        stats['seconds'] = time.perf_counter() - started
+        return stats
+
+    @staticmethod
+    def _fingerprint(f, offset: int) -> str:
+        position = f.tell()
+        f.seek(0)
+        digest = hashlib.sha1(f.read(min(offset, FINGERPRINT_BYTES))).hexdigest()
+        f.seek(position)
+        return digest
+
+    def _commit(self, source: str, path: str, offset: int, f, days: Dict[str, list], rows: int, skipped: int):
+        # Totals and the checkpoint land together, so an interrupted import resumes exactly
+        fingerprint = self._fingerprint(f, offset)
+        with self._lock, self.conn:
+            self.conn.executemany(_ADD_DAY, [(source, day, totals[0], totals[1]) for day, totals in days.items()])
+            self.conn.execute("INSERT OR REPLACE INTO pos_imports (source, path, offset, fingerprint, rows, skipped, imported_at) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (source, path, offset, fingerprint, rows, skipped, time.time()))
+
+def main(argv=None):
+    import argparse
+    from report_index import ReportIndex
+
+    parser = argparse.ArgumentParser(description="Import daily expected takings from POS CSV exports")
+    parser.add_argument('--database-url', default=Config.DATABASE_URL)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="Import (or continue importing) CSV exports")
+    import_parser.add_argument('files', nargs='+')
+    import_parser.add_argument('--source', help="Name to checkpoint a single file under instead of its path")
+    import_parser.add_argument('--date-column')
+    import_parser.add_argument('--amount-column')
+    import_parser.add_argument('--date-format', help="strptime format when dates are not YYYY-MM-DD or DD/MM/YYYY")
+    import_parser.add_argument('--only', metavar='COLUMN=VALUE', help="Only count rows where COLUMN equals VALUE")
+    import_parser.add_argument('--encoding', default='utf-8-sig')
+    import_parser.add_argument('--final', action='store_true',
+                               help="Also import a last line with no newline (the export is complete)")
+    show_parser = subparsers.add_parser('show', help="Print imported daily takings")
+    show_parser.add_argument('--from', dest='start', default='')
+    show_parser.add_argument('--to', dest='end', default='\uffff')
+    check_parser = subparsers.add_parser('check', help="Compare saved cash ups with the imported takings")
+    check_parser.add_argument('--reports-dir', default=Config.REPORTS_DIR)
+    args = parser.parse_args(argv)
+
+    store = PosTakings(args.database_url)
+    try:
+        if args.command == 'import':
+            only = None
+            if args.only:
+                column, _, value = args.only.partition('=')
+                only = (column, value)
+            if args.source and len(args.files) > 1:
+                parser.error("--source can only name a single file")
+            for path in args.files:
+                def report(stats):
+                    print(f"  {stats['rows']} rows, {stats['days']} days, {stats['bytes'] / 1e6:.1f} MB...", file=sys.stderr)
+                stats = store.import_csv(path, args.source, args.date_column, args.amount_column, args.date_format,
+                                         only, args.encoding, args.final, progress=report)
+                rate = stats['bytes'] / 1e6 / stats['seconds'] if stats['seconds'] else 0
+                print(f"{path}: {'re-imported' if stats['restarted'] else 'imported'} {stats['rows']} new rows "
+                      f"({stats['skipped']} skipped) across {stats['days']} days in {stats['seconds']:.2f}s ({rate:.1f} MB/s)")
+                if stats['unterminated']:
+                    print("  The last line has no newline and was left for the next import (use --final to include it)")
+        elif args.command == 'show':
+            for day in store.days_between(args.start, args.end):
+                print(f"{day['date']}: £{day['takings']:.2f} from {day['transactions']} transactions")
+        elif args.command == 'check':
+            index = ReportIndex(args.reports_dir, args.database_url)
+            try:
+                index.rescan()
+                mismatches = 0
+                for day in index.days_between('', '\uffff'):
+                    takings = store.takings_for(day['date'])
+                    if takings is None or day['expected_takings'] is None:
+                        continue
+                    if to_pence(takings) != to_pence(day['expected_takings']):
+                        mismatches += 1
+                        print(f"{day['date']}: expected takings £{day['expected_takings']:.2f}, "
+                              f"POS £{takings:.2f} ({day['expected_takings'] - takings:+.2f})")
+                print(f"{mismatches} saved cash ups disagree with the POS takings")
+            finally:
+                index.close()
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
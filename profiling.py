@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling hooks for the cash up engine
+
+When Config.PROFILING is on (CASHUP_PROFILE=1), the front ends call
+instrument_core() to wrap the hot methods of CashUpCalculator and
+ReportGenerator so they count calls and time them, and every Nth call is run
+under cProfile so a sample of full call graphs is kept too. When it is off
+nothing is wrapped and the methods run untouched.
+
+Dump the collected figures with dump(): from main.py on exit (or SIGUSR1),
+from the desktop app with Ctrl+Shift+P and from the web app at /debug/profile.
+"""
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from typing import Dict, Any, Tuple
+
+from config import Config
+
+CALCULATOR_METHODS = ('calculate_denomination_total_pence', 'suggest_change_removal_pence',
+                      'calculate_float_analysis', 'generate_bagging_instructions')
+REPORT_GENERATOR_METHODS = ('generate_report_content', 'save_report')
+
+class Profiler:
+    """Call counts, cumulative time and sampled cProfile snapshots per method"""
+
+    def __init__(self, sample_every: int = 50):
+        self.sample_every = sample_every
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._sampled = None
+        self._samples = 0
+        # cProfile cannot nest, so only the outermost sampled call is profiled
+        self._local = threading.local()
+        self.started_at = time.time()
+
+    def wrap(self, name: str, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                calls = self._calls.setdefault(name, [0, 0.0])
+                calls[0] += 1
+                sample = self.sample_every > 0 and (calls[0] - 1) % self.sample_every == 0
+            profile = None
+            if sample and not getattr(self._local, 'active', False):
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                    self._local.active = True
+                except ValueError:
+                    # Another profiler (e.g. a debugger) already owns this thread
+                    profile = None
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                if profile is not None:
+                    profile.disable()
+                    self._local.active = False
+                    self._add_sample(profile)
+                with self._lock:
+                    self._calls[name][1] += elapsed
+        return wrapper
+
+    def _add_sample(self, profile: cProfile.Profile):
+        with self._lock:
+            if self._sampled is None:
+                self._sampled = pstats.Stats(profile)
+            else:
+                self._sampled.add(profile)
+            self._samples += 1
+
+    def instrument(self, cls, methods: Tuple[str, ...]):
+        """Replace cls's methods with timed wrappers"""
+        for method in methods:
+            func = getattr(cls, method)
+            if getattr(func, '_profiled', False):
+                continue
+            wrapper = self.wrap(f"{cls.__name__}.{method}", func)
+            wrapper._profiled = True
+            setattr(cls, method, wrapper)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-method call counts and timings, JSON-friendly"""
+        with self._lock:
+            items = [(name, calls, total) for name, (calls, total) in self._calls.items()]
+        return {
+            name: {
+                'calls': calls,
+                'total_seconds': round(total, 6),
+                'mean_ms': round(total / calls * 1000, 4) if calls else 0.0
+            }
+            for name, calls, total in sorted(items, key=lambda item: item[2], reverse=True)
+        }
+
+    def report(self, limit: int = 25) -> str:
+        """Plain text summary of the method timings and sampled profiles"""
+        lines = [f"Cash up profile since {datetime.fromtimestamp(self.started_at):%d/%m/%Y %H:%M:%S}", ""]
+        lines.append(f"{'Method':<55} {'Calls':>8} {'Total s':>10} {'Mean ms':>10}")
+        for name, figures in self.stats().items():
+            lines.append(f"{name:<55} {figures['calls']:>8} {figures['total_seconds']:>10.4f} "
+                         f"{figures['mean_ms']:>10.4f}")
+        with self._lock:
+            sampled, samples = self._sampled, self._samples
+            if sampled is not None:
+                stream = io.StringIO()
+                sampled.stream = stream
+                sampled.sort_stats('cumulative').print_stats(limit)
+                sampled_text = stream.getvalue()
+        if sampled is not None:
+            lines.append("")
+            lines.append(f"Sampled cProfile snapshots ({samples} calls, 1 in {self.sample_every}):")
+            lines.append(sampled_text)
+        return "\n".join(lines) + "\n"
+
+    def dump(self, directory: str = None) -> str:
+        """Write the text report, plus the raw pstats if any calls were sampled; returns the report path"""
+        directory = directory or Config.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"profile_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}")
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        with self._lock:
+            if self._sampled is not None:
+                self._sampled.dump_stats(base + '.prof')
+        return base + '.txt'
+
+profiler = Profiler(Config.PROFILE_SAMPLE_EVERY) if Config.PROFILING else None
+
+def enabled() -> bool:
+    return profiler is not None
+
+def instrument_core(calculator_cls, report_generator_cls):
+    """Wrap the engine's hot methods; a no-op unless profiling is enabled"""
+    if profiler is None:
+        return
+    profiler.instrument(calculator_cls, CALCULATOR_METHODS)
+    profiler.instrument(report_generator_cls, REPORT_GENERATOR_METHODS)
+
+def dump() -> str:
+    """Dump the profile to Config.PROFILE_DIR, returning the report path (None when disabled)"""
+    return profiler.dump() if profiler is not None else None
+
+def install_signal_handler():
+    """Dump the profile on SIGUSR1 where the platform has it"""
+    if profiler is None or not hasattr(signal, 'SIGUSR1'):
+        return
+    signal.signal(signal.SIGUSR1, lambda signum, frame: print(f"Profile written to {dump()}", file=sys.stderr))
+
+def init_app(app):
+    """Add /debug/profile to a Flask app when profiling is enabled"""
+    if profiler is None:
+        return
+    from flask import Response, jsonify, request
+
+    @app.route('/debug/profile')
+    def debug_profile():
+        if request.args.get('format') == 'json':
+            return jsonify(profiler.stats())
+        if request.args.get('dump'):
+            return jsonify({'path': dump()})
+        return Response(profiler.report(), mimetype='text/plain')
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Compact binary log of saved cash ups
+
+Alongside each text report, the saved figures are appended to one log file
+per year (Records/cash_up_YYYY.log). Every record starts with a fixed-width
+header - date, the twelve denomination counts and the summary figures in
+pence - followed by a variable-length section holding the receipts and the
+additional cash titles, located by offsets in the header. Readers mmap the
+file and unpack headers in place, so scanning years of closes involves no
+text parsing at all. The text reports remain the human-readable copy.
+
+The log is append-only: re-saving a day appends a newer record, and readers
+keep the latest record for each date. A record torn by a crash fails its
+length or CRC check and is cut off before the next append.
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Iterator, List, Dict, Any, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends from a single process only
+    fcntl = None
+
+from cash_up_core import DENOMINATIONS, to_pence, to_pounds
+from config import Config
+
+FILE_MAGIC = b'CASHLOG1'
+
+# length, crc32, saved_at, year, month, day, 12 counts, 7 figures in pence,
+# receipt count, additional cash count, receipts offset, additional cash offset
+RECORD = struct.Struct('<IId HBB 12I 7q HHII')
+RECEIPT = struct.Struct('<q')
+ADDITIONAL_CASH = struct.Struct('<qH')
+
+FIGURES = ('expected_takings', 'total_cash', 'total_receipts', 'total_additional_cash',
+           'total_in_till', 'difference', 'amount_to_remove')
+
+class LogRecord(NamedTuple):
+    """One cash up as stored in the log; amounts are pence"""
+    date: str
+    saved_at: float
+    counts: Tuple[int, ...]
+    expected_takings: int
+    total_cash: int
+    total_receipts: int
+    total_additional_cash: int
+    total_in_till: int
+    difference: int
+    amount_to_remove: int
+    receipt_count: int
+    additional_cash_count: int
+    offset: int
+    receipts: Optional[List[int]] = None
+    additional_cash_entries: Optional[List[Tuple[str, int]]] = None
+
+    @property
+    def figures(self) -> Dict[str, int]:
+        return {figure: getattr(self, figure) for figure in FIGURES}
+
+def encode_record(day_date: str, cash_counts: List[int], receipt_amounts: List[float],
+                  additional_cash_entries: List[Dict[str, Any]], figures: Dict[str, int],
+                  saved_at: float = None) -> bytes:
+    """Pack one cash up (figures in pence, day_date as YYYY-MM-DD) into a log record"""
+    if len(cash_counts) != len(DENOMINATIONS):
+        raise ValueError(f"Expected {len(DENOMINATIONS)} denomination counts, got {len(cash_counts)}")
+    day = datetime.strptime(day_date, '%Y-%m-%d')
+    receipts = b''.join(RECEIPT.pack(to_pence(amount)) for amount in receipt_amounts)
+    additional_cash = bytearray()
+    for entry in additional_cash_entries:
+        title = entry['title'].encode('utf-8')[:0xFFFF]
+        additional_cash += ADDITIONAL_CASH.pack(to_pence(entry['amount']), len(title)) + title
+    receipts_offset = RECORD.size
+    additional_offset = receipts_offset + len(receipts)
+    length = additional_offset + len(additional_cash)
+    header = RECORD.pack(length, 0, saved_at if saved_at is not None else time.time(),
+                         day.year, day.month, day.day, *(int(count) for count in cash_counts),
+                         *(int(figures[figure]) for figure in FIGURES),
+                         len(receipt_amounts), len(additional_cash_entries), receipts_offset, additional_offset)
+    body = header[8:] + receipts + bytes(additional_cash)
+    return struct.pack('<II', length, zlib.crc32(body)) + body
+
+def _read_record(buffer, offset: int, details: bool) -> Optional[LogRecord]:
+    """Unpack the record at offset, or None if it is truncated or corrupt"""
+    if offset + RECORD.size > len(buffer):
+        return None
+    fields = RECORD.unpack_from(buffer, offset)
+    length, crc = fields[0], fields[1]
+    if length < RECORD.size or offset + length > len(buffer):
+        return None
+    if zlib.crc32(buffer[offset + 8:offset + length]) != crc:
+        return None
+    saved_at, year, month, day = fields[2:6]
+    counts = fields[6:18]
+    figures = fields[18:25]
+    receipt_count, additional_count, receipts_offset, additional_offset = fields[25:29]
+    receipts = additional_cash_entries = None
+    if details:
+        receipts = [RECEIPT.unpack_from(buffer, offset + receipts_offset + i * RECEIPT.size)[0]
+                    for i in range(receipt_count)]
+        additional_cash_entries = []
+        position = offset + additional_offset
+        for _ in range(additional_count):
+            amount, title_length = ADDITIONAL_CASH.unpack_from(buffer, position)
+            position += ADDITIONAL_CASH.size
+            additional_cash_entries.append((bytes(buffer[position:position + title_length]).decode('utf-8'), amount))
+            position += title_length
+    return LogRecord(f"{year:04d}-{month:02d}-{day:02d}", saved_at, counts, *figures,
+                     receipt_count, additional_count, offset, receipts, additional_cash_entries)
+
+class RecordLog:
+    """Per-year append-only binary logs of saved cash ups"""
+
+    def __init__(self, directory: str = None, fsync: bool = False):
+        self.directory = directory or Config.RECORD_LOG_DIR
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # path -> size up to which the file is known to hold whole records
+        self._verified = {}
+
+    def path_for_year(self, year: int) -> str:
+        return os.path.join(self.directory, f"cash_up_{int(year):04d}.log")
+
+    def years(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[8:12]) for name in os.listdir(self.directory)
+                      if name.startswith('cash_up_') and name.endswith('.log') and name[8:12].isdigit())
+
+    def append(self, day_date: str, cash_counts: List[int], receipt_amounts: List[float],
+               additional_cash_entries: List[Dict[str, Any]], figures: Dict[str, int]) -> str:
+        """Append one cash up (figures in pence) to its year's log, returning the log path"""
+        record = encode_record(day_date, cash_counts, receipt_amounts, additional_cash_entries, figures)
+        path = self.path_for_year(day_date[:4])
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                if fcntl is not None:
+                    # Server workers append from separate processes
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                self._repair_tail(fd, path)
+                os.write(fd, record)
+                if self.fsync:
+                    os.fsync(fd)
+                self._verified[path] = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+        return path
+
+    def append_analysis(self, date_input: str, cash_counts: List[int], receipt_amounts: List[float],
+                        additional_cash_entries: List[Dict[str, Any]], analysis: Dict[str, Any]) -> str:
+        """append() for a DD/MM/YYYY date and a calculate_float_analysis result"""
+        day_date = datetime.strptime(date_input, '%d/%m/%Y').strftime('%Y-%m-%d')
+        return self.append(day_date, cash_counts, receipt_amounts, additional_cash_entries,
+                           {figure: analysis['pence'][figure] for figure in FIGURES})
+
+    def append_parsed_report(self, report) -> str:
+        """Append a report_parser.ParsedReport, e.g. when backfilling from the text reports"""
+        return self.append(report.date, [report.cash_counts.get(denomination, 0) for denomination in DENOMINATIONS],
+                           report.receipt_amounts, report.additional_cash_entries, {
+                               'expected_takings': to_pence(report.expected_takings or 0),
+                               'total_cash': to_pence(report.total_cash or 0),
+                               'total_receipts': to_pence(report.total_receipts),
+                               'total_additional_cash': to_pence(report.total_additional_cash),
+                               'total_in_till': to_pence(report.total_in_till or 0),
+                               'difference': to_pence(report.difference),
+                               'amount_to_remove': to_pence(report.amount_to_remove or 0)
+                           })
+
+    def _repair_tail(self, fd: int, path: str):
+        # Walk any records written since we last looked (by us or another process)
+        # and cut off a torn tail left by a crash mid-append
+        size = os.fstat(fd).st_size
+        if size == 0:
+            os.write(fd, FILE_MAGIC)
+            return
+        verified = self._verified.get(path, len(FILE_MAGIC))
+        if verified == size:
+            return
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:len(FILE_MAGIC)] != FILE_MAGIC:
+                raise ValueError(f"{path} is not a cash up record log")
+            offset = verified if verified <= size else len(FILE_MAGIC)
+            while offset < size:
+                record = _read_record(buffer, offset, details=False)
+                if record is None:
+                    break
+                offset += struct.unpack_from('<I', buffer, offset)[0]
+        if offset < size:
+            print(f"Warning: discarding {size - offset} bytes of torn record at the end of {path}", file=sys.stderr)
+            os.ftruncate(fd, offset)
+
+    def iter_records(self, year: int, details: bool = False) -> Iterator[LogRecord]:
+        """Every record in a year's log in append order, including superseded ones"""
+        path = self.path_for_year(year)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size <= len(FILE_MAGIC):
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                if buffer[:len(FILE_MAGIC)] != FILE_MAGIC:
+                    raise ValueError(f"{path} is not a cash up record log")
+                offset = len(FILE_MAGIC)
+                while offset < len(buffer):
+                    record = _read_record(buffer, offset, details)
+                    if record is None:
+                        break
+                    yield record
+                    offset += struct.unpack_from('<I', buffer, offset)[0]
+
+    def latest(self, year: int, details: bool = False) -> Dict[str, LogRecord]:
+        """The most recently saved record for each date in a year"""
+        days = {}
+        for record in self.iter_records(year, details):
+            days[record.date] = record
+        return days
+
+    def iter_days(self, start_year: int = None, end_year: int = None, details: bool = False) -> Iterator[LogRecord]:
+        """The latest record for every saved day, in date order"""
+        for year in self.years():
+            if (start_year is None or year >= start_year) and (end_year is None or year <= end_year):
+                days = self.latest(year, details)
+                for day_date in sorted(days):
+                    yield days[day_date]
+
+def main(argv=None):
+    import argparse
+    from report_parser import iter_reports
+
+    parser = argparse.ArgumentParser(description="Binary cash up record log")
+    parser.add_argument('--log-dir', default=Config.RECORD_LOG_DIR)
+    parser.add_argument('--reports-dir', default=Config.REPORTS_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('import', help="Append every text report to the logs (for a fresh log directory)")
+    show_parser = subparsers.add_parser('show', help="List the latest record for each day of a year")
+    show_parser.add_argument('year', type=int)
+    subparsers.add_parser('stats', help="Scan every log and summarise it")
+    args = parser.parse_args(argv)
+
+    log = RecordLog(args.log_dir)
+    if args.command == 'import':
+        reports = sorted(iter_reports(args.reports_dir), key=lambda report: report.date)
+        for report in reports:
+            log.append_parsed_report(report)
+        print(f"Appended {len(reports)} reports to {args.log_dir}")
+    elif args.command == 'show':
+        for record in log.latest(args.year, details=True).values():
+            print(f"{record.date}: over/short £{to_pounds(record.difference):+.2f}, "
+                  f"expected £{to_pounds(record.expected_takings):.2f}, in till £{to_pounds(record.total_in_till):.2f}, "
+                  f"{record.receipt_count} receipts, "
+                  f"{', '.join(f'{title} £{to_pounds(amount):.2f}' for title, amount in record.additional_cash_entries) or 'no additional cash'}")
+    elif args.command == 'stats':
+        started = time.perf_counter()
+        days = 0
+        takings = difference = 0
+        for record in log.iter_days():
+            days += 1
+            takings += record.expected_takings
+            difference += record.difference
+        elapsed = time.perf_counter() - started
+        print(f"{days} days across {len(log.years())} years: takings £{to_pounds(takings):.2f}, "
+              f"net over/short £{to_pounds(difference):+.2f} (scanned in {elapsed * 1000:.1f} ms)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
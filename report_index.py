@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+SQLite-backed index of saved cash up reports
+
+Parses the Reports/YYYY/MM/Cash_Up_DD-MM-YYYY.txt tree into tables so history
+questions become indexed lookups instead of directory walks. Rescans are
+incremental: only files whose mtime or size changed are re-parsed.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Dict, Any, Optional, Callable, Tuple
+
+from cash_up_core import to_pence
+from config import Config
+from database import connect, sqlite_path_from_url
+from report_parser import ParsedReport, iter_report_files, parse_report_file
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    day_date TEXT
+);
+CREATE TABLE IF NOT EXISTS days (
+    date TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    starting_float REAL,
+    total_cash REAL,
+    total_receipts REAL,
+    total_additional_cash REAL,
+    expected_takings REAL,
+    expected_total REAL,
+    total_in_till REAL,
+    difference REAL,
+    amount_to_remove REAL,
+    result TEXT
+);
+CREATE TABLE IF NOT EXISTS denomination_counts (
+    date TEXT NOT NULL,
+    denomination TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (date, denomination)
+);
+CREATE TABLE IF NOT EXISTS receipts (
+    date TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (date, position)
+);
+CREATE TABLE IF NOT EXISTS additional_cash (
+    date TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (date, position)
+);
+CREATE INDEX IF NOT EXISTS idx_files_day_date ON files (day_date);
+CREATE INDEX IF NOT EXISTS idx_days_result ON days (result);
+"""
+
+# Inverted index for report_search: word postings for titles, results and
+# weekdays, and (field, pence) postings so amount ranges are index range scans
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_terms (
+    term TEXT NOT NULL,
+    date TEXT NOT NULL,
+    PRIMARY KEY (term, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_amounts (
+    field TEXT NOT NULL,
+    pence INTEGER NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_search_amounts ON search_amounts (field, pence, date);
+CREATE INDEX IF NOT EXISTS idx_search_amounts_date ON search_amounts (date);
+"""
+
+_INSERTS = {
+    'days': """INSERT INTO days (date, path, layout, starting_float, total_cash, total_receipts,
+                                  total_additional_cash, expected_takings, expected_total, total_in_till,
+                                  difference, amount_to_remove, result)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    'denomination_counts': "INSERT INTO denomination_counts (date, denomination, count) VALUES (?, ?, ?)",
+    'receipts': "INSERT INTO receipts (date, position, amount) VALUES (?, ?, ?)",
+    'additional_cash': "INSERT INTO additional_cash (date, position, title, amount) VALUES (?, ?, ?, ?)",
+    'search_terms': "INSERT OR IGNORE INTO search_terms (term, date) VALUES (?, ?)",
+    'search_amounts': "INSERT INTO search_amounts (field, pence, date) VALUES (?, ?, ?)"
+}
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+_WORD = re.compile(r"[a-z0-9]+")
+
+def title_terms(title: str) -> List[str]:
+    """Lower-case words of an additional cash title, as stored in search_terms"""
+    return _WORD.findall(title.lower())
+
+def search_rows(day_date: str, result: str, additional_cash_entries: List[Dict[str, Any]],
+                receipt_amounts: List[float], figures: Dict[str, Optional[float]]) -> Tuple[list, list]:
+    """search_terms and search_amounts rows for one day"""
+    terms = {f"result:{result.lower()}",
+             f"day:{WEEKDAYS[datetime.strptime(day_date, '%Y-%m-%d').weekday()]}"}
+    amounts = [('receipt', to_pence(amount)) for amount in receipt_amounts]
+    for entry in additional_cash_entries:
+        terms.update(title_terms(entry['title']))
+        amounts.append(('cash_in', to_pence(entry['amount'])))
+    amounts.extend((field, to_pence(value)) for field, value in figures.items() if value is not None)
+    return [(term, day_date) for term in terms], [(field, pence, day_date) for field, pence in amounts]
+
+def report_rows(path: str, report: ParsedReport) -> Dict[str, list]:
+    """Rows for every table that holds a parsed report, keyed by table"""
+    day_date = report.date
+    terms, amounts = search_rows(day_date, report.result, report.additional_cash_entries, report.receipt_amounts, {
+        'difference': report.difference,
+        'takings': report.expected_takings,
+        'till': report.total_in_till,
+        'removed': report.amount_to_remove
+    })
+    return {
+        'days': [(day_date, path, report.layout, report.starting_float, report.total_cash, report.total_receipts,
+                  report.total_additional_cash, report.expected_takings, report.expected_total,
+                  report.total_in_till, report.difference, report.amount_to_remove, report.result)],
+        'denomination_counts': [(day_date, denomination, count) for denomination, count in report.cash_counts.items()],
+        'receipts': [(day_date, i + 1, amount) for i, amount in enumerate(report.receipt_amounts)],
+        'additional_cash': [(day_date, i + 1, entry['title'], entry['amount'])
+                            for i, entry in enumerate(report.additional_cash_entries)],
+        'search_terms': terms,
+        'search_amounts': amounts
+    }
+
+# Report files handed to a migrate() pool worker at a time
+_PARSE_CHUNK = 64
+
+def _parse_paths(paths: List[str]) -> List[Optional[ParsedReport]]:
+    # Runs in a migrate() pool worker
+    return [parse_report_file(path) for path in paths]
+
+def _parse_files(files: Iterator[Tuple], workers: int) -> Iterator[Tuple]:
+    """(path, stat, was_known, report) for each file, parsed in a pool of workers processes"""
+    if workers <= 1:
+        for path, stat, was_known in files:
+            yield path, stat, was_known, parse_report_file(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+
+        def drain():
+            chunk, future = window.popleft()
+            for (path, stat, was_known), report in zip(chunk, future.result()):
+                yield path, stat, was_known, report
+
+        chunk = []
+        for file in files:
+            chunk.append(file)
+            if len(chunk) >= _PARSE_CHUNK:
+                window.append((chunk, pool.submit(_parse_paths, [path for path, _, _ in chunk])))
+                chunk = []
+                # Keep walking the tree only as fast as the workers parse it
+                if len(window) >= workers * 4:
+                    yield from drain()
+        if chunk:
+            window.append((chunk, pool.submit(_parse_paths, [path for path, _, _ in chunk])))
+        while window:
+            yield from drain()
+
+class ReportIndex:
+    """Incrementally maintained SQLite index over the Reports folder tree"""
+
+    def __init__(self, reports_dir: str = None, database_url: str = None):
+        self.reports_dir = reports_dir or Config.REPORTS_DIR
+        self.db_path = sqlite_path_from_url(database_url or Config.DATABASE_URL)
+        self.conn = connect(self.db_path)
+        self.conn.executescript(SCHEMA + SEARCH_SCHEMA)
+        # The web app indexes saves from the writer thread while requests search
+        self.lock = threading.RLock()
+        self._backfill_search()
+
+    def close(self):
+        self.conn.close()
+
+    def reconnect(self):
+        """Open a fresh connection, e.g. in a forked server worker"""
+        self.conn = connect(self.db_path)
+
+    def rescan(self, progress: Callable[[Dict[str, int]], None] = None) -> Dict[str, int]:
+        """Bring the index up to date, re-parsing only new or changed files
+        
+        progress, if given, is called with the running stats after each file; an
+        exception raised from it abandons the rescan and rolls the index back.
+        """
+        with self.lock:
+            known = {row['path']: (row['mtime'], row['size'])
+                     for row in self.conn.execute("SELECT path, mtime, size FROM files")}
+            stats = {'scanned': 0, 'parsed': 0, 'unchanged': 0, 'removed': 0, 'skipped': 0}
+
+            with self.conn:
+                for path, stat in iter_report_files(self.reports_dir):
+                    if progress is not None:
+                        progress(stats)
+                    stats['scanned'] += 1
+                    previous = known.pop(path, None)
+                    if previous == (stat.st_mtime, stat.st_size):
+                        stats['unchanged'] += 1
+                        continue
+                    stats['parsed' if self._index_path(path, stat) else 'skipped'] += 1
+
+                for path in known:
+                    self._forget_file(path)
+                    stats['removed'] += 1
+
+            return stats
+
+    def migrate(self, workers: int = None, progress: Callable[[Dict[str, int]], None] = None) -> Dict[str, int]:
+        """Bulk-load the whole archive: rescan() with parsing fanned out over a process pool
+        
+        Rows are inserted in transactions of Config.MIGRATE_BATCH_FILES files (the
+        database runs in WAL mode, see database.connect). Each committed batch
+        records its files, which are the checkpoint: an interrupted migration
+        resumes where it stopped. progress, if given, is called with the running
+        stats after each batch.
+        """
+        workers = workers or os.cpu_count() or 1
+        with self.lock:
+            known = {row['path']: (row['mtime'], row['size'])
+                     for row in self.conn.execute("SELECT path, mtime, size FROM files")}
+            indexed_days = {row['date'] for row in self.conn.execute("SELECT date FROM days")}
+            stats = {'scanned': 0, 'parsed': 0, 'unchanged': 0, 'removed': 0, 'skipped': 0}
+
+            def changed_files():
+                for path, stat in iter_report_files(self.reports_dir):
+                    stats['scanned'] += 1
+                    previous = known.pop(path, None)
+                    if previous == (stat.st_mtime, stat.st_size):
+                        stats['unchanged'] += 1
+                        continue
+                    yield path, stat, previous is not None
+
+            batch = []
+            for parsed in _parse_files(changed_files(), workers):
+                batch.append(parsed)
+                if len(batch) >= Config.MIGRATE_BATCH_FILES:
+                    self._store_batch(batch, indexed_days, stats)
+                    batch = []
+                    if progress is not None:
+                        progress(stats)
+            self._store_batch(batch, indexed_days, stats)
+
+            with self.conn:
+                for path in known:
+                    self._forget_file(path)
+                    stats['removed'] += 1
+            if progress is not None:
+                progress(stats)
+            return stats
+
+    def _store_batch(self, batch: List[Tuple], indexed_days: set, stats: Dict[str, int]):
+        # One transaction per batch, with each table's rows inserted in a single executemany
+        rows = {table: [] for table in _INSERTS}
+        files = []
+        with self.conn:
+            for path, stat, was_known, report in batch:
+                if was_known:
+                    self._forget_file(path)
+                day_date = None
+                if report is not None:
+                    day_date = report.date
+                    if day_date in indexed_days:
+                        # Another file (or an earlier row in this batch) holds this date
+                        self._insert_rows(rows)
+                        rows = {table: [] for table in _INSERTS}
+                        self._delete_day(day_date)
+                    indexed_days.add(day_date)
+                    for table, table_rows in report_rows(path, report).items():
+                        rows[table].extend(table_rows)
+                files.append((path, stat.st_mtime, stat.st_size, day_date))
+                stats['parsed' if report is not None else 'skipped'] += 1
+            self._insert_rows(rows)
+            self.conn.executemany("INSERT INTO files (path, mtime, size, day_date) VALUES (?, ?, ?, ?)", files)
+
+    def index_file(self, path: str) -> bool:
+        """(Re-)index a single report, e.g. straight after it is saved"""
+        with self.lock, self.conn:
+            return self._index_path(path, os.stat(path))
+
+    def _index_path(self, path: str, stat: os.stat_result) -> bool:
+        report = parse_report_file(path)
+        self._forget_file(path)
+        day_date = None
+        if report is not None:
+            self._store_report(path, report)
+            day_date = report.date
+        self.conn.execute("INSERT INTO files (path, mtime, size, day_date) VALUES (?, ?, ?, ?)",
+                          (path, stat.st_mtime, stat.st_size, day_date))
+        return report is not None
+
+    def _forget_file(self, path: str):
+        row = self.conn.execute("SELECT day_date FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row['day_date']:
+            self._delete_day(row['day_date'])
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _delete_day(self, day_date: str):
+        for table in ('days', 'denomination_counts', 'receipts', 'additional_cash', 'search_terms', 'search_amounts'):
+            self.conn.execute(f"DELETE FROM {table} WHERE date = ?", (day_date,))
+
+    def _store_report(self, path: str, report: ParsedReport):
+        self._delete_day(report.date)
+        self._insert_rows(report_rows(path, report))
+
+    def _insert_rows(self, rows: Dict[str, list]):
+        for table, sql in _INSERTS.items():
+            if rows[table]:
+                self.conn.executemany(sql, rows[table])
+
+    def _index_search(self, day_date: str, result: str, additional_cash_entries: List[Dict[str, Any]],
+                      receipt_amounts: List[float], figures: Dict[str, Optional[float]]):
+        terms, amounts = search_rows(day_date, result, additional_cash_entries, receipt_amounts, figures)
+        self.conn.executemany(_INSERTS['search_terms'], terms)
+        self.conn.executemany(_INSERTS['search_amounts'], amounts)
+
+    def _backfill_search(self):
+        # Indexes created before search existed have days but no postings yet
+        if self.conn.execute("SELECT 1 FROM search_terms LIMIT 1").fetchone() is not None:
+            return
+        with self.lock, self.conn:
+            for row in self.conn.execute("SELECT * FROM days").fetchall():
+                day = self.get_day(row['date'])
+                self._index_search(day['date'], day['result'], day['additional_cash_entries'], day['receipt_amounts'], {
+                    'difference': day['difference'],
+                    'takings': day['expected_takings'],
+                    'till': day['total_in_till'],
+                    'removed': day['amount_to_remove']
+                })
+
+    def get_day(self, day_date: str) -> Optional[Dict[str, Any]]:
+        """Look up a single day (YYYY-MM-DD) with its counts, receipts and additional cash"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM days WHERE date = ?", (day_date,)).fetchone()
+            if row is None:
+                return None
+            day = dict(row)
+            day['cash_counts'] = {r['denomination']: r['count'] for r in self.conn.execute(
+                "SELECT denomination, count FROM denomination_counts WHERE date = ?", (day_date,))}
+            day['receipt_amounts'] = [r['amount'] for r in self.conn.execute(
+                "SELECT amount FROM receipts WHERE date = ? ORDER BY position", (day_date,))]
+            day['additional_cash_entries'] = [{'title': r['title'], 'amount': r['amount']} for r in self.conn.execute(
+                "SELECT title, amount FROM additional_cash WHERE date = ? ORDER BY position", (day_date,))]
+            return day
+
+    def days_between(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """Summary rows for every indexed day in [start_date, end_date]"""
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT * FROM days WHERE date BETWEEN ? AND ? ORDER BY date", (start_date, end_date))]
+
+def _to_iso(date_input: str) -> str:
+    """Accept DD/MM/YYYY or YYYY-MM-DD and return YYYY-MM-DD"""
+    if '/' in date_input:
+        return datetime.strptime(date_input, '%d/%m/%Y').strftime('%Y-%m-%d')
+    return datetime.strptime(date_input, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cash up report index")
+    parser.add_argument('--reports-dir', default=Config.REPORTS_DIR)
+    parser.add_argument('--database-url', default=Config.DATABASE_URL)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rescan', help="Index new or changed reports")
+    migrate_parser = subparsers.add_parser('migrate', help="Bulk-load the whole archive in parallel (resumable)")
+    migrate_parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: one per CPU)")
+    show_parser = subparsers.add_parser('show', help="Show an indexed day")
+    show_parser.add_argument('date', help="DD/MM/YYYY or YYYY-MM-DD")
+    search_parser = subparsers.add_parser('search', help="Search indexed reports (rescans first)")
+    search_parser.add_argument('query', nargs='+', help="e.g. £13.30, air hockey, short 2025-07, receipt:>50")
+    search_parser.add_argument('--limit', type=int, default=Config.SEARCH_RESULT_LIMIT)
+    args = parser.parse_args(argv)
+
+    index = ReportIndex(args.reports_dir, args.database_url)
+    try:
+        if args.command == 'rescan':
+            stats = index.rescan()
+            print(f"Scanned {stats['scanned']} files: {stats['parsed']} parsed, "
+                  f"{stats['unchanged']} unchanged, {stats['removed']} removed, {stats['skipped']} skipped")
+        elif args.command == 'migrate':
+            started = time.perf_counter()
+
+            def progress(stats):
+                elapsed = time.perf_counter() - started
+                print(f"  {stats['scanned']} files ({stats['scanned'] / elapsed if elapsed else 0:.0f} files/s)")
+
+            stats = index.migrate(args.workers, progress)
+            elapsed = time.perf_counter() - started
+            print(f"Migrated {stats['scanned']} files in {elapsed:.2f}s ({stats['scanned'] / elapsed if elapsed else 0:.0f} files/s): "
+                  f"{stats['parsed']} parsed, {stats['unchanged']} already migrated, "
+                  f"{stats['removed']} removed, {stats['skipped']} skipped")
+        elif args.command == 'show':
+            day = index.get_day(_to_iso(args.date))
+            if day is None:
+                print(f"No indexed report for {args.date}")
+                return 1
+            print(f"{day['date']}: {day['result']} ({day['difference']:+.2f}), "
+                  f"expected £{day['expected_takings']:.2f}, actual £{day['total_in_till']:.2f}")
+            for denomination, count in day['cash_counts'].items():
+                print(f"  {denomination}: {count}")
+            for i, amount in enumerate(day['receipt_amounts']):
+                print(f"  Receipt #{i+1}: £{amount:.2f}")
+            for entry in day['additional_cash_entries']:
+                print(f"  {entry['title']}: £{entry['amount']:.2f}")
+        elif args.command == 'search':
+            from report_search import SearchError, search
+            index.rescan()
+            try:
+                results = search(index, ' '.join(args.query), limit=args.limit)
+            except SearchError as e:
+                print(f"Error: {e}")
+                return 1
+            for day in results['days']:
+                print(f"{day['date']}: {day['result']} ({day['difference']:+.2f}), "
+                      f"expected £{day['expected_takings']:.2f}, actual £{day['total_in_till']:.2f}")
+            shown = len(results['days'])
+            print(f"{results['total']} matching days" + (f" (newest {shown} shown)" if results['total'] > shown else ""))
+    finally:
+        index.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
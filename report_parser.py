@@ -0,0 +1,183 @@
+"""
+Streaming parser for saved cash up text reports
+
+Handles both archive layouts: the older main.py reports with an
+"AIR HOCKEY MACHINE:" section and the newer ReportGenerator reports with
+"ADDITIONAL CASH IN:". Files are read line by line through mmap so a bulk
+import walks thousands of reports without holding more than one in memory.
+"""
+import mmap
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple
+
+LAYOUT_AIR_HOCKEY = 'air_hockey'
+LAYOUT_ADDITIONAL_CASH = 'additional_cash'
+
+REPORT_FILENAME = re.compile(r"^Cash_Up_(\d{2})-(\d{2})-(\d{4})\.txt$")
+
+_MONEY = r"£(-?[\d,]+\.\d{2})"
+_HEADER = re.compile(r"CASH UP - (\d{1,2})/(\d{1,2})/(\d{4})")
+_DENOMINATION_LINE = re.compile(r"^\s+(\d+p|£\d+): (\d+) × " + _MONEY)
+_TOTAL_CASH_LINE = re.compile(r"^\s+Total Cash: " + _MONEY)
+_RECEIPT_LINE = re.compile(r"^\s+Receipt #(\d+): " + _MONEY)
+_AIR_HOCKEY_LINE = re.compile(r"^\s+Air [Hh]ockey(?: earnings)?: " + _MONEY)
+_ENTRY_LINE = re.compile(r"^\s+(.+): " + _MONEY + r"$")
+_SUMMARY_LINES = {
+    'starting_float': re.compile(r"^\s+Starting Float: " + _MONEY),
+    'expected_takings': re.compile(r"^\s+Expected Takings: " + _MONEY),
+    'expected_total': re.compile(r"^\s+Expected Total: " + _MONEY),
+    'total_in_till': re.compile(r"^\s+Actual Total: " + _MONEY),
+}
+_RESULT_LINE = re.compile(r"^\s+Result: (OVER|SHORT) by " + _MONEY)
+_REMOVE_LINE = re.compile(r"^\s+(Remove|Add) " + _MONEY)
+
+@dataclass
+class ParsedReport:
+    """One saved cash up, as recovered from its text report"""
+    date: str
+    layout: str
+    path: Optional[str] = None
+    cash_counts: Dict[str, int] = field(default_factory=dict)
+    receipt_amounts: List[float] = field(default_factory=list)
+    additional_cash_entries: List[Dict[str, Any]] = field(default_factory=list)
+    total_cash: Optional[float] = None
+    starting_float: Optional[float] = None
+    expected_takings: Optional[float] = None
+    expected_total: Optional[float] = None
+    total_in_till: Optional[float] = None
+    difference: float = 0.0
+    amount_to_remove: Optional[float] = None
+    result: Optional[str] = None
+
+    @property
+    def total_receipts(self) -> float:
+        return round(sum(self.receipt_amounts), 2)
+
+    @property
+    def total_additional_cash(self) -> float:
+        return round(sum(entry['amount'] for entry in self.additional_cash_entries), 2)
+
+def _money(text: str) -> float:
+    return round(float(text.replace(',', '')), 2)
+
+def iter_file_lines(path: str) -> Iterator[str]:
+    """Yield decoded lines from a report file via a read-only memory map"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for raw_line in iter(mm.readline, b''):
+                yield raw_line.decode('utf-8', errors='replace')
+
+def detect_layout(line: str) -> Optional[str]:
+    """Return the layout implied by a section header or summary line, if any"""
+    stripped = line.strip()
+    if stripped.startswith('AIR HOCKEY MACHINE:') or '+ Air Hockey' in stripped:
+        return LAYOUT_AIR_HOCKEY
+    if stripped.startswith('ADDITIONAL CASH IN:'):
+        return LAYOUT_ADDITIONAL_CASH
+    return None
+
+def parse_lines(lines: Iterable[str], path: str = None) -> Optional[ParsedReport]:
+    """Parse one report from an iterable of lines, or return None if it isn't one"""
+    report = ParsedReport(date=None, layout=LAYOUT_ADDITIONAL_CASH, path=path)
+    section = None
+    for raw_line in lines:
+        line = raw_line.rstrip()
+        if not line or line.startswith('='):
+            continue
+        match = _HEADER.search(line)
+        if match and report.date is None:
+            day, month, year = (int(part) for part in match.groups())
+            report.date = f"{year:04d}-{month:02d}-{day:02d}"
+            continue
+        layout = detect_layout(line)
+        if layout is not None:
+            report.layout = layout
+        if not line.startswith(' '):
+            section = line.split(':')[0].strip()
+            continue
+
+        if section == 'CASH BREAKDOWN':
+            match = _DENOMINATION_LINE.match(line)
+            if match:
+                report.cash_counts[match.group(1)] = int(match.group(2))
+            else:
+                match = _TOTAL_CASH_LINE.match(line)
+                if match:
+                    report.total_cash = _money(match.group(1))
+                # Transitional reports listed air hockey takings inside the cash breakdown
+                match = _AIR_HOCKEY_LINE.match(line)
+                if match:
+                    report.layout = LAYOUT_AIR_HOCKEY
+                    report.additional_cash_entries.append({'title': 'Air Hockey',
+                                                           'amount': _money(match.group(1))})
+        elif section == 'RECEIPT BREAKDOWN':
+            match = _RECEIPT_LINE.match(line)
+            if match:
+                report.receipt_amounts.append(_money(match.group(2)))
+        elif section == 'AIR HOCKEY MACHINE':
+            match = _AIR_HOCKEY_LINE.match(line)
+            if match:
+                report.additional_cash_entries.append({'title': 'Air Hockey',
+                                                       'amount': _money(match.group(1))})
+        elif section == 'ADDITIONAL CASH IN':
+            match = _ENTRY_LINE.match(line)
+            if match and not line.strip().startswith('Total Additional Cash'):
+                report.additional_cash_entries.append({'title': match.group(1).strip(),
+                                                       'amount': _money(match.group(2))})
+        elif section == 'SUMMARY':
+            for key, pattern in _SUMMARY_LINES.items():
+                match = pattern.match(line)
+                if match:
+                    setattr(report, key, _money(match.group(1)))
+                    break
+            else:
+                match = _RESULT_LINE.match(line)
+                if match:
+                    report.result = match.group(1)
+                    amount = _money(match.group(2))
+                    report.difference = amount if match.group(1) == 'OVER' else -amount
+                elif 'EXACT BALANCE' in line:
+                    report.result = 'EXACT'
+                    report.difference = 0.0
+        elif section == 'BAGGING INSTRUCTIONS':
+            match = _REMOVE_LINE.match(line)
+            if match and report.amount_to_remove is None:
+                amount = _money(match.group(2))
+                report.amount_to_remove = amount if match.group(1) == 'Remove' else -amount
+
+    if report.date is None or report.result is None:
+        return None
+    return report
+
+def parse_report_text(text: str, path: str = None) -> Optional[ParsedReport]:
+    """Parse a report that is already in memory"""
+    return parse_lines(text.splitlines(), path)
+
+def parse_report_file(path: str) -> Optional[ParsedReport]:
+    """Parse a single report file"""
+    return parse_lines(iter_file_lines(path), path)
+
+def iter_report_files(reports_dir: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yield (path, stat) for every report file in Reports/YYYY/MM"""
+    if not os.path.isdir(reports_dir):
+        return
+    for year_entry in os.scandir(reports_dir):
+        if not (year_entry.is_dir() and year_entry.name.isdigit()):
+            continue
+        for month_entry in os.scandir(year_entry.path):
+            if not (month_entry.is_dir() and month_entry.name.isdigit()):
+                continue
+            for file_entry in os.scandir(month_entry.path):
+                if file_entry.is_file() and REPORT_FILENAME.match(file_entry.name):
+                    yield file_entry.path, file_entry.stat()
+
+def iter_reports(reports_dir: str) -> Iterator[ParsedReport]:
+    """Yield a ParsedReport for every parsable report under reports_dir, one at a time"""
+    for path, _ in iter_report_files(reports_dir):
+        report = parse_report_file(path)
+        if report is not None:
+            yield report
@@ -0,0 +1,166 @@
+"""
+Search over the report archive
+
+Queries run against the inverted index that ReportIndex keeps alongside the
+day tables, so every term is an indexed lookup however many reports exist.
+A query is a list of space-separated conditions, all of which must match:
+
+    vending               additional cash titles with a word starting "vending"
+    £13.30  13.30         a receipt or additional cash entry of exactly £13.30
+    receipt:10..20        a receipt between £10 and £20 (also cash_in, difference,
+    difference:<-5        takings, till, removed; with >, >=, <, <= or a..b)
+    over  short  exact    the day's result (also result:over)
+    monday                the weekday (also day:monday)
+    2025  2025-07  07/2025  14/07/2025  from:2025-06-01  to:2025-06-30
+"""
+import re
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from cash_up_core import to_pence
+from report_index import WEEKDAYS, ReportIndex, title_terms
+
+AMOUNT_FIELDS = ('receipt', 'cash_in', 'difference', 'takings', 'till', 'removed')
+RESULTS = ('over', 'short', 'exact')
+
+# Ranges of pence are inclusive; comparisons use this as their open end
+_MAX_PENCE = 2 ** 62
+_MONEY = r"-?£?\d+(?:\.\d{1,2})?"
+_AMOUNT = re.compile(r"^£?\d+\.\d{1,2}$|^£\d+$")
+_RANGE = re.compile(rf"^({_MONEY})\.\.({_MONEY})$")
+_COMPARISON = re.compile(rf"^(>=|<=|>|<)({_MONEY})$")
+_VALUE = re.compile(rf"^{_MONEY}$")
+# strptime's %Y also takes short and zero-padded years, which never match an indexed ISO date
+_DATES = tuple((re.compile(shape), pattern, fmt) for shape, pattern, fmt in (
+    (r"[1-9]\d{3}-\d{1,2}-\d{1,2}", '%Y-%m-%d', '%Y-%m-%d'), (r"\d{1,2}/\d{1,2}/[1-9]\d{3}", '%d/%m/%Y', '%Y-%m-%d'),
+    (r"[1-9]\d{3}-\d{1,2}", '%Y-%m', '%Y-%m'), (r"\d{1,2}/[1-9]\d{3}", '%m/%Y', '%Y-%m'), (r"[1-9]\d{3}", '%Y', '%Y')))
+
+class SearchError(ValueError):
+    """Raised for a query that cannot be understood"""
+
+def _pence(text: str) -> int:
+    value = to_pence(text.replace('£', '').lstrip('-'))
+    return -value if text.startswith('-') else value
+
+def parse_amount(text: str) -> Tuple[int, int]:
+    """Turn '13.30', '10..20', '>50' or '<=-5' into an inclusive pence range"""
+    match = _RANGE.match(text)
+    if match:
+        low, high = sorted((_pence(match.group(1)), _pence(match.group(2))))
+        return low, high
+    match = _COMPARISON.match(text)
+    if match:
+        operator, value = match.group(1), _pence(match.group(2))
+        return {
+            '>': (value + 1, _MAX_PENCE),
+            '>=': (value, _MAX_PENCE),
+            '<': (-_MAX_PENCE, value - 1),
+            '<=': (-_MAX_PENCE, value)
+        }[operator]
+    if _VALUE.match(text):
+        value = _pence(text)
+        return value, value
+    raise SearchError(f"Cannot read amount '{text}'")
+
+def parse_date(text: str) -> Optional[Tuple[str, str]]:
+    """Turn a year, month or day (ISO or UK order) into an inclusive ISO date range"""
+    for shape, pattern, fmt in _DATES:
+        if not shape.fullmatch(text):
+            continue
+        try:
+            prefix = datetime.strptime(text, pattern).strftime(fmt)
+        except ValueError:
+            continue
+        return prefix, prefix + '\uffff'
+    return None
+
+def parse_query(query: str) -> List[Tuple]:
+    """Split a query into ('term', t), ('prefix', p), ('amount', fields, low, high) and ('date', start, end)"""
+    conditions = []
+    for token in query.lower().split():
+        field, _, value = token.partition(':')
+        if value and field in AMOUNT_FIELDS:
+            conditions.append(('amount', (field,)) + parse_amount(value))
+        elif value and field == 'result':
+            if value not in RESULTS:
+                raise SearchError(f"Unknown result '{value}', expected one of: {', '.join(RESULTS)}")
+            conditions.append(('term', f"result:{value}"))
+        elif value and field == 'day':
+            if value not in WEEKDAYS:
+                raise SearchError(f"Unknown weekday '{value}'")
+            conditions.append(('term', f"day:{value}"))
+        elif value and field in ('from', 'to'):
+            date_range = parse_date(value)
+            if date_range is None:
+                raise SearchError(f"Cannot read date '{value}'")
+            conditions.append(('date', date_range[0], '\uffff') if field == 'from' else ('date', '', date_range[1]))
+        elif value:
+            raise SearchError(f"Unknown search field '{field}'")
+        elif token in RESULTS:
+            conditions.append(('term', f"result:{token}"))
+        elif token in WEEKDAYS:
+            conditions.append(('term', f"day:{token}"))
+        elif _AMOUNT.match(token):
+            conditions.append(('amount', ('receipt', 'cash_in')) + parse_amount(token))
+        elif parse_date(token) is not None:
+            conditions.append(('date',) + parse_date(token))
+        else:
+            conditions.extend(('prefix', word) for word in title_terms(token))
+    return conditions
+
+def _matching_dates(index: ReportIndex, condition: Tuple, start: str, end: str) -> set:
+    kind = condition[0]
+    if kind == 'term':
+        sql, params = "SELECT date FROM search_terms WHERE term = ?", (condition[1],)
+    elif kind == 'prefix':
+        sql = ("SELECT DISTINCT date FROM search_terms "
+               "WHERE term >= ? AND term < ? AND instr(term, ':') = 0")
+        params = (condition[1], condition[1] + '\uffff')
+    else:
+        fields, low, high = condition[1:]
+        sql = (f"SELECT DISTINCT date FROM search_amounts WHERE field IN ({', '.join('?' for _ in fields)}) "
+               f"AND pence BETWEEN ? AND ?")
+        params = fields + (low, high)
+    return {row[0] for row in index.conn.execute(sql + " AND date BETWEEN ? AND ?", params + (start, end))}
+
+def search(index: ReportIndex, query: str, limit: int = 100) -> Dict[str, Any]:
+    """Days matching every condition in query, newest first"""
+    conditions = parse_query(query)
+    if not conditions:
+        raise SearchError("Enter something to search for")
+    start, end = '', '\uffff'
+    for condition in conditions:
+        if condition[0] == 'date':
+            start, end = max(start, condition[1]), min(end, condition[2])
+
+    with index.lock:
+        candidates = None
+        for condition in conditions:
+            if condition[0] == 'date':
+                continue
+            dates = _matching_dates(index, condition, start, end)
+            candidates = dates if candidates is None else candidates & dates
+            if not candidates:
+                break
+
+        if candidates is None:
+            total = index.conn.execute("SELECT COUNT(*) FROM days WHERE date BETWEEN ? AND ?",
+                                       (start, end)).fetchone()[0]
+            rows = index.conn.execute("SELECT * FROM days WHERE date BETWEEN ? AND ? ORDER BY date DESC LIMIT ?",
+                                      (start, end, limit)).fetchall()
+        else:
+            matched = sorted(candidates, reverse=True)
+            total = len(matched)
+            rows = []
+            page = matched[:limit]
+            for i in range(0, len(page), 500):
+                chunk = page[i:i + 500]
+                rows.extend(index.conn.execute(
+                    f"SELECT * FROM days WHERE date IN ({', '.join('?' for _ in chunk)})", chunk))
+            rows.sort(key=lambda row: row['date'], reverse=True)
+
+    return {
+        'query': query,
+        'total': total,
+        'days': [dict(row) for row in rows]
+    }
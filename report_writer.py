@@ -0,0 +1,235 @@
+"""
+Background report writer
+
+Saving a report hands the rendered text to a bounded queue and returns a
+WriteJob straight away; worker threads do the directory creation and atomic
+write. The web and desktop front ends poll the job instead of waiting on the
+disk.
+
+With a status_dir every job's status is also kept in status_dir/<job id>.json,
+so a pre-forked server worker can answer a poll for a job another worker
+queued.
+"""
+import itertools
+import json
+import os
+import re
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, Callable
+
+from cash_up_core import ReportGenerator, atomic_write
+from date_locks import VersionConflict
+
+_JOB_ID = re.compile(r'^\d+-\d+-\d+$')
+
+class WriterBusyError(RuntimeError):
+    """Raised when the write queue stays full for longer than the submit timeout"""
+
+class WriteJob:
+    """Handle for one queued report write"""
+
+    def __init__(self, job_id: str, date_input: str, report_content: str, analysis: Dict[str, Any] = None,
+                 inputs: Dict[str, Any] = None, expected_version: int = None):
+        self.id = job_id
+        self.date_input = date_input
+        self.report_content = report_content
+        self.analysis = analysis
+        self.inputs = inputs
+        self.expected_version = expected_version
+        self.state = 'queued'
+        self.path = None
+        self.version = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = Future()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def status(self) -> Dict[str, Any]:
+        """JSON-friendly snapshot of the job for polling"""
+        return {
+            'id': self.id,
+            'date': self.date_input,
+            'state': self.state,
+            'path': self.path,
+            'version': self.version,
+            'error': self.error
+        }
+
+class ReportWriter:
+    """Writes reports on worker threads from a bounded queue"""
+
+    def __init__(self, report_generator: ReportGenerator, workers: int = 1, max_queue: int = 32,
+                 fsync: bool = False, keep_finished: int = 200, on_saved: Callable[[WriteJob], None] = None,
+                 status_dir: str = None, status_ttl: float = 86400,
+                 on_finished: Callable[[WriteJob], None] = None):
+        self.report_generator = report_generator
+        self.on_saved = on_saved
+        # Called for every job once it is done, conflicted or failed (on_saved only after a write)
+        self.on_finished = on_finished
+        self.status_dir = status_dir
+        self.status_ttl = status_ttl
+        self.workers = max(1, workers)
+        self.fsync = fsync
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"report-writer-{i+1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, date_input: str, report_content: str, analysis: Dict[str, Any] = None,
+               inputs: Dict[str, Any] = None, expected_version: int = None, timeout: float = 5.0) -> WriteJob:
+        """Queue a report for writing and return its job handle
+        
+        analysis and inputs (cash_counts, receipt_amounts, additional_cash_entries) are
+        passed through to the on_saved callback once the file is written. With
+        expected_version the job ends in state 'conflict' instead of overwriting a
+        report that has been saved again since that version.
+        """
+        self._ensure_started()
+        job = WriteJob(f"{int(time.time())}-{os.getpid()}-{next(self._ids)}", date_input, report_content,
+                       analysis, inputs, expected_version)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._publish(job)
+        try:
+            self._queue.put(job, timeout=timeout)
+        except queue.Full:
+            with self._jobs_lock:
+                self._jobs.pop(job.id, None)
+            self._unpublish(job.id)
+            raise WriterBusyError("Report writer queue is full, please try again")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[WriteJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job queued by this process, or by any process sharing status_dir"""
+        job = self.get_job(job_id)
+        if job is not None:
+            return job.status()
+        path = self._status_path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _status_path(self, job_id: str) -> Optional[str]:
+        if self.status_dir is None or not _JOB_ID.match(job_id):
+            return None
+        return os.path.join(self.status_dir, f"{job_id}.json")
+
+    def _publish(self, job: WriteJob):
+        path = self._status_path(job.id)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.status_dir, exist_ok=True)
+            atomic_write(path, json.dumps(job.status()))
+        except OSError as e:
+            print(f"Could not record save status for {job.id}: {e}")
+
+    def _unpublish(self, job_id: str):
+        path = self._status_path(job_id)
+        if path is not None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _expire_statuses(self):
+        # Status files outlive the worker that wrote them; drop them once nobody will poll
+        cutoff = time.time() - self.status_ttl
+        try:
+            entries = list(os.scandir(self.status_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _prune(self):
+        # Keep only the most recent finished jobs around for polling
+        finished = [job_id for job_id, job in self._jobs.items() if job.done()]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            job.state = 'writing'
+            job.started_at = time.time()
+            state = 'failed'
+            try:
+                result, job.version = self.report_generator.save_report(
+                    job.date_input, job.report_content, fsync=self.fsync, expected_version=job.expected_version)
+                state = 'done'
+            except VersionConflict as e:
+                state, result, job.version = 'conflict', str(e), e.version
+            except Exception as e:
+                result = str(e)
+            job.report_content = None
+            job.finished_at = time.time()
+            success = state == 'done'
+            if success:
+                job.state, job.path = state, result
+                if self.on_saved is not None:
+                    try:
+                        self.on_saved(job)
+                    except Exception as e:
+                        # The report is on disk; a failed follow-up must not mark the save as failed
+                        print(f"Post-save hook error for {job.date_input}: {e}")
+            else:
+                job.state, job.error = state, result
+            if self.on_finished is not None:
+                try:
+                    self.on_finished(job)
+                except Exception as e:
+                    print(f"Save completion hook error for {job.date_input}: {e}")
+            if self.status_dir is not None:
+                self._publish(job)
+                self._expire_statuses()
+            job.future.set_result((success, result))
+            self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued write has finished"""
+        self._queue.join()
+
+    def close(self):
+        """Finish queued writes and stop the workers"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
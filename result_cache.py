@@ -0,0 +1,73 @@
+"""
+Content-addressed cache of cash up calculation results
+
+Entries are keyed on a hash of the normalised inputs, so the same till
+submitted twice (calculate, then save) maps to the same token. Eviction is
+least-recently-used with a time-to-live on top.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from cash_up_core import to_pence
+
+def normalise_inputs(date_input: str, cash_counts: List[int], receipt_amounts: List[float],
+                     additional_cash_entries: List[Dict[str, Any]], expected_takings: float,
+                     default_float: float) -> Dict[str, Any]:
+    """Reduce a cash up's inputs to a canonical, JSON-serialisable form"""
+    return {
+        'date': date_input,
+        'cash_counts': [int(count) for count in cash_counts],
+        'receipts': [to_pence(amount) for amount in receipt_amounts],
+        'additional_cash': [[entry['title'], to_pence(entry['amount'])] for entry in additional_cash_entries],
+        'expected_takings': to_pence(expected_takings),
+        'default_float': to_pence(default_float)
+    }
+
+def make_key(normalised_inputs: Dict[str, Any]) -> str:
+    """Hash normalised inputs into a cache token"""
+    payload = json.dumps(normalised_inputs, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """Thread-safe LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key, or None if missing or expired"""
+        if not key:
+            return None
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, value = item
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store value under key, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Production server for the Cash Up web app
+
+app.py's own entry point is the single-process debug server with the
+reloader. This serves the same app with threaded request handling, and on
+platforms with fork() pre-forks Config.SERVE_WORKERS processes that share one
+listening socket. The app module, calculator tables and compiled templates are
+loaded once in the parent before forking so every worker starts warm.
+
+Each worker keeps its own result cache, metrics and report writer. Save job
+status is shared through Config.REPORT_STATUS_DIR, so a poll may land on any
+worker. /metrics is per worker too: a scrape reports the worker that served
+it (cashup_worker_pid), so scrape each worker or sum the series by pid.
+"""
+import os
+import signal
+import socket
+import sys
+import time
+
+from config import Config
+
+def warm_up(app_module):
+    """Load the shared read-only state: templates, calculator tables, solver"""
+    app = app_module.app
+    templates_dir = os.path.join(app.root_path, app.template_folder)
+    for name in sorted(os.listdir(templates_dir)):
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+    calculator = app_module.calculator
+    counts = [5] * len(calculator.denominations)
+    analysis = calculator.calculate_float_analysis(counts, [12.5], [], 50.0)
+    calculator.generate_bagging_instructions(analysis, counts)
+
+def _serve_one(app, host: str, port: int, fd: int = None):
+    from werkzeug.serving import make_server
+    server = make_server(host, port, app, threaded=True, fd=fd)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+def _run_worker(app_module, host: str, port: int, sock: socket.socket):
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    app_module.reset_after_fork()
+    try:
+        _serve_one(app_module.app, host, port, fd=sock.fileno())
+    finally:
+        # Let queued report writes reach the disk before the worker exits
+        app_module.report_writer.close()
+        os._exit(0)
+
+def serve(host: str = None, port: int = None, workers: int = None):
+    """Serve the web app until interrupted"""
+    host = host or Config.SERVE_HOST
+    port = port or Config.SERVE_PORT
+    workers = max(1, workers or Config.SERVE_WORKERS)
+
+    import app as app_module
+    warm_up(app_module)
+
+    if workers == 1 or not hasattr(os, 'fork'):
+        print(f"Serving on http://{host}:{port} (threaded, 1 process)")
+        try:
+            _serve_one(app_module.app, host, port)
+        finally:
+            app_module.report_writer.close()
+        return
+
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app_module, host, port, sock)
+        children.add(pid)
+
+    print(f"Serving on http://{host}:{port} ({workers} worker processes, threaded)")
+    for _ in range(workers):
+        spawn()
+
+    stopping = False
+    previous_term = signal.signal(signal.SIGTERM, _terminate)
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except KeyboardInterrupt:
+                stopping = True
+                for pid in children:
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+                continue
+            except ChildProcessError:
+                break
+            children.discard(pid)
+            if not stopping:
+                print(f"Worker {pid} exited (status {status}), restarting", file=sys.stderr)
+                time.sleep(1)
+                spawn()
+    finally:
+        signal.signal(signal.SIGTERM, previous_term)
+        sock.close()
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the Cash Up web app")
+    parser.add_argument('--host', default=Config.SERVE_HOST)
+    parser.add_argument('--port', type=int, default=Config.SERVE_PORT)
+    parser.add_argument('--workers', type=int, default=Config.SERVE_WORKERS,
+                        help="worker processes (1 = a single threaded process)")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
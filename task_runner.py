@@ -0,0 +1,122 @@
+"""
+Run slow work off the Tk main loop
+
+Tasks run one at a time on a worker thread. Progress, results and errors are
+put on a queue that the UI thread drains with root.after, so every callback
+runs on the Tk thread and the window never blocks on disk or database I/O.
+Cancellation is cooperative: the task calls check() (or report()) between
+steps and stops with TaskCancelled once cancel() has been called.
+"""
+import itertools
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+class TaskCancelled(Exception):
+    """Raised inside a task once it has been cancelled"""
+
+class Task:
+    """Handle for one background task"""
+
+    def __init__(self, task_id: int, name: str, func: Callable[['Task'], Any], on_done: Callable[[Any], None] = None,
+                 on_error: Callable[[Exception], None] = None, on_progress: Callable[[Optional[float], str], None] = None,
+                 on_cancelled: Callable[[], None] = None):
+        self.id = task_id
+        self.name = name
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancelled = on_cancelled
+        self._cancel_event = threading.Event()
+        self._events = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check(self):
+        """Stop here if the task has been cancelled"""
+        if self._cancel_event.is_set():
+            raise TaskCancelled(self.name)
+
+    def report(self, fraction: Optional[float] = None, message: str = ''):
+        """Post progress (0-1, or None when the total is unknown) to the UI thread"""
+        self.check()
+        if self.on_progress is not None:
+            self._events.put((self, 'progress', (fraction, message)))
+
+class TaskRunner:
+    """Single worker thread whose results are delivered on the Tk thread"""
+
+    def __init__(self, root, poll_ms: int = 50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._tasks = queue.Queue()
+        self._events = queue.Queue()
+        self._ids = itertools.count(1)
+        self._pending = 0
+        self._poll_job = None
+        self._thread = threading.Thread(target=self._run, name="desktop-tasks", daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self) -> bool:
+        return self._pending > 0
+
+    def submit(self, name: str, func: Callable[[Task], Any], **callbacks) -> Task:
+        """Queue func(task) on the worker; on_done/on_error/on_progress/on_cancelled run on the Tk thread"""
+        task = Task(next(self._ids), name, func, **callbacks)
+        task._events = self._events
+        self._pending += 1
+        self._tasks.put(task)
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+        return task
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            try:
+                task.check()
+                result = task.func(task)
+                self._events.put((task, 'done', result))
+            except TaskCancelled:
+                self._events.put((task, 'cancelled', None))
+            except Exception as e:
+                self._events.put((task, 'error', e))
+
+    def _poll(self):
+        self._poll_job = None
+        try:
+            while True:
+                try:
+                    task, kind, payload = self._events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind != 'progress':
+                    self._pending -= 1
+                self._dispatch(task, kind, payload)
+        finally:
+            # Only keep polling while there is something to wait for
+            if self._pending > 0:
+                self._poll_job = self.root.after(self.poll_ms, self._poll)
+
+    @staticmethod
+    def _dispatch(task: Task, kind: str, payload):
+        if kind == 'progress' and task.on_progress is not None:
+            task.on_progress(*payload)
+        elif kind == 'done' and task.on_done is not None:
+            task.on_done(payload)
+        elif kind == 'error' and task.on_error is not None:
+            task.on_error(payload)
+        elif kind == 'cancelled' and task.on_cancelled is not None:
+            task.on_cancelled()
+
+    def close(self):
+        self._tasks.put(None)
@@ -0,0 +1,42 @@
+"""The vectorized batch calculator must agree with the scalar core to the penny"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip('numpy')
+
+from cash_up_batch import BatchCashUpCalculator
+from cash_up_core import CashUpCalculator, to_pence
+
+FIGURES = ('total_cash', 'total_receipts', 'total_additional_cash', 'total_in_till',
+           'expected_takings', 'expected_total', 'difference', 'amount_to_remove')
+
+HALF_PENNY_TILLS = [
+    {'cash_counts': [3, 0, 1, 2, 0, 1, 4, 0, 1, 2, 1, 0], 'receipt_amounts': [0.005, 1.005, 2.675],
+     'additional_cash_entries': [{'title': 'Air Hockey', 'amount': 0.125}], 'expected_takings': 50.005},
+    {'cash_counts': [0] * 11 + [4], 'receipt_amounts': [0.99, 0.98, 0.7],
+     'additional_cash_entries': [], 'expected_takings': 2.67},
+    {'cash_counts': [1] * 12, 'receipt_amounts': [0.015, 0.025, 0.035, 0.045],
+     'additional_cash_entries': [{'title': 'Jukebox', 'amount': 10.005}, {'title': 'Donations', 'amount': 0.335}],
+     'expected_takings': 0.045},
+    {'cash_counts': [0] * 12, 'receipt_amounts': [], 'additional_cash_entries': [], 'expected_takings': 0},
+]
+
+def test_to_pence_matches_scalar_half_up():
+    amounts = [0.005, 0.015, 0.125, 1.005, 2.675, 10.005, 0.335, -0.005, -1.005, 123456.785, 0.1 + 0.2]
+    assert BatchCashUpCalculator.to_pence(amounts).tolist() == [to_pence(amount) for amount in amounts]
+
+def test_calculate_tills_matches_calculate_float_analysis():
+    calculator = CashUpCalculator()
+    batch = BatchCashUpCalculator(calculator)
+    rows = batch.rows(batch.calculate_tills(HALF_PENNY_TILLS))
+    for till, row in zip(HALF_PENNY_TILLS, rows):
+        analysis = calculator.calculate_float_analysis(till['cash_counts'], till['receipt_amounts'],
+                                                       till['additional_cash_entries'], till['expected_takings'])
+        assert {figure: to_pence(row[figure]) for figure in FIGURES} == \
+            {figure: analysis['pence'][figure] for figure in FIGURES}
+        assert (row['is_over'], row['is_short'], row['is_exact']) == \
+            (analysis['is_over'], analysis['is_short'], analysis['is_exact'])